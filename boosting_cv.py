@@ -0,0 +1,99 @@
+"""
+Cross-validation of boosting models with per-fold early stopping.
+
+Boosting grids list `n_estimators` as a separate axis ([200, 300, 500]), so a plain CV
+search trains every fold once per value although the smaller models are prefixes of the
+largest one. Here each fold is trained once, up to the largest candidate, and the
+validation error is read off after every boosting round:
+
+ - Gradient Boosting grows in chunks with warm_start and is scored with staged_predict;
+ - XGBoost / LightGBM train with the fold's validation split as eval set and
+   early_stopping_rounds / the early_stopping callback.
+
+Training stops once the validation error has not improved for EARLY_STOPPING_ROUNDS
+rounds. Each candidate n_estimators is scored with the first n rounds, or with every round
+trained when the fold stopped before n. One fold fit therefore covers all candidate values,
+and the validation predictions of each candidate are kept as out-of-fold predictions.
+"""
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.base import clone
+
+from warm_start import warm_kind
+
+STAGED_KINDS = ('sklearn_boosting', 'xgboost', 'lightgbm')
+EARLY_STOPPING_ROUNDS = 50
+
+
+def supports_staged_cv(estimator, params, scoring='neg_mean_squared_error'):
+    """True if `params` has an n_estimators axis that staged CV can cover in one fit per fold"""
+    return (scoring == 'neg_mean_squared_error' and warm_kind(estimator) in STAGED_KINDS
+            and len(params.get('n_estimators', ())) > 1)
+
+
+def _rows(data, idx):
+    return data.iloc[idx] if hasattr(data, 'iloc') else data[idx]
+
+
+def _sklearn_curve(model, X_tr, y_tr, X_val, y_val, n_values, patience):
+    curve, predictions, n_max = [], {}, max(n_values)
+    model.set_params(warm_start=True)
+    while len(curve) < n_max:
+        model.set_params(n_estimators=min(n_max, len(curve) + patience))
+        model.fit(X_tr, y_tr)
+        done = len(curve)
+        for i, pred in enumerate(model.staged_predict(X_val)):
+            if i >= done:
+                curve.append(np.mean((pred - y_val) ** 2))
+                if i + 1 in n_values:
+                    predictions[i + 1] = pred
+        if len(curve) - 1 - int(np.argmin(curve)) >= patience:
+            break
+    for n in n_values:
+        predictions.setdefault(n, pred)
+    return curve, predictions
+
+
+def _fold_curve(estimator, X, y, train_idx, val_idx, n_values, patience):
+    """Validation MSE after each boosting round of one fold (shorter if stopped early),
+    and the validation predictions of each candidate n_estimators
+    """
+    X_tr, y_tr = _rows(X, train_idx), np.asarray(_rows(y, train_idx), dtype=float)
+    X_val, y_val = _rows(X, val_idx), np.asarray(_rows(y, val_idx), dtype=float)
+    model = clone(estimator)
+    kind = warm_kind(model)
+    n_max = max(n_values)
+    if kind == 'sklearn_boosting':
+        return _sklearn_curve(model, X_tr, y_tr, X_val, y_val, n_values, patience)
+    if kind == 'xgboost':
+        model.set_params(n_estimators=n_max, early_stopping_rounds=patience, eval_metric='rmse')
+        model.fit(X_tr, y_tr, eval_set=[(X_val, y_val)], verbose=False)
+        curve = list(np.square(model.evals_result()['validation_0']['rmse']))
+        return curve, {n: model.predict(X_val, iteration_range=(0, min(n, len(curve)))) for n in n_values}
+    import lightgbm as lgb
+    history = {}
+    model.set_params(n_estimators=n_max)
+    model.fit(X_tr, y_tr, eval_set=[(X_val, y_val)], eval_metric='l2',
+              callbacks=[lgb.early_stopping(patience, first_metric_only=True, verbose=False),
+                         lgb.record_evaluation(history)])
+    curve = list(history['valid_0']['l2'])
+    return curve, {n: model.predict(X_val, num_iteration=min(n, len(curve))) for n in n_values}
+
+
+def staged_cv_scores(estimator, n_values, X, y, cv, n_jobs=1, patience=EARLY_STOPPING_ROUNDS):
+    """Mean negative MSE over the CV folds for each n_estimators in n_values.
+
+    Returns (scores, oof): scores[i] belongs to n_values[i] and oof[i] holds its out-of-fold
+    predictions (NaN for rows in no validation fold).
+    """
+    folds = list(cv.split(X, y))
+    results = Parallel(n_jobs=n_jobs)(
+        delayed(_fold_curve)(estimator, X, y, train_idx, val_idx, n_values, patience)
+        for train_idx, val_idx in folds
+    )
+    scores = [-np.mean([curve[min(n, len(curve)) - 1] for curve, _ in results]) for n in n_values]
+    oof = np.full((len(n_values), len(y)), np.nan)
+    for (_, val_idx), (_, predictions) in zip(folds, results):
+        for i, n in enumerate(n_values):
+            oof[i, val_idx] = predictions[n]
+    return np.array(scores), oof
@@ -0,0 +1,119 @@
+"""
+Date dimension: calendar and holiday columns precomputed for a contiguous span of days.
+
+Each column (calendar fields, ISO week, quarter boundaries, cyclical encodings and the
+holiday flag joined from the app's `holidays` table) is one NumPy array indexed by the day
+offset from the start of the span, so feature builders look dates up with a subtraction
+and a gather instead of computing calendar fields row by row. The span grows on demand
+when dates outside it are requested (e.g. a forecast horizon).
+
+    with sqlite3.connect(DB_PATH) as conn:
+        calendar = DateDimension.from_db(conn, '2025-01-01', '2025-12-31')
+    calendar.fields(future_dates)['holiday_flag']
+"""
+import sqlite3
+
+import numpy as np
+
+HOLIDAYS_TABLE = 'holidays'
+# Periods of the sin/cos encodings; `week_*` is kept as an alias of `week_of_year_*`
+CYCLICAL_PERIODS = {'month': 12, 'day': 31, 'weekday': 7, 'quarter': 4, 'week_of_year': 52}
+
+
+def calendar_fields(dates):
+    """Vectorized calendar fields for an array of dates (pandas .dt semantics, ISO weeks)"""
+    d = np.asarray(dates, dtype='datetime64[D]')
+    months = d.astype('datetime64[M]')
+    years = d.astype('datetime64[Y]')
+    month = months.astype(np.int64) % 12 + 1
+    day = (d - months).astype(np.int64) + 1
+    weekday = (d.astype(np.int64) + 3) % 7  # 1970-01-01 was a Thursday
+    is_month_end = (d + 1).astype('datetime64[M]') != months
+    # ISO week: the week (Mon-Sun) belongs to the year of its Thursday
+    thursday = d - weekday + 3
+    iso_week = (thursday - thursday.astype('datetime64[Y]')).astype(np.int64) // 7 + 1
+    return {
+        'year': years.astype(np.int64) + 1970,
+        'month': month,
+        'day': day,
+        'quarter': (month - 1) // 3 + 1,
+        'weekday': weekday,
+        'week_of_year': iso_week,
+        'day_of_year': (d - years).astype(np.int64) + 1,
+        'is_weekend': (weekday >= 5).astype(np.int64),
+        'is_month_start': (day == 1).astype(np.int64),
+        'is_month_end': is_month_end.astype(np.int64),
+        'is_quarter_start': ((day == 1) & (month % 3 == 1)).astype(np.int64),
+        'is_quarter_end': (is_month_end & (month % 3 == 0)).astype(np.int64),
+    }
+
+
+
+def load_holidays(conn, table=HOLIDAYS_TABLE):
+    """Holiday dates from the app DB as datetime64[D]; empty if the table is missing"""
+    try:
+        rows = conn.execute(f"SELECT holiday_date FROM {table}").fetchall()
+    except sqlite3.Error as e:
+        print(f"No holiday table available ({e}); treating all days as non-holidays")
+        return np.array([], dtype='datetime64[D]')
+    dates = [str(r[0])[:10] for r in rows if r[0]]
+    return np.unique(np.array(dates, dtype='datetime64[D]'))
+
+
+class DateDimension:
+    """Per-day calendar/holiday columns for the span [start, end]"""
+
+    def __init__(self, start, end, holidays=None):
+        self.holidays = (np.array([], dtype='datetime64[D]') if holidays is None
+                         else np.unique(np.asarray(holidays, dtype='datetime64[D]')))
+        self._build(np.datetime64(start, 'D'), np.datetime64(end, 'D'))
+
+    @classmethod
+    def from_db(cls, conn, start, end, table=HOLIDAYS_TABLE):
+        return cls(start, end, load_holidays(conn, table))
+
+    @classmethod
+    def for_dates(cls, dates, holidays=None):
+        """Dimension covering the span of `dates`"""
+        d = np.asarray(dates, dtype='datetime64[D]')
+        if len(d) == 0:
+            d = np.array(['1970-01-01'], dtype='datetime64[D]')
+        return cls(d.min(), d.max(), holidays)
+
+    def _build(self, start, end):
+        self.start, self.end = start, end
+        days = np.arange(start, end + 1, dtype='datetime64[D]')
+        cols = calendar_fields(days)
+        for field, period in CYCLICAL_PERIODS.items():
+            angle = 2 * np.pi * cols[field] / period
+            cols[f'{field}_sin'] = np.sin(angle)
+            cols[f'{field}_cos'] = np.cos(angle)
+        cols['week_sin'] = cols['week_of_year_sin']
+        cols['week_cos'] = cols['week_of_year_cos']
+        cols['holiday_flag'] = np.isin(days, self.holidays).astype(np.int64)
+        self._cols = cols
+
+    def __len__(self):
+        return int((self.end - self.start).astype(np.int64)) + 1
+
+    @property
+    def names(self):
+        return list(self._cols)
+
+    def offsets(self, dates):
+        """Day offsets of `dates` into the span, extending the span if needed"""
+        d = np.asarray(dates, dtype='datetime64[D]')
+        if len(d) and (d.min() < self.start or d.max() > self.end):
+            self._build(min(d.min(), self.start), max(d.max(), self.end))
+        return (d - self.start).astype(np.int64)
+
+    def column(self, name, dates=None):
+        """Column `name` over the whole span, or gathered at `dates`"""
+        if dates is None:
+            return self._cols[name]
+        return self._cols[name][self.offsets(dates)]
+
+    def fields(self, dates, names=None):
+        """{name: array} for `dates` (all columns unless `names` is given)"""
+        idx = self.offsets(dates)
+        return {name: self._cols[name][idx] for name in (names or self._cols)}
@@ -0,0 +1,87 @@
+"""
+Direct multi-horizon forecasting: all `horizon` days from one origin row in one predict.
+
+The recursive forecast in predict_future_sales() calls the model once per day and feeds
+each prediction back into the features of the next. The direct forecaster learns
+y[t+1..t+H] from the feature row of day t (the analyzer's history-convention row, which
+only uses sales up to day t) instead, so a forecast needs only the last known row:
+
+ - 'multi_output': one estimator fit on the (n, H) target matrix. Used by default when the
+   estimator supports multi-output targets natively (forests, Ridge, MLP, ...);
+ - 'per_horizon':  a stack of H clones, model h fit on the targets shifted by h. Used for
+   single-output estimators (SVR, boosting, ...). The H predicts are independent, so
+   nothing waits on a previous prediction.
+
+Rows whose targets run past the end of the history are dropped per horizon.
+"""
+import numpy as np
+from sklearn.base import clone
+
+STRATEGIES = ('auto', 'multi_output', 'per_horizon')
+
+
+def shifted_targets(y, horizon):
+    """(n, horizon) matrix with column h-1 = y shifted back by h (NaN past the end)"""
+    y = np.asarray(y, dtype=float)
+    out = np.full((len(y), horizon), np.nan)
+    for h in range(1, horizon + 1):
+        out[:len(y) - h, h - 1] = y[h:]
+    return out
+
+
+def supports_multi_output(estimator):
+    try:
+        from sklearn.utils import get_tags
+        return bool(get_tags(estimator).target_tags.multi_output)
+    except ImportError:  # scikit-learn < 1.6
+        return bool(estimator._get_tags().get('multioutput', False))
+    except Exception:
+        return False
+
+
+class DirectForecaster:
+    """Multi-horizon forecaster built from a (tuned) single-step estimator.
+
+        forecaster = DirectForecaster(model, horizon=30, scaler=StandardScaler()).fit(X, y)
+        forecaster.predict(X[-1:])  # (1, 30): the next 30 days after the last row
+    """
+
+    def __init__(self, estimator, horizon=30, strategy='auto', scaler=None):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown strategy {strategy!r}; expected one of {STRATEGIES}")
+        self.estimator = estimator
+        self.horizon = horizon
+        self.strategy = strategy
+        self.scaler = scaler
+
+    def fit(self, X, y):
+        X = np.asarray(X, dtype=float)
+        Y = shifted_targets(y, self.horizon)
+        if self.scaler is not None:
+            self.scaler_ = clone(self.scaler).fit(X)
+            X = self.scaler_.transform(X)
+        else:
+            self.scaler_ = None
+        self.strategy_ = self.strategy
+        if self.strategy_ == 'auto':
+            self.strategy_ = 'multi_output' if supports_multi_output(self.estimator) else 'per_horizon'
+        if self.strategy_ == 'multi_output':
+            rows = np.isfinite(Y).all(axis=1)
+            if not rows.any():
+                raise ValueError(f"Need more than {self.horizon} rows to fit a {self.horizon}-day forecaster")
+            self.models_ = [clone(self.estimator).fit(X[rows], Y[rows])]
+        else:
+            self.models_ = []
+            for h in range(self.horizon):
+                rows = np.isfinite(Y[:, h])
+                self.models_.append(clone(self.estimator).fit(X[rows], Y[rows, h]))
+        return self
+
+    def predict(self, X):
+        """(n_rows, horizon) forecasts, one row per origin row of X"""
+        X = np.asarray(X, dtype=float)
+        if self.scaler_ is not None:
+            X = self.scaler_.transform(X)
+        if self.strategy_ == 'multi_output':
+            return np.asarray(self.models_[0].predict(X), dtype=float).reshape(len(X), self.horizon)
+        return np.column_stack([model.predict(X) for model in self.models_]).astype(float)
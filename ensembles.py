@@ -0,0 +1,78 @@
+"""
+Ensembles built from the prediction matrix of the tuned model families.
+
+The searches in model_search.py record each family's out-of-fold (OOF) predictions on the
+training rows, and train_models keeps its predictions on the test rows. Stacked as
+(n_models x n_samples) matrices, these are all the ensembles need:
+
+ - Voting:   the plain mean of the members;
+ - Stacking: a RidgeCV meta-learner fit on the OOF matrix;
+ - Weighted: non-negative least-squares weights fit on the OOF matrix.
+
+No member is refit or asked for test predictions again. Training rows that are in no
+validation fold (the first TimeSeriesSplit chunk) are left out of the fits. For new data,
+BlendedEnsemble.predict feeds each member its own scaled copy of the raw features.
+"""
+import numpy as np
+from scipy.optimize import nnls
+from sklearn.linear_model import RidgeCV
+
+ENSEMBLE_NAMES = ('Voting Ensemble', 'Stacking Ensemble', 'Weighted Ensemble')
+META_ALPHAS = np.logspace(-3, 3, 13)
+
+
+def covered_rows(oof):
+    """Mask of training rows that have an OOF prediction from every member"""
+    return np.isfinite(oof).all(axis=0)
+
+
+def nnls_weights(oof, y):
+    """Non-negative member weights minimising the OOF squared error (equal if all are zero)"""
+    rows = covered_rows(oof)
+    weights, _ = nnls(oof[:, rows].T, np.asarray(y, dtype=float)[rows])
+    if not weights.any():
+        return np.full(len(oof), 1.0 / len(oof))
+    return weights
+
+
+def fit_meta_learner(oof, y):
+    """RidgeCV stacking meta-learner on the members' OOF predictions"""
+    rows = covered_rows(oof)
+    return RidgeCV(alphas=META_ALPHAS).fit(oof[:, rows].T, np.asarray(y, dtype=float)[rows])
+
+
+class BlendedEnsemble:
+    """Combination of fitted members that each take their own scaled inputs.
+
+    `models` is the analyzer's name -> estimator mapping, so members held as lazy model
+    cache entries are only loaded when the ensemble predicts on new data. `scalers` maps
+    member name -> fitted scaler (None for raw features). Members are combined with
+    `meta.predict` when a meta-learner is given, else with `weights`.
+    """
+
+    def __init__(self, names, models, scalers, weights=None, meta=None):
+        self.names = list(names)
+        self.models = models
+        self.scalers = scalers
+        self.weights = None if weights is None else np.asarray(weights, dtype=float)
+        self.meta = meta
+
+    def combine(self, predictions):
+        """Ensemble prediction from an (n_members x n_samples) matrix of member predictions"""
+        predictions = np.asarray(predictions, dtype=float)
+        if self.meta is not None:
+            return self.meta.predict(predictions.T)
+        return self.weights @ predictions
+
+    def predict(self, X):
+        rows = []
+        for name in self.names:
+            scaler = self.scalers.get(name)
+            rows.append(self.models[name].predict(X if scaler is None else scaler.transform(X)))
+        return self.combine(rows)
+
+    def describe(self):
+        if self.meta is not None:
+            coef = ', '.join(f'{n}: {c:.3f}' for n, c in zip(self.names, self.meta.coef_))
+            return f'RidgeCV(alpha={self.meta.alpha_:g}) on [{coef}]'
+        return {name: round(float(w), 4) for name, w in zip(self.names, self.weights)}
@@ -3,11 +3,17 @@ Export store_sales forecasting model to TensorFlow SavedModel and TFLite.
 
 Usage:
   python export_model_to_tflite.py --db-path ".dart_tool/sqflite_common_ffi/databases/app.db" --out-dir assets/models
+  python export_model_to_tflite.py --horizon-days 30
 
 This script reads the `store_sales` table from the provided SQLite DB, constructs features
-compatible with the Flutter `ForecastService` feature builder, trains a small Keras model
-to predict next-day sales (target is next day's sales), and exports a SavedModel and
-TFLite file together with a JSON file listing the feature order.
+compatible with the Flutter `ForecastService` feature builder (feature_engine.py, 'app'
+convention), trains a small Keras model to predict next-day sales (target is next day's
+sales), and exports a SavedModel and TFLite file together with a JSON file listing the
+feature order.
+
+With --horizon-days N it also exports sales_forecast_horizon.tflite (and a SavedModel):
+the N-day recursive forecast, feature building included, as one graph taking the
+trailing 30 days of sales and the last sale date (see horizon_graph.py).
 
 Note: For reproducible and performant results you may want to tune model architecture,
 scaling, and training hyperparameters.
@@ -20,79 +26,16 @@ import json
 import os
 from datetime import datetime
 
+from feature_engine import compute_features
+from horizon_graph import day_number, export_horizon_model, pack_history, reference_forecast
+
 try:
     import tensorflow as tf
 except Exception as e:
     raise RuntimeError("TensorFlow is required to run this script. Install with: pip install tensorflow")
 
 
-def build_feature_row(date: pd.Timestamp, last_known: float, rolling7: list, rolling30: list):
-    month = date.month
-    day = date.day
-    quarter = ((date.month - 1) // 3) + 1
-    weekday = date.weekday()  # Monday=0
-    iso_week = int(date.isocalendar().week)
-    day_of_year = int(date.dayofyear)
-    is_weekend = 1 if weekday >= 5 else 0
-    is_month_start = 1 if date.is_month_start else 0
-    next_day = date + pd.Timedelta(days=1)
-    is_month_end = 1 if next_day.month != date.month else 0
-    is_quarter_start = 1 if (month in [1,4,7,10] and day == 1) else 0
-    is_quarter_end = 1 if (month in [3,6,9,12] and (day in [30,31])) else 0
-
-    mean7 = np.mean(rolling7) if len(rolling7) > 0 else last_known
-    mean30 = np.mean(rolling30) if len(rolling30) > 0 else last_known
-    mean14 = np.mean(rolling30[-14:]) if len(rolling30) >= 14 else mean7
-    mean21 = np.mean(rolling30[-21:]) if len(rolling30) >= 21 else mean7
-
-    std7 = float(np.std(rolling7, ddof=1)) if len(rolling7) > 1 else 0.0
-    std30 = float(np.std(rolling30, ddof=1)) if len(rolling30) > 1 else 0.0
-
-    feat = {
-        'year': float(date.year),
-        'month': float(month),
-        'day': float(day),
-        'quarter': float(quarter),
-        'weekday': float(weekday),
-        'week_of_year': float(iso_week),
-        'day_of_year': float(day_of_year),
-        'is_weekend': float(is_weekend),
-        'is_month_start': float(is_month_start),
-        'is_month_end': float(is_month_end),
-        'is_quarter_start': float(is_quarter_start),
-        'is_quarter_end': float(is_quarter_end),
-        'day_of_week_encoded': float(weekday),
-        'month_sin': float(np.sin(2 * np.pi * month / 12)),
-        'month_cos': float(np.cos(2 * np.pi * month / 12)),
-        'day_sin': float(np.sin(2 * np.pi * day / 31)),
-        'day_cos': float(np.cos(2 * np.pi * day / 31)),
-        'weekday_sin': float(np.sin(2 * np.pi * weekday / 7)),
-        'weekday_cos': float(np.cos(2 * np.pi * weekday / 7)),
-        'quarter_sin': float(np.sin(2 * np.pi * quarter / 4)),
-        'quarter_cos': float(np.cos(2 * np.pi * quarter / 4)),
-        'week_sin': float(np.sin(2 * np.pi * iso_week / 52)),
-        'week_cos': float(np.cos(2 * np.pi * iso_week / 52)),
-        'sales_lag1': float(last_known),
-        'sales_ma7': float(mean7),
-        'sales_ma14': float(mean14),
-        'sales_ma21': float(mean21),
-        'sales_ma30': float(mean30),
-        'sales_std7': float(std7),
-        'sales_std30': float(std30),
-        'month_squared': float(month * month),
-        'weekday_squared': float(weekday * weekday),
-        'day_squared': float(day * day),
-        'sales_to_ma7_ratio': float(last_known / (mean7 + 1e-8)),
-        'sales_to_ma30_ratio': float(last_known / (mean30 + 1e-8)),
-        'ma7_to_ma30_ratio': float(mean7 / (mean30 + 1e-8)),
-        'sales_volatility_7': float(std7 / (mean7 + 1e-8)),
-        'sales_volatility_30': float(std30 / (mean30 + 1e-8)),
-        'sales_detrended': float(last_known - mean30),
-    }
-    return feat
-
-
-def main(db_path: str, out_dir: str, epochs: int = 50):
+def main(db_path: str, out_dir: str, epochs: int = 50, horizon_days: int = 0):
     if not os.path.exists(db_path):
         raise FileNotFoundError(f"Database not found: {db_path}")
 
@@ -107,24 +50,12 @@ def main(db_path: str, out_dir: str, epochs: int = 50):
     df['sale_date'] = pd.to_datetime(df['sale_date'])
     df = df.sort_values('sale_date').reset_index(drop=True)
 
-    dates = list(df['sale_date'])
-    sales = list(df['sales'].astype(float))
-
-    # Build dataset: for each date t, build features for t and target is sales at t+1
-    X = []
-    y = []
+    sales = df['sales'].astype(float).to_numpy()
 
-    for i in range(len(dates) - 1):
-        date = pd.Timestamp(dates[i])
-        last_known = float(sales[i])
-        rolling7 = sales[max(0, i - 6):i + 1]
-        rolling30 = sales[max(0, i - 29):i + 1]
-        feat = build_feature_row(date, last_known, rolling7, rolling30)
-        X.append([feat[k] for k in sorted(feat.keys(), key=lambda s: FEATURE_ORDER.index(s))])
-        y.append(float(sales[i + 1]))
-
-    X = np.array(X, dtype=np.float32)
-    y = np.array(y, dtype=np.float32).reshape(-1, 1)
+    # Build dataset: for each date t, features known after day t ('app' convention, as in
+    # lib/services/feature_builder.dart) and target is sales at t+1
+    X = compute_features(df['sale_date'].to_numpy(), sales, FEATURE_ORDER, convention='app', dtype=np.float32)[:-1]
+    y = sales[1:].astype(np.float32).reshape(-1, 1)
 
     input_dim = X.shape[1]
     print(f"Training dataset shape: X={X.shape}, y={y.shape}")
@@ -175,6 +106,29 @@ def main(db_path: str, out_dir: str, epochs: int = 50):
         json.dump(FEATURE_ORDER, fh, indent=2)
     print(f"Feature order written to: {features_path}")
 
+    if horizon_days:
+        export_horizon(model, df['sale_date'].to_numpy(), sales, out_dir, horizon_days)
+
+
+def export_horizon(model, dates, sales, out_dir, days_ahead):
+    """Export the whole recursive forecast as one graph (horizon_graph.py) and check it
+    against the per-day host loop on the latest history"""
+    try:
+        tflite_path = export_horizon_model(model, FEATURE_ORDER, out_dir, days_ahead)
+    except Exception as e:
+        print(f"Horizon graph export failed (non-critical): {e}")
+        return
+    print(f"Horizon TFLite model ({days_ahead} days per invoke) written to: {tflite_path}")
+    try:
+        history, history_len = pack_history(sales)
+        runner = tf.lite.Interpreter(model_path=tflite_path).get_signature_runner()
+        path = runner(history=history, history_len=history_len, last_day=day_number(dates[-1]))['path']
+        expected = reference_forecast(lambda row: model(row, training=False).numpy(), FEATURE_ORDER,
+                                      dates, sales, days_ahead)
+        print(f"Horizon graph vs per-day loop: max |diff| {np.max(np.abs(path - expected)):.4f}")
+    except Exception as e:
+        print(f"Horizon graph check failed (non-critical): {e}")
+
 
 FEATURE_ORDER = [
     'year','month','day','quarter','weekday','week_of_year','day_of_year','is_weekend','is_month_start','is_month_end','is_quarter_start','is_quarter_end','day_of_week_encoded','month_sin','month_cos','day_sin','day_cos','weekday_sin','weekday_cos','quarter_sin','quarter_cos','week_sin','week_cos','sales_lag1','sales_ma7','sales_ma14','sales_ma21','sales_ma30','sales_std7','sales_std30','month_squared','weekday_squared','day_squared','sales_to_ma7_ratio','sales_to_ma30_ratio','ma7_to_ma30_ratio','sales_volatility_7','sales_volatility_30','sales_detrended'
@@ -186,6 +140,8 @@ if __name__ == '__main__':
     parser.add_argument('--db-path', type=str, default=os.path.join('.dart_tool','sqflite_common_ffi','databases','app.db'), help='Path to app.db')
     parser.add_argument('--out-dir', type=str, default=os.path.join('assets','models'), help='Output directory for models')
     parser.add_argument('--epochs', type=int, default=50)
+    parser.add_argument('--horizon-days', type=int, default=0,
+                        help='also export sales_forecast_horizon.tflite, the whole N-day forecast in one graph')
     args = parser.parse_args()
 
-    main(args.db_path, args.out_dir, epochs=args.epochs)
+    main(args.db_path, args.out_dir, epochs=args.epochs, horizon_days=args.horizon_days)
@@ -0,0 +1,189 @@
+"""
+Content-addressed on-disk cache for engineered feature frames.
+
+Entries are keyed by a fingerprint of the `store_sales` contents (row count, max id and a
+checksum of every column the feature builders read) plus the name and version of the
+feature builder that produced them. The checksum reads the whole table, so it is only
+recomputed when a cheap change marker moves: row count, max id, size/mtime of the DB file
+and its WAL, and SQLite's file change counter. The last marker and checksum per DB are
+kept in fingerprints.json; writes to other tables cost one re-checksum, not a rebuild. Each entry is a directory holding one `.npy` file per column, so a cache hit
+is served as read-only memory maps wrapped in a DataFrame without copying the data.
+
+Typical use from a training/export/inference script:
+
+    with sqlite3.connect(DB_PATH) as conn:
+        df = cached_feature_frame(conn, 'analyzer', FEATURE_VERSION, lambda: build(conn))
+
+Back-to-back train -> export -> sanity-inference jobs then only pay for feature
+engineering once per DB state.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_CACHE_DIR = os.path.join('.ml_cache', 'features')
+TABLE_NAME = 'store_sales'
+# Entries kept per feature set; older DB states are pruned on write
+MAX_ENTRIES = 4
+# store_sales columns read into the feature builds (holiday_flag also sets the int8 calibration strata)
+FINGERPRINT_COLUMNS = ('id', 'sale_date', 'day_of_week', 'month', 'holiday_flag', 'sales')
+MARKERS_FILE = 'fingerprints.json'
+
+
+def _file_marker(conn):
+    """(DB path, size/mtime of the file and its WAL plus the header change counter), or None
+    for in-memory databases"""
+    path = next((row[2] for row in conn.execute('PRAGMA database_list') if row[1] == 'main'), '')
+    if not path:
+        return None
+    marker = []
+    for p in (path, path + '-wal'):
+        try:
+            st = os.stat(p)
+            marker += [st.st_size, st.st_mtime_ns]
+        except OSError:
+            marker += [None, None]
+    with open(path, 'rb') as fh:
+        marker.append(int.from_bytes(fh.read(28)[24:28], 'big'))
+    return os.path.abspath(path), marker
+
+
+def _read_markers(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return {}
+
+
+def store_sales_fingerprint(conn, table=TABLE_NAME, cache_dir=None):
+    """Fingerprint the table contents that feature builders depend on. With `cache_dir`,
+    the checksum is reused while the DB's change marker is unchanged."""
+    rows, max_id = conn.execute(f"SELECT COUNT(*), MAX(id) FROM {table}").fetchone()
+    file_marker = _file_marker(conn) if cache_dir else None
+    if file_marker is not None:
+        markers_path = os.path.join(cache_dir, MARKERS_FILE)
+        entry_key = f"{file_marker[0]}::{table}"
+        marker = [int(rows), int(max_id or 0)] + file_marker[1]
+        known = _read_markers(markers_path).get(entry_key)
+        if known and known['marker'] == marker:
+            return known['fingerprint']
+
+    present = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    columns = ', '.join(c for c in FINGERPRINT_COLUMNS if c in present)
+    data = pd.read_sql_query(f"SELECT {columns} FROM {table} ORDER BY id", conn)
+    digest = hashlib.sha256(json.dumps(list(data.columns)).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(data, index=False).values.tobytes())
+    fingerprint = {'rows': int(rows), 'max_id': int(max_id or 0), 'checksum': digest.hexdigest()}
+
+    if file_marker is not None:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            markers = _read_markers(markers_path)
+            markers[entry_key] = {'marker': marker, 'fingerprint': fingerprint}
+            fd, tmp = tempfile.mkstemp(suffix='.tmp', dir=cache_dir)
+            with os.fdopen(fd, 'w', encoding='utf-8') as fh:
+                json.dump(markers, fh)
+            os.replace(tmp, markers_path)
+        except Exception as e:
+            print(f"Failed to write feature cache markers (non-critical): {e}")
+    return fingerprint
+
+
+def cache_key(fingerprint, feature_set, version):
+    """Stable hex key for (DB fingerprint, feature builder name, feature version)"""
+    payload = json.dumps({'db': fingerprint, 'features': feature_set, 'version': version}, sort_keys=True)
+    return f"{feature_set}-{hashlib.sha256(payload.encode('utf-8')).hexdigest()[:20]}"
+
+
+def _column_array(series):
+    """Convert a column to a plain numpy array that np.load can memory-map"""
+    if series.dtype == object or pd.api.types.is_string_dtype(series.dtype):
+        return series.astype(str).to_numpy(dtype=str)
+    return series.to_numpy()
+
+
+def save_frame(key, df, cache_dir=DEFAULT_CACHE_DIR):
+    """Write `df` as one .npy per column under cache_dir/key (atomic rename)"""
+    os.makedirs(cache_dir, exist_ok=True)
+    final_dir = os.path.join(cache_dir, key)
+    tmp_dir = tempfile.mkdtemp(prefix=f".{key}-", dir=cache_dir)
+    try:
+        meta = {'columns': [], 'dtypes': []}
+        for i, col in enumerate(df.columns):
+            np.save(os.path.join(tmp_dir, f"c{i}.npy"), _column_array(df[col]), allow_pickle=False)
+            meta['columns'].append(col)
+            meta['dtypes'].append(str(df[col].dtype))
+        np.save(os.path.join(tmp_dir, 'index.npy'), df.index.to_numpy(), allow_pickle=False)
+        with open(os.path.join(tmp_dir, 'meta.json'), 'w', encoding='utf-8') as fh:
+            json.dump(meta, fh)
+        if os.path.isdir(final_dir):
+            shutil.rmtree(final_dir, ignore_errors=True)
+        os.replace(tmp_dir, final_dir)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    _prune(cache_dir, key.split('-')[0], keep=final_dir)
+    return final_dir
+
+
+def load_frame(key, cache_dir=DEFAULT_CACHE_DIR):
+    """Return the cached frame as a zero-copy view over memory-mapped columns, or None"""
+    entry = os.path.join(cache_dir, key)
+    meta_path = os.path.join(entry, 'meta.json')
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, 'r', encoding='utf-8') as fh:
+        meta = json.load(fh)
+    columns = {}
+    for i, (col, dtype) in enumerate(zip(meta['columns'], meta['dtypes'])):
+        # Plain ndarray views over the memmap keep pandas/sklearn away from np.memmap quirks
+        arr = np.load(os.path.join(entry, f"c{i}.npy"), mmap_mode='r').view(np.ndarray)
+        if arr.dtype.kind == 'U':
+            columns[col] = pd.array(arr.astype(object), dtype=dtype)
+        elif str(arr.dtype) != dtype:
+            # pandas extension dtypes (e.g. UInt32 from isocalendar) are restored with a small copy
+            columns[col] = pd.array(arr, dtype=dtype)
+        else:
+            columns[col] = arr
+    index = pd.Index(np.load(os.path.join(entry, 'index.npy'), mmap_mode='r').view(np.ndarray), copy=False)
+    os.utime(entry)
+    return pd.DataFrame(columns, index=index, copy=False)
+
+
+def _prune(cache_dir, feature_set, keep, max_entries=MAX_ENTRIES):
+    """Drop the least recently used entries of one feature set beyond max_entries"""
+    entries = [os.path.join(cache_dir, d) for d in os.listdir(cache_dir)
+               if d.startswith(f"{feature_set}-") and os.path.isdir(os.path.join(cache_dir, d))]
+    entries.sort(key=os.path.getmtime, reverse=True)
+    for path in entries[max_entries:]:
+        if path != keep:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def cached_feature_frame(conn, feature_set, version, build_fn, cache_dir=DEFAULT_CACHE_DIR, table=TABLE_NAME):
+    """Return the feature frame for the current DB state, building and caching it on a miss.
+
+    `build_fn` is called with no arguments and must return the engineered DataFrame.
+    """
+    key = cache_key(store_sales_fingerprint(conn, table, cache_dir), feature_set, version)
+    try:
+        df = load_frame(key, cache_dir)
+    except Exception as e:
+        print(f"Ignoring unreadable feature cache entry {key} ({e})")
+        df = None
+    if df is not None:
+        print(f"Feature cache hit: {key}")
+        return df
+    print(f"Feature cache miss: {key}; building features")
+    df = build_fn()
+    try:
+        save_frame(key, df, cache_dir)
+    except Exception as e:
+        print(f"Failed to write feature cache (non-critical): {e}")
+    return df
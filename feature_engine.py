@@ -0,0 +1,621 @@
+"""
+Vectorized feature engine shared by the training, export and inference scripts.
+
+A feature set is declared as a list of column names (`ANALYZER_FEATURES`,
+`SEQUENCE_FEATURES`, `export_model_to_tflite.FEATURE_ORDER`, ...) and computed for a
+whole series at once with NumPy instead of row by row. Names follow the conventions used
+across the repo: calendar fields (`month`, `week_of_year`, ...), their cyclical encodings
+(`month_sin`, `week_cos`/`week_of_year_cos`, ...), windowed sales statistics
+(`sales_lag7`, `sales_ma14`, `sales_median30`, `sales_ema7`, `sales_pct_change1`, ...)
+and the derived interaction/ratio/volatility columns.
+
+Two window conventions exist in the code base:
+ - 'history' (SalesMLAnalyzer and tools/): row t describes day t. Lags look back k days
+   and rolling windows end at t and stay NaN until full, exactly like pandas rolling().
+ - 'app' (export_model_to_tflite.py, mirrored by lib/services/feature_builder.dart): row t
+   holds what is known after day t, so `sales_lag1` is day t itself. Windows shrink at the
+   start of the series, ma14/ma21 fall back to ma7 until full, std is 0 below two points
+   and `is_quarter_end` uses the app's day-30/31 approximation.
+
+Calendar columns come from a date_dimension.DateDimension (built over the series' span
+unless one carrying the app's holidays is passed in).
+"""
+import bisect
+import re
+
+import numpy as np
+import pandas as pd
+
+from date_dimension import CYCLICAL_PERIODS, DateDimension
+from rolling_stats import rolling_stats
+
+# Bump whenever a feature definition changes so cached feature frames are invalidated
+FEATURE_VERSION = 3
+
+LAGS = [1, 2, 3, 7, 14, 21, 30]
+WINDOWS = [3, 7, 14, 21, 30]
+EMA_SPANS = [7, 14, 30]
+# Longest look-back of any windowed feature (lag30 / rolling 30)
+FEATURE_HALO = 30
+
+CALENDAR_FEATURES = [
+    'year', 'day', 'quarter', 'weekday', 'week_of_year', 'day_of_year', 'is_weekend',
+    'is_month_start', 'is_month_end', 'is_quarter_start', 'is_quarter_end', 'day_of_week_encoded',
+]
+
+# Full feature set engineered by SalesMLAnalyzer.load_and_preprocess_data (column order matters:
+# it becomes the model's input order and sales_forecast_features.json)
+ANALYZER_FEATURES = (
+    CALENDAR_FEATURES
+    + ['month_sin', 'month_cos', 'day_sin', 'day_cos', 'weekday_sin', 'weekday_cos',
+       'quarter_sin', 'quarter_cos', 'week_sin', 'week_cos']
+    + [f'sales_lag{lag}' for lag in LAGS]
+    + [f'sales_{stat}{w}' for w in WINDOWS for stat in ('ma', 'std', 'min', 'max', 'median')]
+    + [f'sales_ema{span}' for span in EMA_SPANS]
+    + ['sales_diff1', 'sales_diff7', 'sales_pct_change1', 'sales_pct_change7',
+       'month_holiday', 'weekday_holiday', 'is_weekend_holiday',
+       'month_squared', 'weekday_squared', 'day_squared',
+       'sales_to_ma7_ratio', 'sales_to_ma30_ratio', 'ma7_to_ma30_ratio',
+       'sales_volatility_7', 'sales_volatility_30', 'sales_detrended']
+)
+
+# Subset used by the Conv1D sequence model in tools/run_train_export.py and run_tflite_inference.py
+SEQUENCE_FEATURES = (
+    CALENDAR_FEATURES
+    + ['month_sin', 'month_cos', 'day_sin', 'day_cos', 'weekday_sin', 'weekday_cos',
+       'quarter_sin', 'quarter_cos', 'week_of_year_sin', 'week_of_year_cos']
+    + [f'sales_lag{lag}' for lag in LAGS]
+    + [f'sales_{stat}{w}' for w in WINDOWS for stat in ('ma', 'std')]
+    + [f'sales_ema{span}' for span in EMA_SPANS]
+    + ['sales_diff1', 'sales_diff7', 'sales_to_ma7_ratio', 'sales_to_ma30_ratio', 'sales_detrended']
+)
+
+# Columns that hold whole numbers; build_feature_frame keeps them as int64 when NaN-free
+INTEGER_FEATURES = set(CALENDAR_FEATURES) | {
+    'month', 'holiday_flag', 'month_holiday', 'weekday_holiday', 'is_weekend_holiday',
+    'month_squared', 'weekday_squared', 'day_squared',
+}
+
+DAY_NAMES = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+
+_WINDOW_RE = re.compile(r'^sales_(lag|ma|std|min|max|median|ema|diff|pct_change)(\d+)$')
+_ROLLING_STATS = {'ma': 'mean', 'std': 'std', 'min': 'min', 'max': 'max', 'median': 'median'}
+_CYCLICAL_RE = re.compile(r'^(month|day|weekday|quarter|week|week_of_year)_(sin|cos)$')
+# Rolling buffers the app keeps (see feature_builder.dart); other windows fall back to ma7
+_APP_BUFFERS = (7, 30)
+_EPS = 1e-8
+
+
+def encode_day_of_week(values, weekday):
+    """Encode day_of_week names ('Monday', 'mon', ...) or 0-6 numbers; fall back to the date"""
+    s = pd.Series(values).astype(str).str.strip().str.lower()
+    names = {name: i for i, name in enumerate(DAY_NAMES)}
+    names.update({name[:3]: i for i, name in enumerate(DAY_NAMES)})
+    encoded = s.map(names)
+    encoded = encoded.fillna(pd.to_numeric(s, errors='coerce').where(lambda x: x.between(0, 6)))
+    return encoded.fillna(pd.Series(weekday)).to_numpy(dtype=np.int64)
+
+
+def _shift(x, k, fill=np.nan):
+    out = np.full(len(x), fill, dtype=float)
+    if k == 0:
+        out[:] = x
+    elif k < len(x):
+        out[k:] = x[:-k]
+    return out
+
+
+class FeatureEngine:
+    """Computes declared features for one sales series, memoizing shared intermediates"""
+
+    def __init__(self, dates, sales, holiday_flag=None, month=None, day_of_week=None, convention='history',
+                 calendar=None):
+        if convention not in ('history', 'app'):
+            raise ValueError(f"Unknown feature convention: {convention}")
+        self.convention = convention
+        self.sales = np.asarray(sales, dtype=float)
+        self.n = len(self.sales)
+        # Calendar columns (and holidays, if the dimension has them) are gathered by day offset
+        if calendar is None:
+            calendar = DateDimension.for_dates(dates)
+        self._cols = calendar.fields(dates)
+        if month is not None:
+            self._cols['month'] = np.asarray(month, dtype=np.int64)
+            del self._cols['month_sin'], self._cols['month_cos']
+        if holiday_flag is not None:
+            self._cols['holiday_flag'] = np.asarray(holiday_flag, dtype=np.int64)
+        self._cols['day_of_week_encoded'] = (self._cols['weekday'] if day_of_week is None
+                                             else encode_day_of_week(day_of_week, self._cols['weekday']))
+        if convention == 'app':
+            self._cols['is_quarter_end'] = ((self._cols['month'] % 3 == 0) & (self._cols['day'] >= 30)).astype(np.int64)
+        self._stats = {}
+
+    def column(self, name):
+        if name not in self._cols:
+            self._cols[name] = self._compute(name)
+        return self._cols[name]
+
+    def matrix(self, names, dtype=np.float64):
+        """(n, len(names)) array in the declared order"""
+        self.prepare(names)
+        out = np.empty((self.n, len(names)), dtype=dtype)
+        for j, name in enumerate(names):
+            out[:, j] = self.column(name)
+        return out
+
+    # -- windowed sales statistics -------------------------------------------------
+    def prepare(self, names):
+        """Compute every rolling statistic `names` depends on in one batched kernel call"""
+        wanted = set()
+        for name in names:
+            m = _WINDOW_RE.match(name)
+            if m and m.group(1) in _ROLLING_STATS:
+                wanted.add((_ROLLING_STATS[m.group(1)], int(m.group(2))))
+            elif name.startswith('sales_volatility_'):
+                w = int(name.rsplit('_', 1)[1])
+                wanted.update((('mean', w), ('std', w)))
+            elif name in ('sales_to_ma7_ratio', 'sales_to_ma30_ratio', 'ma7_to_ma30_ratio', 'sales_detrended'):
+                wanted.update((('mean', 7), ('mean', 30)))
+        if self.convention == 'app' and any(s == 'mean' and w not in _APP_BUFFERS for s, w in wanted):
+            wanted.add(('mean', 7))
+        missing = wanted - self._stats.keys()
+        if missing:
+            self._stats.update(rolling_stats(
+                self.sales, {w for _, w in missing}, {s for s, _ in missing},
+                # app convention: windows shrink at the start of the series
+                min_periods=None if self.convention == 'history' else 1,
+            ))
+
+    def _rolling(self, stat, w):
+        if (stat, w) not in self._stats:
+            self._stats.update(rolling_stats(self.sales, [w], [stat],
+                                             min_periods=None if self.convention == 'history' else 1))
+        out = self._stats[(stat, w)]
+        if self.convention == 'history':
+            return out
+        if stat == 'mean' and w not in _APP_BUFFERS:
+            count = np.minimum(np.arange(1, self.n + 1), 30)
+            out = np.where(count >= w, out, self.column('sales_ma7'))
+        elif stat == 'std':
+            # single-point windows: ddof=1 std is undefined and reported as 0 like the app
+            out = np.nan_to_num(out, nan=0.0)
+        return out
+
+    def _compute(self, name):
+        c = self.column
+        m = _WINDOW_RE.match(name)
+        if m:
+            kind, k = m.group(1), int(m.group(2))
+            if kind == 'lag':
+                if self.convention == 'app':
+                    # lag k = k-th most recent known value, falling back to the latest one
+                    out = _shift(self.sales, k - 1)
+                    return np.where(np.isnan(out), self.sales, out)
+                return _shift(self.sales, k)
+            if kind == 'ema':
+                return pd.Series(self.sales).ewm(span=k).mean().to_numpy()
+            if kind == 'diff':
+                return self.sales - _shift(self.sales, k)
+            if kind == 'pct_change':
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    return self.sales / _shift(self.sales, k) - 1.0
+            return self._rolling(_ROLLING_STATS[kind], k)
+
+        m = _CYCLICAL_RE.match(name)
+        if m:
+            field = 'week_of_year' if m.group(1) == 'week' else m.group(1)
+            return getattr(np, m.group(2))(2 * np.pi * c(field) / CYCLICAL_PERIODS[field])
+
+        if name in ('month_holiday', 'weekday_holiday', 'is_weekend_holiday'):
+            return c(name[:-len('_holiday')]) * c('holiday_flag')
+        if name.endswith('_squared'):
+            return c(name[:-len('_squared')]) ** 2
+        if name == 'sales':
+            return self.sales
+        if name == 'sales_to_ma7_ratio':
+            return self.sales / (c('sales_ma7') + _EPS)
+        if name == 'sales_to_ma30_ratio':
+            return self.sales / (c('sales_ma30') + _EPS)
+        if name == 'ma7_to_ma30_ratio':
+            return c('sales_ma7') / (c('sales_ma30') + _EPS)
+        if name.startswith('sales_volatility_'):
+            w = int(name.rsplit('_', 1)[1])
+            return c(f'sales_std{w}') / (c(f'sales_ma{w}') + _EPS)
+        if name == 'sales_detrended':
+            return self.sales - c('sales_ma30')
+        raise KeyError(f"Unknown feature: {name}")
+
+
+def compute_features(dates, sales, feature_names, convention='history', dtype=np.float64, **inputs):
+    """Compute `feature_names` for a whole series; returns an (n, F) array in that order.
+
+    `inputs` may provide holiday_flag, month (DB value overriding the date), day_of_week and
+    calendar (a DateDimension, e.g. one carrying the app's holidays).
+    """
+    return FeatureEngine(dates, sales, convention=convention, **inputs).matrix(feature_names, dtype=dtype)
+
+
+def build_feature_frame(df, feature_names=ANALYZER_FEATURES, convention='history', calendar=None):
+    """Return `df` (sorted store_sales rows) with `feature_names` appended as columns.
+
+    Rows are not dropped; callers decide how to treat the NaN warm-up rows.
+    """
+    engine = FeatureEngine(
+        pd.to_datetime(df['sale_date']).to_numpy(),
+        pd.to_numeric(df['sales'], errors='coerce').to_numpy(),
+        holiday_flag=df['holiday_flag'].to_numpy() if 'holiday_flag' in df.columns else None,
+        month=df['month'].to_numpy() if 'month' in df.columns else None,
+        day_of_week=df['day_of_week'].to_numpy() if 'day_of_week' in df.columns else None,
+        convention=convention,
+        calendar=calendar,
+    )
+    engine.prepare(feature_names)
+    features = {}
+    for name in feature_names:
+        values = engine.column(name)
+        if name in INTEGER_FEATURES and not np.isnan(values.astype(float)).any():
+            values = values.astype(np.int64)
+        features[name] = values
+    out = pd.concat([df, pd.DataFrame(features, index=df.index)], axis=1)
+    return out
+
+
+# -- EMA recursion ----------------------------------------------------------------------
+
+def ewm_continue(values, span, mean, weight):
+    """Resume pandas' adjusted ewm(span).mean() recursion from a saved (mean, weight) state.
+    Mirrors pandas' own update order so the resumed values match a full recompute exactly.
+    Returns the new EMA values plus the (mean, weight) state after the last value.
+    """
+    decay = 1.0 - 2.0 / (span + 1.0)
+    out = np.empty(len(values), dtype=float)
+    for i, cur in enumerate(values):
+        mean, weight = _ewm_step(cur, decay, mean, weight)
+        out[i] = mean
+    return out, mean, weight
+
+
+def _ewm_step(cur, decay, mean, weight):
+    if mean == mean:
+        weight *= decay
+        if cur == cur:
+            if mean != cur:
+                mean = weight * mean + cur
+                mean /= (weight + 1.0)
+            weight += 1.0
+    elif cur == cur:
+        mean = cur
+        weight = 1.0
+    return mean, weight
+
+
+def ewm_state(sales, span):
+    """Compute the (mean, weight) state pandas holds after an adjusted ewm over `sales`"""
+    observed = ~np.isnan(np.asarray(sales, dtype=float))
+    if len(observed) == 0:
+        return float('nan'), 0.0
+    decay = 1.0 - 2.0 / (span + 1.0)
+    weight = 1.0
+    started = bool(observed[0])
+    for obs in observed[1:]:
+        if started:
+            weight *= decay
+            if obs:
+                weight += 1.0
+        elif obs:
+            started = True
+            weight = 1.0
+    ema = pd.Series(sales, dtype=float).ewm(span=span).mean()
+    return float(ema.iloc[-1]), weight
+
+
+# -- streaming state for recursive forecasting ---------------------------------------------
+
+class StreamingFeatureState:
+    """Feature state for recursive multi-step forecasting.
+
+    Keeps the last known values (actual history, then each prediction pushed back in) in a
+    ring buffer with per-window running sums/sums of squares, sorted windows for
+    min/max/median and the EMA recursion. push() and row() cost O(max window), independent
+    of the history length, and row() fills one preallocated array in `feature_names` order.
+
+    Row semantics follow the recursive forecast: the row for day t sees values up to t-1,
+    so sales_lag1 is the latest known value and every window/ratio/diff/volatility feature
+    describes the trailing known values. Calendar-only columns for the whole horizon are
+    computed up front in start().
+    """
+
+    def __init__(self, history, feature_names, ema_means=None, dtype=np.float32):
+        self.feature_names = list(feature_names)
+        self._row = np.zeros(len(self.feature_names), dtype=dtype)
+        self._static_slots, static_names, self._dynamic = [], [], []
+        spans, windows, lookback = set(), set(), 1
+        for slot, name in enumerate(self.feature_names):
+            m = _WINDOW_RE.match(name)
+            if m:
+                kind, k = m.group(1), int(m.group(2))
+                self._dynamic.append((slot, kind, k))
+                if kind == 'ema':
+                    spans.add(k)
+                elif kind in ('ma', 'std', 'min', 'max', 'median'):
+                    windows.add(k)
+                lookback = max(lookback, k + 1 if kind in ('diff', 'pct_change') else k)
+            elif name.startswith('sales_volatility_'):
+                w = int(name.rsplit('_', 1)[1])
+                self._dynamic.append((slot, 'volatility', w))
+                windows.add(w)
+            elif name in ('sales_to_ma7_ratio', 'sales_to_ma30_ratio', 'ma7_to_ma30_ratio', 'sales_detrended'):
+                self._dynamic.append((slot, name, 0))
+                windows.update((7, 30))
+            else:
+                self._static_slots.append(slot)
+                static_names.append(name)
+        self._static_names = static_names
+        self._static_slots = np.asarray(self._static_slots, dtype=np.intp)
+        self._windows = sorted(windows)
+        self._size = max([lookback] + self._windows)
+
+        history = np.asarray(history, dtype=float)
+        tail = history[-self._size:]
+        # Sums are kept relative to a reference level to limit cancellation in the variance
+        self._ref = float(np.mean(tail)) if len(tail) else 0.0
+        self._buf = [0.0] * self._size
+        self._pos = 0
+        self._count = 0
+        self._sum = {w: 0.0 for w in self._windows}
+        self._sumsq = {w: 0.0 for w in self._windows}
+        self._sorted = {w: [] for w in self._windows}
+        self._ema = {}
+        for span in spans:
+            mean, weight = ewm_state(history, span)
+            if ema_means and span in ema_means:
+                mean = float(ema_means[span])
+            self._ema[span] = [mean, weight, 1.0 - 2.0 / (span + 1.0)]
+        for value in tail:
+            self._append(float(value))
+        self._static = None
+
+    def _value_back(self, k):
+        """k-th most recent known value (k=1 is the latest); falls back to the latest"""
+        if k > self._count:
+            k = 1
+        return self._buf[(self._pos - k) % self._size]
+
+    def _append(self, x):
+        d = x - self._ref
+        for w in self._windows:
+            srt = self._sorted[w]
+            if self._count >= w:
+                old = self._buf[(self._pos - w) % self._size]
+                od = old - self._ref
+                self._sum[w] -= od
+                self._sumsq[w] -= od * od
+                del srt[bisect.bisect_left(srt, old)]
+            self._sum[w] += d
+            self._sumsq[w] += d * d
+            bisect.insort(srt, x)
+        self._buf[self._pos] = x
+        self._pos = (self._pos + 1) % self._size
+        self._count += 1
+
+    def push(self, value):
+        """Append a new known value (actual or predicted)"""
+        value = float(value)
+        self._append(value)
+        for state in self._ema.values():
+            state[0], state[1] = _ewm_step(value, state[2], state[0], state[1])
+
+    def start(self, dates, holiday_flag=None, calendar=None):
+        """Precompute the calendar/holiday columns for the forecast horizon `dates`.
+        Holidays come from `holiday_flag` if given, else from the `calendar` DateDimension.
+        """
+        dates = np.asarray(dates, dtype='datetime64[D]')
+        engine = FeatureEngine(dates, np.zeros(len(dates)), holiday_flag=holiday_flag, calendar=calendar)
+        self._static = engine.matrix(self._static_names, dtype=self._row.dtype)
+        return self
+
+    def _mean(self, w):
+        n = min(self._count, w)
+        return self._ref + self._sum[w] / n
+
+    def _std(self, w):
+        n = min(self._count, w)
+        if n < 2:
+            return 0.0
+        s = self._sum[w]
+        var = (self._sumsq[w] - s * s / n) / (n - 1)
+        return float(np.sqrt(var)) if var > 0 else 0.0
+
+    def _stat(self, kind, k):
+        if kind == 'lag':
+            return self._value_back(k)
+        if kind == 'ma':
+            return self._mean(k)
+        if kind == 'std':
+            return self._std(k)
+        if kind == 'min':
+            return self._sorted[k][0]
+        if kind == 'max':
+            return self._sorted[k][-1]
+        if kind == 'median':
+            srt = self._sorted[k]
+            mid = len(srt) // 2
+            return srt[mid] if len(srt) % 2 else 0.5 * (srt[mid - 1] + srt[mid])
+        if kind == 'ema':
+            return self._ema[k][0]
+        if kind == 'diff':
+            return self._value_back(1) - self._value_back(k + 1)
+        if kind == 'pct_change':
+            prev = self._value_back(k + 1)
+            return self._value_back(1) / prev - 1.0 if prev != 0 else np.nan
+        if kind == 'volatility':
+            return self._std(k) / (self._mean(k) + _EPS)
+        if kind == 'sales_to_ma7_ratio':
+            return self._value_back(1) / (self._mean(7) + _EPS)
+        if kind == 'sales_to_ma30_ratio':
+            return self._value_back(1) / (self._mean(30) + _EPS)
+        if kind == 'ma7_to_ma30_ratio':
+            return self._mean(7) / (self._mean(30) + _EPS)
+        if kind == 'sales_detrended':
+            return self._value_back(1) - self._mean(30)
+        raise KeyError(kind)
+
+    def row(self, step):
+        """Feature row for horizon step `step` (index into the dates given to start()).
+        The returned array is reused between calls; copy it if it must be kept.
+        """
+        out = self._row
+        out[self._static_slots] = self._static[step]
+        for slot, kind, k in self._dynamic:
+            out[slot] = self._stat(kind, k)
+        return out
+
+
+class BatchFeatureState:
+    """StreamingFeatureState for K scenarios advanced in lockstep.
+
+    Holds the known values of every scenario in one (K, lookback + horizon) array; push()
+    appends a column of K values and row() builds the (K, F) feature matrix of the next
+    day with NumPy reductions over the trailing windows, so one model.predict serves all
+    scenarios. Row semantics match StreamingFeatureState.
+
+    Every row starts from the known `history` scaled by its entry of `levels` (default: a
+    single unscaled row); scaling a history scales all its window statistics and EMAs.
+    `ema_means` optionally maps span -> EMA of the unscaled history.
+    """
+
+    def __init__(self, history, feature_names, levels=None, ema_means=None, dtype=np.float64):
+        self.feature_names = list(feature_names)
+        self.dtype = dtype
+        history = np.asarray(history, dtype=float)
+        levels = np.ones(1) if levels is None else np.asarray(levels, dtype=float).reshape(-1)
+        self.k = len(levels)
+        self._static_slots, self._static_names, self._dynamic = [], [], []
+        spans, lookback = set(), 1
+        for slot, name in enumerate(self.feature_names):
+            m = _WINDOW_RE.match(name)
+            if m:
+                kind, k = m.group(1), int(m.group(2))
+                self._dynamic.append((slot, kind, k))
+                if kind == 'ema':
+                    spans.add(k)
+                lookback = max(lookback, k + 1 if kind in ('diff', 'pct_change') else k)
+            elif name.startswith('sales_volatility_'):
+                w = int(name.rsplit('_', 1)[1])
+                self._dynamic.append((slot, 'volatility', w))
+                lookback = max(lookback, w)
+            elif name in ('sales_to_ma7_ratio', 'sales_to_ma30_ratio', 'ma7_to_ma30_ratio', 'sales_detrended'):
+                self._dynamic.append((slot, name, 0))
+                lookback = max(lookback, 30)
+            else:
+                self._static_slots.append(slot)
+                self._static_names.append(name)
+        self._static_slots = np.asarray(self._static_slots, dtype=np.intp)
+        self._values = levels[:, np.newaxis] * history[np.newaxis, -lookback:]
+        self._n = self._values.shape[1]
+        self._ema = {}
+        for span in spans:
+            mean, weight = ewm_state(history, span)
+            if ema_means and span in ema_means:
+                mean = float(ema_means[span])
+            self._ema[span] = [levels * mean, weight, 1.0 - 2.0 / (span + 1.0)]
+        self._static = None
+        self._memo = {}
+
+    def start(self, dates, holiday_flag=None, calendar=None):
+        """Precompute the static columns for the horizon `dates`. `holiday_flag` may be one
+        (H,) flag for all scenarios or a (K, H) array of per-scenario flags.
+        """
+        dates = np.asarray(dates, dtype='datetime64[D]')
+        horizon = len(dates)
+        if holiday_flag is None:
+            engine = FeatureEngine(dates, np.zeros(horizon), calendar=calendar)
+            static = engine.matrix(self._static_names)
+            self._static = np.broadcast_to(static, (self.k,) + static.shape)
+        else:
+            # Static columns are linear in the holiday flag (holiday_flag, month_holiday, ...),
+            # so per-scenario flags interpolate between the all-off and all-on matrices
+            off = FeatureEngine(dates, np.zeros(horizon), holiday_flag=np.zeros(horizon),
+                                calendar=calendar).matrix(self._static_names)
+            on = FeatureEngine(dates, np.zeros(horizon), holiday_flag=np.ones(horizon),
+                               calendar=calendar).matrix(self._static_names)
+            flags = np.broadcast_to(np.asarray(holiday_flag, dtype=float), (self.k, horizon))
+            self._static = off[np.newaxis] + flags[:, :, np.newaxis] * (on - off)[np.newaxis]
+        # Room for every value pushed during the horizon
+        values = np.empty((self.k, self._n + horizon))
+        values[:, :self._n] = self._values
+        self._values = values
+        return self
+
+    def push(self, values):
+        """Append the next known (or predicted) value of every scenario"""
+        values = np.asarray(values, dtype=float).reshape(self.k)
+        self._values[:, self._n] = values
+        self._n += 1
+        for state in self._ema.values():
+            means, weight, decay = state
+            weight *= decay
+            state[0] = (weight * means + values) / (weight + 1.0)
+            state[1] = weight + 1.0
+
+    def _window(self, w):
+        return self._values[:, max(self._n - w, 0):self._n]
+
+    def _back(self, k):
+        """(K,) k-th most recent values (k=1 is the latest); falls back to the latest"""
+        return self._values[:, self._n - (k if k <= self._n else 1)]
+
+    def _mean(self, w):
+        if ('mean', w) not in self._memo:
+            self._memo[('mean', w)] = self._window(w).mean(axis=1)
+        return self._memo[('mean', w)]
+
+    def _std(self, w):
+        if ('std', w) not in self._memo:
+            window = self._window(w)
+            self._memo[('std', w)] = (np.zeros(self.k) if window.shape[1] < 2
+                                      else np.sqrt(np.square(window - self._mean(w)[:, np.newaxis]).sum(axis=1)
+                                                   / (window.shape[1] - 1)))
+        return self._memo[('std', w)]
+
+    def _stat(self, kind, k):
+        if kind == 'lag':
+            return self._back(k)
+        if kind == 'ma':
+            return self._mean(k)
+        if kind == 'std':
+            return self._std(k)
+        if kind == 'min':
+            return self._window(k).min(axis=1)
+        if kind == 'max':
+            return self._window(k).max(axis=1)
+        if kind == 'median':
+            return np.median(self._window(k), axis=1)
+        if kind == 'ema':
+            return self._ema[k][0]
+        if kind == 'diff':
+            return self._back(1) - self._back(k + 1)
+        if kind == 'pct_change':
+            prev = self._back(k + 1)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                return np.where(prev != 0, self._back(1) / prev - 1.0, np.nan)
+        if kind == 'volatility':
+            return self._std(k) / (self._mean(k) + _EPS)
+        if kind == 'sales_to_ma7_ratio':
+            return self._back(1) / (self._mean(7) + _EPS)
+        if kind == 'sales_to_ma30_ratio':
+            return self._back(1) / (self._mean(30) + _EPS)
+        if kind == 'ma7_to_ma30_ratio':
+            return self._mean(7) / (self._mean(30) + _EPS)
+        if kind == 'sales_detrended':
+            return self._back(1) - self._mean(30)
+        raise KeyError(kind)
+
+    def rows(self, step):
+        """(K, F) feature matrix for horizon step `step`, one row per scenario"""
+        self._memo = {}  # window means/stds shared by several features of this row
+        out = np.empty((self.k, len(self.feature_names)), dtype=self.dtype, order='F')  # filled column by column
+        out[:, self._static_slots] = self._static[:, step]
+        for slot, kind, k in self._dynamic:
+            out[:, slot] = self._stat(kind, k)
+        return out
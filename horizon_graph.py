@@ -0,0 +1,271 @@
+"""
+Whole-horizon forecast graph: the recursive 30-day loop compiled into one TF function.
+
+The app (ForecastService) and the Python recursive path call the model once per day and
+rebuild the feature row on the host between calls. build_horizon_module() wraps a
+trained Keras model in a tf.function that does the whole loop in the graph:
+
+    forecast(history, history_len, last_day) -> path
+
+    history      float32 [HISTORY]  trailing daily sales, oldest first; when fewer than
+                                    HISTORY days are known they are right-aligned and
+                                    history_len tells how many are valid
+    history_len  int32 scalar       number of valid values at the end of `history`
+    last_day     int32 scalar       date of the last known sale as days since 1970-01-01
+    path         float32 [days_ahead]  predicted sales for last_day + 1 .. + days_ahead
+
+Each step computes the 'app' feature row (feature_engine.compute_features with
+convention='app'): calendar fields of the latest known day from integer date arithmetic,
+lags, shrinking rolling means/stds over a 30-day buffer, ratios and volatility. It calls
+the model, then shifts the prediction into the buffer. tf.while_loop runs days_ahead
+steps and every tensor keeps a static shape, so the TFLite conversion uses builtin ops
+only (WHILE included). The device makes one invoke per forecast instead of 30.
+
+reference_forecast() is the host loop the graph replaces, used to check parity.
+"""
+import re
+
+import numpy as np
+
+from date_dimension import CYCLICAL_PERIODS
+from feature_engine import compute_features
+
+HISTORY = 30
+DEFAULT_DAYS_AHEAD = 30
+_EPS = 1e-8
+_CALENDAR = ('year', 'month', 'day', 'quarter', 'weekday', 'week_of_year', 'day_of_year', 'is_weekend',
+             'is_month_start', 'is_month_end', 'is_quarter_start', 'is_quarter_end', 'day_of_week_encoded')
+_WINDOW_RE = re.compile(r'^sales_(lag|ma|std)(\d+)$')
+_CYCLICAL_RE = re.compile(r'^(month|day|weekday|quarter|week_of_year|week)_(sin|cos)$')
+_SQUARED = ('month_squared', 'weekday_squared', 'day_squared')
+_DERIVED = ('sales_to_ma7_ratio', 'sales_to_ma30_ratio', 'ma7_to_ma30_ratio', 'sales_detrended',
+            'sales_volatility_7', 'sales_volatility_30')
+
+
+def unsupported_features(feature_names):
+    """Names the graph cannot compute from the sales history and the date alone"""
+    out = []
+    for name in feature_names:
+        m = _WINDOW_RE.match(name)
+        if m and 1 <= int(m.group(2)) <= HISTORY:
+            continue
+        if name in _CALENDAR or name in _SQUARED or name in _DERIVED or _CYCLICAL_RE.match(name):
+            continue
+        out.append(name)
+    return out
+
+
+def _civil_from_days(z):
+    """(year, month, day) int32 tensors for days since 1970-01-01 (proleptic Gregorian)"""
+    import tensorflow as tf
+
+    z = z + 719468
+    era = tf.math.floordiv(z, 146097)
+    doe = z - era * 146097
+    yoe = (doe - doe // 1460 + doe // 36524 - doe // 146096) // 365
+    doy = doe - (365 * yoe + yoe // 4 - yoe // 100)
+    mp = (5 * doy + 2) // 153
+    day = doy - (153 * mp + 2) // 5 + 1
+    month = tf.where(mp < 10, mp + 3, mp - 9)
+    year = yoe + era * 400 + tf.cast(month <= 2, tf.int32)
+    return year, month, day
+
+
+def _days_from_civil(year, month, day):
+    """Inverse of _civil_from_days"""
+    import tensorflow as tf
+
+    year = year - tf.cast(month <= 2, tf.int32)
+    era = tf.math.floordiv(year, 400)
+    yoe = year - era * 400
+    doy = (153 * tf.where(month > 2, month - 3, month + 9) + 2) // 5 + day - 1
+    doe = yoe * 365 + yoe // 4 - yoe // 100 + doy
+    return era * 146097 + doe - 719468
+
+
+def _calendar(day_number):
+    """Calendar fields of date_dimension.calendar_fields (ISO weeks, Monday = 0), as float32"""
+    import tensorflow as tf
+
+    year, month, day = _civil_from_days(day_number)
+    weekday = tf.math.floormod(day_number + 3, 7)  # 1970-01-01 was a Thursday
+    day_of_year = day_number - _days_from_civil(year, tf.ones_like(month), tf.ones_like(day)) + 1
+    thursday = day_number - weekday + 3
+    thursday_year, _, _ = _civil_from_days(thursday)
+    iso_week = (thursday - _days_from_civil(thursday_year, tf.ones_like(month), tf.ones_like(day))) // 7 + 1
+    _, next_month, _ = _civil_from_days(day_number + 1)
+    quarter = (month - 1) // 3 + 1
+    f = lambda x: tf.cast(x, tf.float32)
+    return {
+        'year': f(year), 'month': f(month), 'day': f(day), 'quarter': f(quarter),
+        'weekday': f(weekday), 'week_of_year': f(iso_week), 'day_of_year': f(day_of_year),
+        'is_weekend': f(weekday >= 5), 'is_month_start': f(day == 1),
+        'is_month_end': f(next_month != month),
+        'is_quarter_start': f((day == 1) & (tf.math.floormod(month, 3) == 1)),
+        # app convention: day-30/31 approximation (see feature_engine.FeatureEngine)
+        'is_quarter_end': f((tf.math.floormod(month, 3) == 0) & (day >= 30)),
+        'day_of_week_encoded': f(weekday),
+    }
+
+
+def _feature_row(feature_names, buf, count, day_number):
+    """(1, F) 'app' feature row for the latest known day from the HISTORY-value buffer"""
+    import tensorflow as tf
+
+    cal = _calendar(day_number)
+    position = tf.range(HISTORY)
+    count_f = tf.cast(count, tf.float32)
+    cache = {}
+
+    def window_mean(w):
+        if ('mean', w) not in cache:
+            n = tf.minimum(w, count)
+            mask = position >= HISTORY - n
+            cache[('mean', w)] = tf.reduce_sum(tf.where(mask, buf, 0.0)) / tf.cast(n, tf.float32)
+        return cache[('mean', w)]
+
+    def ma(w):
+        # app convention: only the 7/30 buffers exist; other windows fall back to ma7 until full
+        if w in (7, 30):
+            return window_mean(w)
+        return tf.where(count_f >= w, window_mean(w), window_mean(7))
+
+    def std(w):
+        if ('std', w) not in cache:
+            n = tf.minimum(w, count)
+            mask = position >= HISTORY - n
+            dev = tf.where(mask, buf - window_mean(w), 0.0)
+            n_f = tf.cast(n, tf.float32)
+            var = tf.reduce_sum(dev * dev) / tf.maximum(n_f - 1.0, 1.0)
+            cache[('std', w)] = tf.where(n > 1, tf.sqrt(var), 0.0)
+        return cache[('std', w)]
+
+    latest = buf[HISTORY - 1]
+    values = []
+    for name in feature_names:
+        m = _WINDOW_RE.match(name)
+        if m:
+            kind, k = m.group(1), int(m.group(2))
+            if kind == 'lag':
+                # k-th most recent known value, falling back to the latest one
+                values.append(tf.where(count >= k, buf[HISTORY - k], latest))
+            else:
+                values.append(ma(k) if kind == 'ma' else std(k))
+            continue
+        m = _CYCLICAL_RE.match(name)
+        if m:
+            field = 'week_of_year' if m.group(1) == 'week' else m.group(1)
+            angle = 2 * np.pi * cal[field] / CYCLICAL_PERIODS[field]
+            values.append(tf.sin(angle) if m.group(2) == 'sin' else tf.cos(angle))
+        elif name in cal:
+            values.append(cal[name])
+        elif name in _SQUARED:
+            values.append(cal[name[:-len('_squared')]] ** 2)
+        elif name == 'sales_to_ma7_ratio':
+            values.append(latest / (ma(7) + _EPS))
+        elif name == 'sales_to_ma30_ratio':
+            values.append(latest / (ma(30) + _EPS))
+        elif name == 'ma7_to_ma30_ratio':
+            values.append(ma(7) / (ma(30) + _EPS))
+        elif name == 'sales_detrended':
+            values.append(latest - ma(30))
+        elif name.startswith('sales_volatility_'):
+            w = int(name.rsplit('_', 1)[1])
+            values.append(std(w) / (ma(w) + _EPS))
+        else:
+            raise KeyError(f"Unsupported feature in the horizon graph: {name}")
+    return tf.reshape(tf.stack(values), (1, len(feature_names)))
+
+
+def build_horizon_module(model, feature_names, days_ahead=DEFAULT_DAYS_AHEAD):
+    """tf.Module whose `forecast` runs `days_ahead` recursive steps of `model` in one graph"""
+    import tensorflow as tf
+
+    missing = unsupported_features(feature_names)
+    if missing:
+        raise ValueError(f"Horizon graph cannot compute features: {missing}")
+    feature_names = list(feature_names)
+
+    class HorizonForecaster(tf.Module):
+        def __init__(self):
+            super().__init__()
+            self.model = model
+
+        @tf.function(input_signature=[tf.TensorSpec([HISTORY], tf.float32, name='history'),
+                                      tf.TensorSpec([], tf.int32, name='history_len'),
+                                      tf.TensorSpec([], tf.int32, name='last_day')])
+        def forecast(self, history, history_len, last_day):
+            def step(i, buf, count, path):
+                row = _feature_row(feature_names, buf, count, last_day + i)
+                pred = tf.reshape(self.model(row, training=False), [1])
+                return (i + 1, tf.concat([buf[1:], pred], 0), tf.minimum(count + 1, HISTORY),
+                        tf.concat([path[1:], pred], 0))
+
+            count = tf.clip_by_value(history_len, 1, HISTORY)
+            _, _, _, path = tf.while_loop(
+                lambda i, *_: i < days_ahead, step,
+                (tf.constant(0), history, count, tf.zeros([days_ahead], tf.float32)),
+                maximum_iterations=days_ahead)
+            return {'path': path}
+
+    return HorizonForecaster()
+
+
+def export_horizon_model(model, feature_names, out_dir, days_ahead=DEFAULT_DAYS_AHEAD,
+                         name='sales_forecast_horizon'):
+    """Write <name>_saved/ (SavedModel) and <name>.tflite (signature 'serving_default':
+    history, history_len, last_day -> path); returns the TFLite path"""
+    import os
+
+    import tensorflow as tf
+
+    module = build_horizon_module(model, feature_names, days_ahead)
+    saved_dir = os.path.join(out_dir, f'{name}_saved')
+    tf.saved_model.save(module, saved_dir, signatures={'serving_default': module.forecast})
+    # Freeze the weights first: the converter leaves resource-variable reads inside the
+    # WHILE body, which the interpreter cannot run (READ_VARIABLE failed to invoke)
+    from tensorflow.python.framework.convert_to_constants import convert_variables_to_constants_v2
+
+    concrete = module.forecast.get_concrete_function()
+    frozen = convert_variables_to_constants_v2(concrete)
+
+    @tf.function(input_signature=list(concrete.structured_input_signature[0]))
+    def serve(history, history_len, last_day):
+        return {'path': frozen(history, history_len, last_day)[0]}
+
+    converter = tf.lite.TFLiteConverter.from_concrete_functions([serve.get_concrete_function()], tf.Module())
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS]
+    tflite_path = os.path.join(out_dir, f'{name}.tflite')
+    with open(tflite_path, 'wb') as fh:
+        fh.write(converter.convert())
+    return tflite_path
+
+
+def pack_history(sales):
+    """(history, history_len) inputs for the trailing values of `sales`"""
+    sales = np.asarray(sales, dtype=np.float32)[-HISTORY:]
+    history = np.zeros(HISTORY, dtype=np.float32)
+    if len(sales):
+        history[-len(sales):] = sales
+    return history, np.int32(len(sales))
+
+
+def day_number(date):
+    return np.int32(np.datetime64(date, 'D').astype(np.int64))
+
+
+def reference_forecast(predict, feature_names, dates, sales, days_ahead=DEFAULT_DAYS_AHEAD):
+    """The host-side loop the graph replaces: rebuild the 'app' features of the extended
+    series each day, predict (predict: (1, F) float32 -> scalar) and append"""
+    dates = np.asarray(dates, dtype='datetime64[D]')
+    sales = list(np.asarray(sales, dtype=float)[-HISTORY:])
+    dates = list(dates[-HISTORY:])
+    path = []
+    for _ in range(days_ahead):
+        row = compute_features(np.array(dates), np.array(sales), feature_names, convention='app',
+                               dtype=np.float32)[-1:]
+        pred = float(np.asarray(predict(row)).reshape(-1)[0])
+        path.append(pred)
+        sales.append(pred)
+        dates.append(dates[-1] + np.timedelta64(1, 'D'))
+    return np.array(path)
@@ -0,0 +1,169 @@
+"""
+Representative-dataset calibration for full-integer (int8 in, int8 out) TFLite models.
+
+Calibration windows come straight from the WindowedDataset over the cached sequence
+feature frame. Each is yielded as a (1, window, F) view, so nothing is copied up front.
+stratified_indices() picks them from the training split. Every (weekday, month,
+holiday) stratum of the target day gets samples in proportion to its size, and at least
+one, so rare holiday windows are always seen.
+
+Calibration and quantization are split:
+ - calibrate() runs the representative windows through the float model once, with TF's
+   calibrate-only converter mode. It stores the result under .ml_cache/calibration/, keyed
+   by the model weights, the calibration windows and the TF version. That flatbuffer
+   holds the recorded min/max activation range of every tensor.
+ - quantize_int8() turns those ranges into the int8 model with the MLIR quantizer, which
+   takes well under a second.
+
+A re-export of unchanged weights on unchanged data therefore skips calibration. If the
+private converter hooks are unavailable, convert_full_int8() falls back to a regular
+representative_dataset conversion, still with the stratified windows. It converts from
+the in-memory Keras model. The SavedModel wrapper keeps resource variables, which the
+calibrator cannot read.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_CACHE_DIR = os.path.join('.ml_cache', 'calibration')
+DEFAULT_SAMPLES = 300
+# Calibrations kept; older ones are pruned on write
+MAX_ENTRIES = 4
+
+
+def stratified_indices(dates, holiday_flag, n_samples=DEFAULT_SAMPLES, seed=42):
+    """Sorted sample indices stratified by (weekday, month, holiday) of `dates`, proportional
+    to stratum size with at least one per stratum where possible; all indices if there
+    are no more than n_samples"""
+    dates = pd.DatetimeIndex(dates)
+    n = len(dates)
+    if n <= n_samples:
+        return np.arange(n)
+    groups = pd.Series(np.arange(n)).groupby(
+        [dates.weekday, dates.month, np.asarray(holiday_flag, dtype=int) > 0]).indices
+    members = list(groups.values())
+    holiday = np.array([key[2] for key in groups])
+    sizes = np.array([len(m) for m in members])
+    # Proportional quotas, at least one each, then adjusted to exactly n_samples by the
+    # largest remainders (adding) or the largest quotas (removing). With more strata than
+    # samples, the smallest non-holiday strata give up their single sample.
+    rng = np.random.default_rng(seed)
+    share = n_samples * sizes / n
+    tie_break = share + 1e-9 * rng.random(len(sizes))
+    quota = np.minimum(np.maximum(1, np.floor(share)).astype(int), sizes)
+    while quota.sum() > n_samples:
+        if (quota > 1).any():
+            quota[np.argmax(quota)] -= 1
+        else:
+            quota[np.argmin(np.where((quota > 0) & ~holiday, tie_break, np.inf))] -= 1
+    while quota.sum() < n_samples:
+        quota[np.argmax(np.where(quota < sizes, share - quota, -np.inf))] += 1
+    picked = [rng.choice(m, q, replace=False) for m, q in zip(members, quota)]
+    return np.sort(np.concatenate(picked))
+
+
+def strata_summary(dates, holiday_flag, indices):
+    """Sample counts per weekday, month and holiday flag (for logs/metadata)"""
+    dates = pd.DatetimeIndex(dates)[indices]
+    flags = np.asarray(holiday_flag, dtype=int)[indices] > 0
+    return {
+        'weekday': {int(k): int(v) for k, v in pd.Series(dates.weekday).value_counts().sort_index().items()},
+        'month': {int(k): int(v) for k, v in pd.Series(dates.month).value_counts().sort_index().items()},
+        'holiday': int(flags.sum()),
+    }
+
+
+def representative_dataset(windows, indices):
+    """Converter callback yielding each selected window as a (1, window, F) float32 view"""
+    def gen():
+        for i in indices:
+            yield [windows[i:i + 1]]
+    return gen
+
+
+def calibration_key(keras_model, windows, indices):
+    import tensorflow as tf
+
+    digest = hashlib.sha256(tf.__version__.encode('utf-8'))
+    for weights in keras_model.get_weights():
+        digest.update(np.ascontiguousarray(weights).tobytes())
+    digest.update(np.ascontiguousarray(windows[indices]).tobytes())
+    return digest.hexdigest()[:20]
+
+
+def _converter(keras_model, windows, indices):
+    import tensorflow as tf
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(keras_model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.representative_dataset = representative_dataset(windows, indices)
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    converter.inference_input_type = tf.int8
+    converter.inference_output_type = tf.int8
+    return converter
+
+
+def _prune(cache_dir):
+    entries = sorted((f for f in os.listdir(cache_dir) if f.endswith('.tflite')),
+                     key=lambda f: os.path.getmtime(os.path.join(cache_dir, f)))
+    for old in entries[:-MAX_ENTRIES]:
+        for suffix in ('.tflite', '.json'):
+            try:
+                os.remove(os.path.join(cache_dir, old[:-len('.tflite')] + suffix))
+            except OSError:
+                pass
+
+
+def calibrate(keras_model, windows, indices, cache_dir=DEFAULT_CACHE_DIR, meta=None):
+    """(calibrated flatbuffer with activation ranges, cache hit?) for the selected windows"""
+    key = calibration_key(keras_model, windows, indices)
+    path = os.path.join(cache_dir, f'{key}.tflite')
+    if os.path.exists(path):
+        with open(path, 'rb') as fh:
+            return fh.read(), True
+
+    converter = _converter(keras_model, windows, indices)
+    converter._experimental_calibrate_only = True
+    start = time.perf_counter()
+    calibrated = converter.convert()
+    print(f'Calibrated on {len(indices)} windows in {time.perf_counter() - start:.1f}s')
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(suffix='.tmp', dir=cache_dir)
+        with os.fdopen(fd, 'wb') as fh:
+            fh.write(calibrated)
+        os.replace(tmp, path)
+        with open(os.path.join(cache_dir, f'{key}.json'), 'w', encoding='utf-8') as fh:
+            json.dump(dict(meta or {}, samples=len(indices), created_at=time.time()), fh, indent=2)
+        _prune(cache_dir)
+    except Exception as e:
+        print(f'Failed to cache calibration (non-critical): {e}')
+    return calibrated, False
+
+
+def quantize_int8(calibrated):
+    """Full-int8 model (int8 input and output) from a calibrated flatbuffer"""
+    import tensorflow as tf
+    from tensorflow.lite.python import convert as tfl_convert
+
+    return tfl_convert.mlir_quantize(calibrated, input_data_type=tf.int8, output_data_type=tf.int8)
+
+
+def convert_full_int8(keras_model, windows, dates, holiday_flag, stop=None, n_samples=DEFAULT_SAMPLES,
+                      cache_dir=DEFAULT_CACHE_DIR, seed=42):
+    """(int8 TFLite bytes, info) calibrated on a stratified sample of windows[:stop].
+    `dates`/`holiday_flag` describe each window's target day."""
+    stop = len(windows) if stop is None else stop
+    indices = stratified_indices(dates[:stop], holiday_flag[:stop], n_samples, seed)
+    info = {'samples': len(indices), 'strata': strata_summary(dates, holiday_flag, indices), 'cache_hit': False}
+    try:
+        calibrated, info['cache_hit'] = calibrate(keras_model, windows, indices, cache_dir, {'strata': info['strata']})
+        return quantize_int8(calibrated), info
+    except (AttributeError, ImportError) as e:
+        print(f'Cached calibration unavailable in this TensorFlow ({e}); calibrating inline')
+        return _converter(keras_model, windows, indices).convert(), info
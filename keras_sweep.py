@@ -0,0 +1,212 @@
+"""
+Parallel ASHA sweep over Keras MLP configurations for train_export_improved.py.
+
+Instead of training a handful of candidates one after another to the full epoch count,
+trials are scheduled with asynchronous successive halving (ASHA):
+
+ - rungs sit at min_epochs * eta^k epochs (capped at max_epochs). A trial that finishes a
+   rung reports its holdout RMSE. It is promoted to the next rung only if it ranks in the
+   top 1/eta of all trials that have reported at that rung so far; otherwise it stops
+   there. Weak configurations are therefore pruned after a few epochs, and nobody waits
+   for a rung to fill up;
+ - trials run in a pool of spawned worker processes. Each worker caps TensorFlow's
+   intra-/inter-op thread pools (and OpenMP) at its share of the core budget
+   (training_scheduler.core_budget), so the workers do not oversubscribe the CPU;
+ - between rungs a trial's model (weights and optimizer state) is saved as .keras in a
+   scratch directory, and the next rung resumes it in whichever worker is free.
+
+The candidate space is a dict of lists (units, lr, dropout, batch_size). DEFAULT_SPACE
+can be replaced by a JSON file; `n_trials` configurations are sampled from its grid.
+"""
+import itertools
+import json
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from multiprocessing import get_context
+
+import numpy as np
+
+from training_scheduler import core_budget
+
+DEFAULT_SPACE = {
+    'units': [(64, 32), (128, 64), (256, 128), (256, 128, 64), (512, 256, 128)],
+    'lr': [3e-4, 1e-3, 3e-3],
+    'dropout': [0.0, 0.1, 0.2],
+    'batch_size': [32, 64],
+}
+DEFAULT_TRIALS = 24
+DEFAULT_MIN_EPOCHS = 4
+DEFAULT_ETA = 3
+
+_DATA = {}
+
+
+def load_space(path=None):
+    """Candidate space from a JSON file ({"units": [[128, 64], ...], "lr": [...], ...})"""
+    if not path:
+        return dict(DEFAULT_SPACE)
+    with open(path, 'r', encoding='utf-8') as fh:
+        space = json.load(fh)
+    if 'units' in space:
+        space['units'] = [tuple(u) for u in space['units']]
+    return dict(DEFAULT_SPACE, **space)
+
+
+def sample_configs(space, n_trials=DEFAULT_TRIALS, seed=42):
+    """Up to n_trials distinct configurations from the grid of `space` (all of it if smaller)"""
+    names = list(space)
+    grid = [dict(zip(names, values)) for values in itertools.product(*(space[n] for n in names))]
+    if n_trials >= len(grid):
+        return grid
+    return random.Random(seed).sample(grid, n_trials)
+
+
+def rung_epochs(min_epochs, max_epochs, eta):
+    rungs, epochs = [], min_epochs
+    while epochs < max_epochs:
+        rungs.append(epochs)
+        epochs *= eta
+    return rungs + [max_epochs]
+
+
+def build_keras_model(input_dim, units=(128, 64), lr=0.001, dropout=0.0):
+    import tensorflow as tf
+    tf.keras.backend.clear_session()
+    inputs = tf.keras.layers.Input(shape=(input_dim,))
+    x = inputs
+    for u in units:
+        x = tf.keras.layers.Dense(u, activation='relu')(x)
+        if dropout and dropout > 0:
+            x = tf.keras.layers.Dropout(dropout)(x)
+    outputs = tf.keras.layers.Dense(1, activation=None)(x)
+    model = tf.keras.Model(inputs=inputs, outputs=outputs)
+    model.compile(optimizer=tf.keras.optimizers.Adam(learning_rate=lr), loss='mse')
+    return model
+
+
+def _init_worker(n_threads, X_train, y_train, X_val, y_val):
+    # Thread limits must be set before TensorFlow creates its pools
+    for var in ('OMP_NUM_THREADS', 'TF_NUM_INTRAOP_THREADS', 'TF_NUM_INTEROP_THREADS'):
+        os.environ[var] = str(n_threads)
+    os.environ.setdefault('TF_CPP_MIN_LOG_LEVEL', '2')
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(n_threads)
+    tf.config.threading.set_inter_op_parallelism_threads(n_threads)
+    _DATA.update(X_train=X_train, y_train=y_train, X_val=X_val, y_val=y_val)
+
+
+def _run_rung(trial_id, config, path, epochs_done, epochs_target, seed):
+    """Train one trial from epochs_done to epochs_target; returns (trial_id, epochs, rmse, seconds)"""
+    import tensorflow as tf
+    start = time.perf_counter()
+    if epochs_done:
+        model = tf.keras.models.load_model(path)
+    else:
+        tf.keras.utils.set_random_seed(seed + trial_id)
+        model = build_keras_model(_DATA['X_train'].shape[1], units=config['units'],
+                                  lr=config['lr'], dropout=config['dropout'])
+    model.fit(_DATA['X_train'], _DATA['y_train'], initial_epoch=epochs_done, epochs=epochs_target,
+              batch_size=config.get('batch_size', 32), verbose=0)
+    model.save(path)
+    preds = model.predict(_DATA['X_val'], verbose=0).reshape(-1)
+    rmse = float(np.sqrt(np.mean((preds - _DATA['y_val']) ** 2)))
+    return trial_id, epochs_target, rmse, time.perf_counter() - start
+
+
+class ASHASweep:
+    """Asynchronous successive halving over `configs` on a process pool.
+
+        sweep = ASHASweep(configs, max_epochs=100)
+        best = sweep.run(X_train, y_train, X_val, y_val)
+        model = sweep.load_best()
+    """
+
+    def __init__(self, configs, max_epochs=100, min_epochs=DEFAULT_MIN_EPOCHS, eta=DEFAULT_ETA,
+                 n_cores=None, max_workers=None, work_dir=None, seed=42):
+        self.configs = list(configs)
+        self.rungs = rung_epochs(min(min_epochs, max_epochs), max_epochs, eta)
+        self.eta = eta
+        self.n_cores = core_budget(n_cores)
+        self.workers = max(1, min(self.n_cores, len(self.configs), max_workers or self.n_cores))
+        self.threads = max(1, self.n_cores // self.workers)
+        self.work_dir = work_dir or tempfile.mkdtemp(prefix='keras_sweep_')
+        self.seed = seed
+        # trial_id -> {'config', 'path', 'epochs' (deepest rung done), 'rmse' (there), 'history': [(epochs, rmse)]}
+        self.trials = {}
+        self.rung_results = [dict() for _ in self.rungs]  # rung -> {trial_id: rmse}
+        self.promoted = [set() for _ in self.rungs]
+        self.elapsed = 0.0
+
+    def _next_job(self, running):
+        # Promote from the highest rung that has a trial in its top 1/eta not yet promoted
+        for k in range(len(self.rungs) - 2, -1, -1):
+            results = self.rung_results[k]
+            n_top = len(results) // self.eta
+            ranked = sorted(results, key=results.get)[:n_top]
+            for trial_id in ranked:
+                if trial_id not in self.promoted[k] and trial_id not in running:
+                    self.promoted[k].add(trial_id)
+                    return trial_id, k + 1
+        # Otherwise start a new trial at the bottom rung
+        if len(self.trials) < len(self.configs):
+            trial_id = len(self.trials)
+            self.trials[trial_id] = {'config': self.configs[trial_id], 'epochs': 0, 'rmse': None, 'history': [],
+                                     'path': os.path.join(self.work_dir, f'trial_{trial_id}.keras')}
+            return trial_id, 0
+        return None
+
+    def run(self, X_train, y_train, X_val, y_val):
+        """Run the sweep; returns the best trial dict (deepest rung first, then holdout RMSE)"""
+        start = time.perf_counter()
+        print(f"ASHA sweep: {len(self.configs)} configurations, rungs at {self.rungs} epochs, "
+              f"{self.workers} worker(s) x {self.threads} thread(s)")
+        args = (self.threads, X_train, y_train, X_val, y_val)
+        with ProcessPoolExecutor(self.workers, mp_context=get_context('spawn'),
+                                 initializer=_init_worker, initargs=args) as pool:
+            running = {}
+            while True:
+                while len(running) < self.workers:
+                    job = self._next_job(set(running.values()))
+                    if job is None:
+                        break
+                    trial_id, rung = job
+                    trial = self.trials[trial_id]
+                    future = pool.submit(_run_rung, trial_id, trial['config'], trial['path'],
+                                         trial['epochs'], self.rungs[rung], self.seed)
+                    running[future] = trial_id
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    del running[future]
+                    trial_id, epochs, rmse, seconds = future.result()
+                    trial = self.trials[trial_id]
+                    trial.update(epochs=epochs, rmse=rmse)
+                    trial['history'].append((epochs, rmse))
+                    self.rung_results[self.rungs.index(epochs)][trial_id] = rmse
+                    print(f"  trial {trial_id:3d} {trial['config']} epoch {epochs:4d}: "
+                          f"holdout RMSE {rmse:.4f} ({seconds:.1f}s)")
+        self.elapsed = time.perf_counter() - start
+        return self.best()
+
+    def best(self):
+        scored = [t for t in self.trials.values() if t['rmse'] is not None]
+        return min(scored, key=lambda t: (-t['epochs'], t['rmse'])) if scored else None
+
+    def load_best(self):
+        import tensorflow as tf
+        return tf.keras.models.load_model(self.best()['path'])
+
+    def report(self):
+        epochs = sum(t['epochs'] for t in self.trials.values())
+        full = len(self.trials) * self.rungs[-1]
+        lines = [f"{len(self.trials)} trials, {epochs} epochs trained of {full} without pruning "
+                 f"({1 - epochs / max(full, 1):.0%} pruned), {self.elapsed:.1f}s wall"]
+        for k, epochs_k in enumerate(self.rungs):
+            results = self.rung_results[k]
+            if results:
+                lines.append(f"  rung {epochs_k:4d} epochs: {len(results):3d} trials, best RMSE {min(results.values()):.4f}")
+        return '\n'.join(lines)
@@ -0,0 +1,187 @@
+"""
+Content-addressed on-disk cache of fitted models and their CV/test results.
+
+A fitted model is keyed by everything that determines it: a fingerprint of the training
+and test data (which also covers the feature list), the model family and base estimator,
+the hyperparameter grid and search mode, the scaler and the library versions. Each entry
+is a directory holding:
+
+    model.joblib      the fitted estimator (uncompressed so NumPy arrays can be memory-mapped)
+    predictions.npy   its predictions on the test split
+    oof.npy           its out-of-fold CV predictions on the training split, if recorded
+    meta.json         family, best params, CV score, search cost, ...
+
+Hits are returned as CachedFit handles: the metadata and predictions are read right away,
+and the estimator itself is only unpickled (with mmap_mode='r') the first time it is used.
+LazyModels is a dict that resolves such handles on access, so code indexing
+analyzer.models never notices the difference.
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+import sklearn
+
+DEFAULT_CACHE_DIR = os.path.join('.ml_cache', 'models')
+# Entries kept per model family; older data states are pruned on write
+MAX_ENTRIES = 4
+
+
+def data_fingerprint(*frames):
+    """Stable digest of the given DataFrames/Series/arrays (values, columns and order)"""
+    digest = hashlib.sha256()
+    for frame in frames:
+        if isinstance(frame, pd.DataFrame):
+            digest.update(json.dumps([str(c) for c in frame.columns]).encode('utf-8'))
+        if isinstance(frame, (pd.DataFrame, pd.Series)):
+            digest.update(pd.util.hash_pandas_object(frame, index=False).values.tobytes())
+        else:
+            digest.update(np.ascontiguousarray(frame).tobytes())
+    return digest.hexdigest()
+
+
+def _slug(name):
+    return re.sub(r'[^0-9a-z]+', '_', name.lower()).strip('_')
+
+
+def _jsonable(value):
+    if isinstance(value, dict):
+        return {str(k): _jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(v) for v in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return repr(value)
+
+
+class CachedFit:
+    """Cache hit: metadata/predictions now, the estimator on first access"""
+
+    def __init__(self, key, path, meta, predictions, oof_predictions=None):
+        self.key = key
+        self.path = path
+        self.meta = meta
+        self.predictions = predictions
+        self.oof_predictions = oof_predictions
+        self._model = None
+
+    @property
+    def model(self):
+        if self._model is None:
+            self._model = joblib.load(os.path.join(self.path, 'model.joblib'), mmap_mode='r')
+        return self._model
+
+
+class LazyModels(dict):
+    """dict of name -> estimator whose CachedFit values are loaded when first read"""
+
+    def __getitem__(self, name):
+        value = super().__getitem__(name)
+        if isinstance(value, CachedFit):
+            value = value.model
+            super().__setitem__(name, value)
+        return value
+
+    def get(self, name, default=None):
+        return self[name] if name in self else default
+
+    def values(self):
+        return [self[name] for name in self]
+
+    def items(self):
+        return [(name, self[name]) for name in self]
+
+
+class ModelCache:
+    """Directory of fitted-model entries addressed by key()"""
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, enabled=True):
+        self.cache_dir = cache_dir
+        self.enabled = enabled
+
+    def key(self, name, **parts):
+        """Key for model `name` fitted under `parts` (data fingerprint, params, ...)"""
+        payload = dict(parts, name=name, sklearn=sklearn.__version__)
+        blob = json.dumps(_jsonable(payload), sort_keys=True)
+        return f"{_slug(name)}-{hashlib.sha256(blob.encode('utf-8')).hexdigest()[:20]}"
+
+    def load(self, key):
+        """CachedFit for `key`, or None on a miss/unreadable entry"""
+        if not self.enabled:
+            return None
+        path = os.path.join(self.cache_dir, key)
+        try:
+            with open(os.path.join(path, 'meta.json'), 'r', encoding='utf-8') as fh:
+                meta = json.load(fh)
+            predictions, oof_predictions = (
+                np.load(p, mmap_mode='r').view(np.ndarray) if os.path.exists(p) else None
+                for p in (os.path.join(path, 'predictions.npy'), os.path.join(path, 'oof.npy'))
+            )
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"Ignoring unreadable model cache entry {key} ({e})")
+            return None
+        os.utime(path)
+        return CachedFit(key, path, meta, predictions, oof_predictions)
+
+    def latest(self, name, **match):
+        """Most recently used entry of model `name` whose meta.json matches `match`, or None"""
+        if not self.enabled or not os.path.isdir(self.cache_dir):
+            return None
+        family = _slug(name)
+        entries = [d for d in os.listdir(self.cache_dir) if d.rsplit('-', 1)[0] == family]
+        entries.sort(key=lambda d: os.path.getmtime(os.path.join(self.cache_dir, d)), reverse=True)
+        for key in entries:
+            try:
+                with open(os.path.join(self.cache_dir, key, 'meta.json'), 'r', encoding='utf-8') as fh:
+                    meta = json.load(fh)
+            except (OSError, ValueError):
+                continue
+            if all(meta.get(k) == _jsonable(v) for k, v in match.items()):
+                return self.load(key)
+        return None
+
+    def save(self, key, model, meta, predictions=None, oof_predictions=None):
+        """Store a fitted model (atomic rename); failures are reported, not raised"""
+        if not self.enabled:
+            return None
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            final_dir = os.path.join(self.cache_dir, key)
+            tmp_dir = tempfile.mkdtemp(prefix=f".{key}-", dir=self.cache_dir)
+            try:
+                joblib.dump(model, os.path.join(tmp_dir, 'model.joblib'))
+                for filename, array in (('predictions.npy', predictions), ('oof.npy', oof_predictions)):
+                    if array is not None:
+                        np.save(os.path.join(tmp_dir, filename), np.asarray(array), allow_pickle=False)
+                with open(os.path.join(tmp_dir, 'meta.json'), 'w', encoding='utf-8') as fh:
+                    json.dump(_jsonable(dict(meta, saved_at=time.time())), fh, indent=2)
+                if os.path.isdir(final_dir):
+                    shutil.rmtree(final_dir, ignore_errors=True)
+                os.replace(tmp_dir, final_dir)
+            except Exception:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+                raise
+            self._prune(key.rsplit('-', 1)[0], keep=final_dir)
+            return final_dir
+        except Exception as e:
+            print(f"Failed to write model cache (non-critical): {e}")
+            return None
+
+    def _prune(self, family, keep, max_entries=MAX_ENTRIES):
+        entries = [os.path.join(self.cache_dir, d) for d in os.listdir(self.cache_dir)
+                   if d.rsplit('-', 1)[0] == family and os.path.isdir(os.path.join(self.cache_dir, d))]
+        entries.sort(key=os.path.getmtime, reverse=True)
+        for path in entries[max_entries:]:
+            if path != keep:
+                shutil.rmtree(path, ignore_errors=True)
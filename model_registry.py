@@ -0,0 +1,195 @@
+"""
+Versioned on-disk registry of the model used for forecasting.
+
+run_complete_analysis() publishes its best model as a new version under
+.ml_cache/registry/, with everything a forecast needs and nothing else:
+
+    vNNNN/model.joblib   the fitted estimator (uncompressed, memory-mapped on load)
+    vNNNN/scaler.joblib  its fitted input scaler, if any
+    vNNNN/history.npy    the known daily sales the recursive features start from
+    vNNNN/meta.json      model name, feature order, metrics, EMA state and the data
+                         watermark (last sale date and row count of store_sales)
+    LATEST               name of the newest complete version (replaced atomically)
+
+load() plus RegisteredModel.forecast() run the same recursive loop as
+SalesMLAnalyzer.predict_future_sales without touching the training code, so
+tools/run_python_predict.py answers in well under a second. is_stale() compares the
+watermark with the DB to tell when a retrain would see new data.
+"""
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import MinMaxScaler, StandardScaler
+
+from date_dimension import DateDimension
+from feature_engine import FEATURE_VERSION, StreamingFeatureState
+
+DEFAULT_REGISTRY_DIR = os.path.join('.ml_cache', 'registry')
+LATEST_FILE = 'LATEST'
+# Versions kept; older ones are pruned on publish
+MAX_VERSIONS = 5
+
+
+def scale_row(scaler, row):
+    """Apply a fitted scaler to one feature row without building a DataFrame"""
+    if scaler is None:
+        return row
+    if isinstance(scaler, StandardScaler):
+        out = row - scaler.mean_ if scaler.with_mean else row.copy()
+        return out / scaler.scale_ if scaler.with_std else out
+    if isinstance(scaler, MinMaxScaler):
+        return row * scaler.scale_ + scaler.min_
+    return scaler.transform(row.reshape(1, -1))[0]
+
+
+def recursive_forecast(model, scaler, history, feature_names, future_dates, ema_means=None, calendar=None,
+                       dtype=np.float64):
+    """Roll `model` forward one day at a time over `future_dates`, feeding each prediction
+    back into the next day's features (StreamingFeatureState over the known `history`)"""
+    future_dates = pd.DatetimeIndex(future_dates)
+    state = StreamingFeatureState(history, feature_names, ema_means=ema_means, dtype=dtype)
+    state.start(future_dates.to_numpy(), calendar=calendar)
+    predictions = np.empty(len(future_dates), dtype=float)
+    for i in range(len(future_dates)):
+        X_future = scale_row(scaler, state.row(i)).reshape(1, -1)
+        pred = float(model.predict(X_future)[0])
+        predictions[i] = pred
+        state.push(pred)
+    return predictions
+
+
+def db_watermark(db_path, table='store_sales'):
+    """(last sale_date, row count) of the sales table"""
+    with sqlite3.connect(db_path) as conn:
+        last, rows = conn.execute(f"SELECT MAX(sale_date), COUNT(*) FROM {table}").fetchone()
+    return (None if last is None else str(last)[:10]), int(rows)
+
+
+def calendar_for(db_path, future_dates):
+    """Calendar for the horizon with the app's holidays joined in (none if unavailable)"""
+    if not db_path or not os.path.exists(db_path):
+        return DateDimension(future_dates[0], future_dates[-1])
+    try:
+        with sqlite3.connect(db_path) as conn:
+            return DateDimension.from_db(conn, future_dates[0], future_dates[-1])
+    except Exception as e:
+        print(f"Could not load holidays (non-critical): {e}")
+        return DateDimension(future_dates[0], future_dates[-1])
+
+
+class RegisteredModel:
+    """A published version: metadata right away, the estimator on first use (memory-mapped)"""
+
+    def __init__(self, path, meta):
+        self.path = path
+        self.meta = meta
+        self.version = meta['version']
+        self._model = None
+        self._scaler = None
+
+    @property
+    def model(self):
+        if self._model is None:
+            self._model = joblib.load(os.path.join(self.path, 'model.joblib'), mmap_mode='r')
+        return self._model
+
+    @property
+    def scaler(self):
+        path = os.path.join(self.path, 'scaler.joblib')
+        if self._scaler is None and os.path.exists(path):
+            self._scaler = joblib.load(path)
+        return self._scaler
+
+    def is_stale(self, db_path):
+        """True if store_sales has changed since this version's data watermark"""
+        try:
+            last, rows = db_watermark(db_path)
+        except Exception as e:
+            print(f"Could not read the DB watermark (non-critical): {e}")
+            return False
+        mark = self.meta['watermark']
+        return last != mark['last_sale_date'] or rows != mark['rows']
+
+    def forecast(self, days_ahead=30, db_path=None):
+        """DataFrame (date, predicted_sales) for the days after the watermark"""
+        last_date = pd.Timestamp(self.meta['watermark']['last_sale_date'])
+        future_dates = pd.date_range(start=last_date + pd.Timedelta(days=1), periods=days_ahead)
+        predictions = recursive_forecast(
+            self.model, self.scaler, np.load(os.path.join(self.path, 'history.npy')),
+            self.meta['feature_cols'], future_dates,
+            ema_means={int(span): mean for span, mean in self.meta['ema_means'].items()},
+            calendar=calendar_for(db_path, future_dates), dtype=np.dtype(self.meta['row_dtype']))
+        return pd.DataFrame({'date': future_dates, 'predicted_sales': predictions})
+
+
+class ModelRegistry:
+    """Directory of numbered model versions with a LATEST pointer"""
+
+    def __init__(self, root=DEFAULT_REGISTRY_DIR):
+        self.root = root
+
+    def latest_version(self):
+        try:
+            with open(os.path.join(self.root, LATEST_FILE), 'r', encoding='utf-8') as fh:
+                return fh.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def versions(self):
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(d for d in os.listdir(self.root) if d.startswith('v') and d[1:].isdigit())
+
+    def load(self, version=None):
+        """RegisteredModel for `version` (default: the latest), or None if there is none"""
+        version = version or self.latest_version()
+        if version is None:
+            return None
+        path = os.path.join(self.root, version)
+        try:
+            with open(os.path.join(path, 'meta.json'), 'r', encoding='utf-8') as fh:
+                meta = json.load(fh)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable registry version {version} ({e})")
+            return None
+        if meta.get('feature_version') != FEATURE_VERSION:
+            print(f"Registry version {version} was built for feature version {meta.get('feature_version')}")
+            return None
+        return RegisteredModel(path, meta)
+
+    def publish(self, model, scaler, history, meta):
+        """Store a new version and point LATEST at it; failures are reported, not raised"""
+        try:
+            os.makedirs(self.root, exist_ok=True)
+            existing = self.versions()
+            version = f"v{int(existing[-1][1:]) + 1 if existing else 1:04d}"
+            tmp_dir = tempfile.mkdtemp(prefix=f".{version}-", dir=self.root)
+            try:
+                joblib.dump(model, os.path.join(tmp_dir, 'model.joblib'))
+                if scaler is not None:
+                    joblib.dump(scaler, os.path.join(tmp_dir, 'scaler.joblib'))
+                np.save(os.path.join(tmp_dir, 'history.npy'), np.asarray(history, dtype=float), allow_pickle=False)
+                with open(os.path.join(tmp_dir, 'meta.json'), 'w', encoding='utf-8') as fh:
+                    json.dump(dict(meta, version=version, feature_version=FEATURE_VERSION,
+                                   published_at=time.time()), fh, indent=2)
+                os.replace(tmp_dir, os.path.join(self.root, version))
+            except Exception:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+                raise
+            pointer = os.path.join(self.root, f".{LATEST_FILE}.tmp")
+            with open(pointer, 'w', encoding='utf-8') as fh:
+                fh.write(version)
+            os.replace(pointer, os.path.join(self.root, LATEST_FILE))
+            for old in self.versions()[:-MAX_VERSIONS]:
+                shutil.rmtree(os.path.join(self.root, old), ignore_errors=True)
+            return version
+        except Exception as e:
+            print(f"Failed to publish model to the registry (non-critical): {e}")
+            return None
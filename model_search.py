@@ -0,0 +1,270 @@
+"""
+Hyperparameter search modes for SalesMLAnalyzer.train_models.
+
+ - 'grid':    exhaustive GridSearchCV (the original behaviour).
+ - 'halving': successive halving (HalvingGridSearchCV). All candidates start on a small
+              resource and only the best third survive each round with 3x more of it. The
+              resource is `n_estimators` for ensembles whose grid has it, else training rows.
+ - 'bayes':   Gaussian-process search over the same grid with expected improvement,
+              stopped after a total budget of CV fits.
+
+Boosting families (Gradient Boosting, XGBoost, LightGBM) do not search `n_estimators` as a
+separate axis in 'grid' and 'bayes' mode. Each configuration of the other parameters is
+trained once per fold, up to the largest n_estimators, with early stopping on the fold's
+validation split, and every candidate value is scored from that one fit (boosting_cv.py).
+
+Every mode returns a SearchOutcome exposing best_estimator_/best_params_/best_score_ like
+the sklearn search objects, plus the number of CV fits and the wall time spent. When the
+folds run in-process (n_jobs=1, as in tune_family), it also carries the best configuration's
+out-of-fold predictions on the training rows, recorded while scoring. Rows that never fall
+in a validation fold are NaN. The ensembles are built from these (see ensembles.py).
+
+With a `deadline` (epoch seconds, see training_budget.py) the bayes and staged searches stop
+proposing configurations once it has passed. They keep the best one scored so far and mark
+the outcome as truncated. Grid and halving searches always run to completion.
+"""
+import itertools
+import time
+
+import numpy as np
+import pandas as pd
+from scipy.stats import norm
+from sklearn.base import clone
+from sklearn.experimental import enable_halving_search_cv  # noqa: F401  (registers HalvingGridSearchCV)
+from sklearn.gaussian_process import GaussianProcessRegressor
+from sklearn.gaussian_process.kernels import RBF, ConstantKernel, WhiteKernel
+from sklearn.metrics import mean_squared_error
+from sklearn.model_selection import GridSearchCV, HalvingGridSearchCV, TimeSeriesSplit, cross_val_score
+
+from boosting_cv import staged_cv_scores, supports_staged_cv
+from training_scheduler import pin_threads
+
+SEARCH_MODES = ('grid', 'halving', 'bayes')
+# Default total number of CV fits (configurations x folds) for the bayes mode
+DEFAULT_FIT_BUDGET = 100
+HALVING_FACTOR = 3
+# Random configurations evaluated before the GP starts proposing
+BAYES_INITIAL_POINTS = 4
+
+
+class SearchOutcome:
+    """Result of one search: the refit best estimator plus cost accounting"""
+
+    def __init__(self, mode, best_estimator, best_params, best_score, n_fits, elapsed, oof_predictions=None,
+                 truncated=False):
+        self.mode = mode
+        self.best_estimator_ = best_estimator
+        self.best_params_ = best_params
+        self.best_score_ = best_score
+        self.n_fits = n_fits
+        self.elapsed = elapsed
+        self.oof_predictions = oof_predictions
+        self.truncated = truncated
+
+    def summary(self):
+        return {'mode': self.mode, 'n_fits': self.n_fits, 'seconds': self.elapsed, 'truncated': self.truncated}
+
+
+def _config_key(params):
+    return repr(sorted(params.items()))
+
+
+class OOFRecorder:
+    """neg-MSE scorer that also keeps every scored configuration's out-of-fold predictions.
+
+    Validation rows are placed by the index labels of the y Series, so it only records when
+    y is a Series with a unique index, and only in-process: joblib workers score copies.
+    """
+
+    def __init__(self, y, keys):
+        self.keys = list(keys)
+        self.index = y.index if isinstance(y, pd.Series) and y.index.is_unique else None
+        self.n_samples = len(y)
+        self.predictions = {}
+
+    def __call__(self, estimator, X, y):
+        pred = estimator.predict(X)
+        if self.index is not None and isinstance(y, pd.Series):
+            params = estimator.get_params()
+            key = _config_key({k: params[k] for k in self.keys})
+            oof = self.predictions.setdefault(key, np.full(self.n_samples, np.nan))
+            oof[self.index.get_indexer(y.index)] = pred
+        return -mean_squared_error(y, pred)
+
+    def get(self, params):
+        return self.predictions.get(_config_key({k: params[k] for k in self.keys}))
+
+
+def grid_size(params):
+    return int(np.prod([len(v) for v in params.values()])) if params else 1
+
+
+def search(estimator, params, X, y, cv, mode='grid', scoring='neg_mean_squared_error',
+           fit_budget=DEFAULT_FIT_BUDGET, n_jobs=-1, random_state=42, deadline=None):
+    """Tune `estimator` over the `params` grid with the given search mode"""
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"Unknown search mode: {mode} (expected one of {SEARCH_MODES})")
+    start = time.perf_counter()
+    n_splits = cv.get_n_splits()
+    if mode != 'halving' and supports_staged_cv(estimator, params, scoring):
+        return _staged(estimator, params, X, y, cv, mode, fit_budget, n_jobs, random_state, start, deadline)
+    if scoring == 'neg_mean_squared_error':
+        scoring = OOFRecorder(y, params)
+    if mode == 'grid' or grid_size(params) <= 1:
+        gs = GridSearchCV(estimator, params, cv=cv, scoring=scoring, n_jobs=n_jobs, verbose=0)
+        gs.fit(X, y)
+        return SearchOutcome('grid', gs.best_estimator_, gs.best_params_, gs.best_score_,
+                             grid_size(params) * n_splits, time.perf_counter() - start,
+                             _recorded(scoring, gs.best_params_))
+    if mode == 'halving':
+        return _halving(estimator, params, X, y, cv, scoring, n_jobs, random_state, start)
+    return _bayes(estimator, params, X, y, cv, scoring, fit_budget, n_jobs, random_state, start, deadline)
+
+
+def _past(deadline):
+    return deadline is not None and time.time() >= deadline
+
+
+def _staged(estimator, params, X, y, cv, mode, fit_budget, n_jobs, random_state, start, deadline=None):
+    """grid/bayes search of a boosting model with n_estimators covered by staged CV"""
+    params = dict(params)
+    n_values = sorted(params.pop('n_estimators'))
+    n_splits = cv.get_n_splits()
+
+    oof = {}
+
+    def evaluate(config):
+        model = clone(estimator).set_params(**config)
+        scores, predictions = staged_cv_scores(model, n_values, X, y, cv, n_jobs=n_jobs)
+        best = int(np.argmax(scores))
+        config = dict(config, n_estimators=n_values[best])
+        oof[_config_key(config)] = predictions[best]
+        return scores[best], config
+
+    if mode == 'grid':
+        names, trials = list(params), []
+        for values in itertools.product(*params.values()):
+            if trials and _past(deadline):
+                break
+            trials.append(evaluate(dict(zip(names, values))))
+        truncated = len(trials) < grid_size(params)
+    else:
+        # The budget still counts fold fits, but each one now scores len(n_values) grid points
+        trials, truncated = _bayes_trials(params, evaluate, n_splits, fit_budget, random_state, deadline)
+    valid = [t for t in trials if np.isfinite(t[0])]
+    if not valid:
+        raise RuntimeError(f"Every configuration failed during {mode} search")
+    best_score, best_params = max(valid, key=lambda t: t[0])
+    best_model = clone(estimator).set_params(**best_params).fit(X, y)
+    return SearchOutcome(mode, best_model, best_params, best_score, len(trials) * n_splits,
+                         time.perf_counter() - start, oof[_config_key(best_params)], truncated)
+
+
+def _halving(estimator, params, X, y, cv, scoring, n_jobs, random_state, start):
+    params = dict(params)
+    if 'n_estimators' in params and 'learning_rate' not in params:
+        # Bagged forests: grow the ensemble only for the configurations that survive each
+        # round. Boosting is halved on rows instead, since few trees favour high learning rates.
+        resource, max_resources = 'n_estimators', max(params.pop('n_estimators'))
+    else:
+        resource, max_resources = 'n_samples', 'auto'
+    hs = HalvingGridSearchCV(
+        estimator, params, cv=cv, scoring=scoring, factor=HALVING_FACTOR,
+        resource=resource, max_resources=max_resources, min_resources='exhaust',
+        n_jobs=n_jobs, random_state=random_state, verbose=0, return_train_score=False,
+    )
+    hs.fit(X, y)
+    n_fits = int(np.sum(hs.n_candidates_)) * cv.get_n_splits()
+    # The best candidate's last scoring round used the full resource, so its record is complete
+    return SearchOutcome('halving', hs.best_estimator_, hs.best_params_, hs.best_score_,
+                         n_fits, time.perf_counter() - start, _recorded(scoring, hs.best_params_))
+
+
+def _bayes(estimator, params, X, y, cv, scoring, fit_budget, n_jobs, random_state, start, deadline=None):
+    def evaluate(config):
+        model = clone(estimator).set_params(**config)
+        score = cross_val_score(model, X, y, cv=cv, scoring=scoring, n_jobs=n_jobs).mean()
+        return score, config
+
+    n_splits = cv.get_n_splits()
+    trials, truncated = _bayes_trials(params, evaluate, n_splits, fit_budget, random_state, deadline)
+    valid = [t for t in trials if np.isfinite(t[0])]
+    if not valid:
+        raise RuntimeError("Every configuration failed during bayes search")
+    best_score, best_params = max(valid, key=lambda t: t[0])
+    best_model = clone(estimator).set_params(**best_params).fit(X, y)
+    return SearchOutcome('bayes', best_model, best_params, best_score, len(trials) * n_splits,
+                         time.perf_counter() - start, _recorded(scoring, best_params), truncated)
+
+
+def _recorded(scoring, params):
+    return scoring.get(params) if isinstance(scoring, OOFRecorder) else None
+
+
+def _bayes_trials(params, evaluate, n_splits, fit_budget, random_state, deadline=None):
+    """GP-guided walk over the `params` grid; returns ([(score, params), ...] per trial, truncated).
+    evaluate(config) -> (CV score, params actually scored) runs one configuration.
+    """
+    names = list(params)
+    grid = list(itertools.product(*(range(len(params[n])) for n in names)))
+    # Each parameter is placed on [0, 1] by its position in the (ordered) grid list
+    coords = np.array([[i / max(len(params[n]) - 1, 1) for i, n in zip(point, names)] for point in grid])
+    n_trials = max(1, min(len(grid), fit_budget // n_splits))
+    rng = np.random.default_rng(random_state)
+
+    tried, scores, trials = [], [], []
+    for trial in range(n_trials):
+        if trials and _past(deadline):
+            break
+        if trial < BAYES_INITIAL_POINTS:
+            remaining = [i for i in range(len(grid)) if i not in tried]
+            point = int(rng.choice(remaining))
+        else:
+            point = _propose(coords, tried, scores, random_state)
+        score, scored_params = evaluate({n: params[n][i] for n, i in zip(names, grid[point])})
+        tried.append(point)
+        scores.append(score if np.isfinite(score) else np.nan)
+        trials.append((scores[-1], scored_params))
+    return trials, len(trials) < n_trials
+
+
+def _propose(coords, tried, scores, random_state):
+    """Untried grid point with the highest expected improvement under a GP fit to the scores"""
+    observed = [(p, s) for p, s in zip(tried, scores) if s == s]
+    untried = [i for i in range(len(coords)) if i not in set(tried)]
+    if len(observed) < 2:
+        return int(np.random.default_rng(random_state + len(tried)).choice(untried))
+    X_obs = coords[[p for p, _ in observed]]
+    y_obs = np.array([s for _, s in observed])
+    kernel = ConstantKernel(1.0) * RBF(length_scale=0.5) + WhiteKernel(1e-3)
+    gp = GaussianProcessRegressor(kernel=kernel, normalize_y=True, random_state=random_state)
+    gp.fit(X_obs, y_obs)
+    candidates = np.array(untried)
+    mu, sigma = gp.predict(coords[candidates], return_std=True)
+    best = y_obs.max()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = (mu - best) / sigma
+        ei = np.where(sigma > 0, (mu - best) * norm.cdf(z) + sigma * norm.pdf(z), 0.0)
+    return int(candidates[np.argmax(ei)])
+
+
+def expected_fits(params, mode, fit_budget=DEFAULT_FIT_BUDGET, n_splits=5):
+    """Rough CV-fit count of a search, used to start the most expensive families first"""
+    size = grid_size(params)
+    if mode != 'halving' and 'learning_rate' in params and len(params.get('n_estimators', ())) > 1:
+        # Boosting grids: one staged fit per fold covers the n_estimators axis
+        size //= len(params['n_estimators'])
+    if mode == 'bayes':
+        return min(size, max(1, fit_budget // n_splits)) * n_splits
+    if mode == 'halving':
+        return max(1, size // HALVING_FACTOR) * n_splits * 2
+    return size * n_splits
+
+
+def tune_family(model, params, X, y, mode, fit_budget=DEFAULT_FIT_BUDGET, n_splits=5, n_threads=1, deadline=None):
+    """Scheduler job: search one model family with its threads pinned to n_threads.
+    CV folds run sequentially inside the job; parallelism comes from running families concurrently.
+    """
+    estimator = pin_threads(clone(model), n_threads)
+    return search(estimator, params, X, y, TimeSeriesSplit(n_splits=n_splits), mode=mode,
+                  fit_budget=fit_budget, n_jobs=1, deadline=deadline)
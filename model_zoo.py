@@ -0,0 +1,99 @@
+"""
+Size-aware selection of the super-linear model families.
+
+SVR (O(n^2)-O(n^3) time), Kernel Ridge (a dense n x n kernel) and the Gaussian process
+(O(n^3) time, n x n memory) are fine on a year of daily sales but dominate runtime, or
+run out of memory, on multi-year / multi-store histories. For the current training size
+size_policy() decides per family:
+
+ - exact:       the kernel fits in KERNEL_MEMORY_LIMIT and the estimated seconds per CV fit
+                (TimingHistory: past timings or priors, see training_budget.py) stay under
+                MAX_EXACT_FIT_SECONDS;
+ - approximate: a Nystroem feature map (NYSTROEM_COMPONENTS landmarks) feeding a linear
+                solver, linear in rows. Not offered for the Gaussian process;
+ - skip:        even the approximation is estimated above MAX_FIT_SECONDS per CV fit.
+
+Approximations run as their own families ('SVR (Nystroem)', ...) with the original grid
+mapped onto the pipeline, so their timings and cache entries stay separate.
+"""
+from sklearn.kernel_approximation import Nystroem
+from sklearn.linear_model import Ridge
+from sklearn.pipeline import Pipeline
+from sklearn.svm import LinearSVR
+
+EXACT, APPROXIMATE, SKIP = 'exact', 'approximate', 'skip'
+KERNEL_MEMORY_LIMIT = 1 << 30  # bytes of one float64 n x n kernel matrix
+MAX_EXACT_FIT_SECONDS = 20.0
+MAX_FIT_SECONDS = 60.0
+NYSTROEM_COMPONENTS = 500
+# Super-linear families -> name of their scalable approximation (None: exact or skipped)
+KERNEL_FAMILIES = {
+    'SVR': 'SVR (Nystroem)',
+    'Kernel Ridge': 'Kernel Ridge (Nystroem)',
+    'Gaussian Process': None,
+}
+
+
+def _gammas(values, n_features):
+    # 'scale'/'auto' are 1 / (n_features * X.var()); inputs are standardized, so var ~ 1
+    out = []
+    for g in values:
+        g = 1.0 / n_features if g in ('scale', 'auto') else g
+        if g not in out:
+            out.append(g)
+    return out
+
+
+def approximate_family(name, config, rows, n_features):
+    """Nystroem + linear-solver version of a kernel family with its grid mapped onto it"""
+    params = config['params']
+    nystroem = Nystroem(n_components=min(NYSTROEM_COMPONENTS, max(rows // 2, 1)), random_state=42)
+    if name == 'SVR':
+        model = Pipeline([('nystroem', nystroem), ('svr', LinearSVR(max_iter=5000, random_state=42))])
+        grid = {'nystroem__gamma': _gammas(params.get('gamma', ['scale']), n_features),
+                'svr__C': params.get('C', [1.0]),
+                'svr__epsilon': params.get('epsilon', [0.0])}
+    elif name == 'Kernel Ridge':
+        model = Pipeline([('nystroem', nystroem), ('ridge', Ridge())])
+        grid = {'nystroem__kernel': params.get('kernel', ['rbf']),
+                'nystroem__gamma': _gammas(params.get('gamma', ['scale']), n_features),
+                'ridge__alpha': params.get('alpha', [1.0])}
+    else:
+        raise ValueError(f"No scalable approximation for {name}")
+    return dict(config, model=model, params=grid)
+
+
+def size_policy(models_config, rows, n_features, history):
+    """Return (models_config for this training size, decisions) with kernel families kept
+    exact, swapped for their approximation or dropped. Each decision is a dict with
+    family, choice, name (the family that runs) and est_seconds (per CV fit).
+    """
+    config, decisions = {}, []
+    for name, family in models_config.items():
+        if name not in KERNEL_FAMILIES:
+            config[name] = family
+            continue
+        est = history.seconds_per_fit(name, rows, n_features)
+        approx_name = KERNEL_FAMILIES[name]
+        if rows * rows * 8 <= KERNEL_MEMORY_LIMIT and est <= MAX_EXACT_FIT_SECONDS:
+            choice, run_name = EXACT, name
+            config[name] = family
+        elif approx_name is not None:
+            est = history.seconds_per_fit(approx_name, rows, n_features)
+            choice, run_name = (APPROXIMATE, approx_name) if est <= MAX_FIT_SECONDS else (SKIP, None)
+            if run_name:
+                config[run_name] = approximate_family(name, family, rows, n_features)
+        else:
+            choice, run_name = SKIP, None
+        decisions.append({'family': name, 'choice': choice, 'name': run_name, 'rows': rows, 'est_seconds': est})
+    return config, decisions
+
+
+def format_decisions(decisions, actual=None):
+    """Table of size-policy decisions; `actual` maps run name -> measured seconds per CV fit"""
+    lines = [f"{'family':<18} {'choice':<12} {'runs as':<24} {'est s/fit':>10} {'actual s/fit':>13}"]
+    for d in decisions:
+        measured = (actual or {}).get(d['name'])
+        lines.append(f"{d['family']:<18} {d['choice']:<12} {d['name'] or '-':<24} {d['est_seconds']:>10.3f} "
+                     f"{'' if measured is None else f'{measured:.3f}':>13}")
+    return '\n'.join(lines)
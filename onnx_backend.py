@@ -0,0 +1,354 @@
+"""
+ONNX export of a fitted scaler + regressor as one graph, and an ONNX Runtime backend for
+the recursive forecast.
+
+fused_onnx() converts Pipeline([scaler, model]) with skl2onnx, so the graph takes the raw
+engineered features (float32, training column order) and applies the fitted scaling
+itself. Consumers (the Flutter app, OnnxModel) no longer reproduce scaler_params.json.
+
+OnnxModel wraps one InferenceSession for the whole forecast. Single-row predicts, the
+recursive loop's only call, go through an IO binding over a preallocated (1, F) input
+and output buffer, so a step copies one row in and reads one float out without
+allocating. Larger batches use a plain session.run.
+
+check_parity() runs a converted graph over real feature rows and compares it with the
+sklearn model. The export and the ONNX backend refuse graphs that drift by more than
+PARITY_RTOL (e.g. a Gaussian process with a tiny alpha, whose float32 kernel solve is
+off by hundreds of sales units).
+
+XGBoost and LightGBM regressors have no skl2onnx converters of their own;
+register_boosting_converters() registers the onnxmltools ones (pip install onnxmltools).
+
+write_variants() runs the offline optimization stage on an exported graph and writes
+sales_forecast*.onnx variants next to it, each timed in ONNX Runtime:
+
+    sales_forecast_opt.onnx      basic ORT optimizations: constant folding and redundant
+                                 node elimination (portable to any ORT build)
+    sales_forecast_fused.onnx    extended ORT optimizations: node fusions (CPU provider)
+    sales_forecast_fp16.onnx     float16 weights and math for the standard ONNX ops (MatMul,
+                                 Add, Exp, ...), with Casts where they meet the float32
+                                 parts: inputs/outputs, the fused scaling stage, ai.onnx.ml
+                                 ops and Scan bodies. Only for graphs that have such ops
+                                 (MLP, GP, ...), not for tree ensembles
+    sales_forecast_compact.onnx  tree ensembles without the attributes the runtime ignores
+                                 (nodes_hitrates) or that equal their defaults
+
+Sizes, load time, per-inference latency and the largest deviation from the original graph
+go to sales_forecast_variants.json. The app keeps loading sales_forecast.onnx.
+
+onnxruntime is optional (pip install onnxruntime); importing this module does not need it.
+"""
+import copy
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+from sklearn.pipeline import Pipeline
+
+# ai.onnx.ml is pinned to v3, the newest the onnxmltools boosting converters emit
+TARGET_OPSET = {'': 15, 'ai.onnx.ml': 3}
+VARIANTS_FILE = 'sales_forecast_variants.json'
+# A variant whose outputs differ from the original graph by more than this fraction of the
+# largest prediction (or are not finite, e.g. fp16 overflow) is discarded
+VARIANT_RTOL = 1e-3
+# Same rule for the converted graph itself against model.predict
+PARITY_RTOL = 1e-3
+# Standard ops the fp16 variant computes in float16 (ONNX Runtime's CPU provider has
+# float16 kernels for all of them)
+FP16_OPS = frozenset(['Add', 'Sub', 'Mul', 'Div', 'MatMul', 'Gemm', 'Relu', 'Tanh', 'Sigmoid', 'Exp', 'Neg',
+                      'Sqrt', 'Abs', 'Pow', 'ReduceSum', 'Max', 'Min', 'Transpose', 'Identity'])
+_CONVERTERS_REGISTERED = False
+
+
+def register_boosting_converters():
+    """Register the onnxmltools converters for XGBRegressor/LGBMRegressor with skl2onnx.
+    Returns False (and leaves those families unconvertible) if onnxmltools is missing."""
+    global _CONVERTERS_REGISTERED
+    if _CONVERTERS_REGISTERED:
+        return True
+    try:
+        from skl2onnx import update_registered_converter
+        from skl2onnx.common.shape_calculator import calculate_linear_regressor_output_shapes
+        from onnxmltools.convert.lightgbm.operator_converters.LightGbm import convert_lightgbm
+        from onnxmltools.convert.xgboost.operator_converters.XGBoost import convert_xgboost
+    except ImportError:
+        return False
+    try:
+        from xgboost import XGBRegressor
+        update_registered_converter(XGBRegressor, 'XGBoostXGBRegressor',
+                                    calculate_linear_regressor_output_shapes, convert_xgboost)
+    except ImportError:
+        pass
+    try:
+        from lightgbm import LGBMRegressor
+        update_registered_converter(LGBMRegressor, 'LightGbmLGBMRegressor',
+                                    calculate_linear_regressor_output_shapes, convert_lightgbm,
+                                    options={'split': None})
+    except ImportError:
+        pass
+    _CONVERTERS_REGISTERED = True
+    return True
+
+
+def fused_onnx(model, scaler, n_features, target_opset=TARGET_OPSET):
+    """ONNX ModelProto computing model.predict(scaler.transform(X)) on raw float32 X"""
+    from skl2onnx import convert_sklearn
+    from skl2onnx.common.data_types import FloatTensorType
+
+    register_boosting_converters()
+    if hasattr(model, 'get_booster') and model.get_booster().feature_names is not None:
+        # The XGBoost converter only understands the default f0, f1, ... feature names
+        model = copy.deepcopy(model)
+        model.get_booster().feature_names = None
+    estimator = model if scaler is None else Pipeline([('scaler', scaler), ('model', model)])
+    initial_type = [('input', FloatTensorType([None, n_features]))]
+    return convert_sklearn(estimator, initial_types=initial_type, target_opset=target_opset)
+
+
+def check_parity(onx, model, scaler, X, rtol=PARITY_RTOL):
+    """Largest |difference| between the graph and model.predict(scaler.transform(X)) on the
+    raw feature rows X; raises ValueError above `rtol` of the largest prediction"""
+    expected = np.asarray(model.predict(X if scaler is None else scaler.transform(X)), dtype=float).reshape(-1)
+    actual = OnnxModel(onx).predict(np.asarray(X, dtype=np.float32))
+    diff = float(np.max(np.abs(actual - expected)))
+    if not np.isfinite(diff) or diff > rtol * max(float(np.max(np.abs(expected))), 1.0):
+        raise ValueError(f"ONNX graph differs from the model by up to {diff:.4g}")
+    return diff
+
+
+class OnnxModel:
+    """sklearn-style predict() over an ONNX Runtime session (model bytes, proto or path)"""
+
+    def __init__(self, onnx_model, n_threads=1):
+        import onnxruntime as ort
+
+        if hasattr(onnx_model, 'SerializeToString'):
+            onnx_model = onnx_model.SerializeToString()
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = n_threads
+        options.inter_op_num_threads = 1
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(onnx_model, options, providers=['CPUExecutionProvider'])
+        inp, out = self.session.get_inputs()[0], self.session.get_outputs()[0]
+        self.input_name, self.output_name = inp.name, out.name
+        self.n_features = inp.shape[1]
+        # Preallocated single-row buffers bound once; OrtValues share the NumPy memory
+        self._x = np.zeros((1, self.n_features), dtype=np.float32)
+        self._y = np.zeros((1, 1) if len(out.shape) == 2 else (1,), dtype=np.float32)
+        self._binding = self.session.io_binding()
+        self._binding.bind_ortvalue_input(self.input_name, ort.OrtValue.ortvalue_from_numpy(self._x))
+        self._binding.bind_ortvalue_output(self.output_name, ort.OrtValue.ortvalue_from_numpy(self._y))
+
+    def predict_row(self, row):
+        """Prediction for one raw feature row"""
+        self._x[0] = row
+        self.session.run_with_iobinding(self._binding)
+        return float(self._y.flat[0])
+
+    def predict(self, X):
+        X = np.asarray(X)
+        if X.ndim == 2 and X.shape[0] == 1:
+            return np.array([self.predict_row(X[0])])
+        out = self.session.run([self.output_name], {self.input_name: np.ascontiguousarray(X, dtype=np.float32)})[0]
+        return out.reshape(-1)
+
+
+def _ort_optimized(onx, level):
+    """The graph ONNX Runtime produces from `onx` at optimization `level`, saved offline"""
+    import onnx
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = level
+    with tempfile.TemporaryDirectory() as tmp:
+        options.optimized_model_filepath = os.path.join(tmp, 'optimized.onnx')
+        ort.InferenceSession(onx.SerializeToString(), options, providers=['CPUExecutionProvider'])
+        return onnx.load(options.optimized_model_filepath)
+
+
+def _tensor_types(onx):
+    """Element type ('tensor(float)', ...) of every top-level tensor, as ONNX Runtime resolves
+    them; onnx shape inference stops at ai.onnx.ml ops such as Scaler"""
+    import onnx
+    import onnxruntime as ort
+
+    probe = onnx.ModelProto()
+    probe.CopyFrom(onx)
+    known = {o.name for o in probe.graph.output}
+    probe.graph.output.extend(onnx.helper.make_empty_tensor_value_info(name)
+                              for node in probe.graph.node for name in node.output
+                              if name and name not in known)
+    session = ort.InferenceSession(probe.SerializeToString(), providers=['CPUExecutionProvider'])
+    types = {v.name: v.type for v in session.get_inputs() + session.get_outputs()}
+    types.update({t.name: 'tensor(float)' if t.data_type == onnx.TensorProto.FLOAT else 'other'
+                  for t in onx.graph.initializer})
+    return types
+
+
+def _subgraph_inputs(graph):
+    """Names read by nodes of the subgraphs (Scan/Loop/If bodies) inside `graph`"""
+    import onnx
+
+    names = set()
+    for node in graph.node:
+        for attr in node.attribute:
+            subgraphs = [attr.g] if attr.type == onnx.AttributeProto.GRAPH else list(attr.graphs)
+            for sub in subgraphs:
+                names.update(n for sub_node in sub.node for n in sub_node.input)
+                names.update(_subgraph_inputs(sub))
+    return names
+
+
+def _fp16(onx):
+    """Copy of `onx` computing its FP16_OPS nodes in float16, with Casts at every boundary
+    to the float32 rest of the graph, or None if no node qualifies. Nodes reading the graph
+    input (the fused scaling stage, raw sales overflow float16) or feeding the output or a
+    subgraph stay float32, as do all other ops."""
+    import onnx
+    from onnx import TensorProto, helper, numpy_helper
+
+    FLOAT = 'tensor(float)'
+    types = _tensor_types(onx)
+    model = onnx.ModelProto()
+    model.CopyFrom(onx)
+    graph = model.graph
+    raw_inputs = {v.name for v in graph.input}
+    pinned = {v.name for v in graph.output} | _subgraph_inputs(graph)
+
+    def is_half(node):
+        return (node.domain in ('', 'ai.onnx') and node.op_type in FP16_OPS
+                and any(types.get(n) == FLOAT for n in node.input)
+                and not raw_inputs.intersection(node.input)
+                and all(types.get(o) == FLOAT and o not in pinned for o in node.output))
+
+    half_nodes = [is_half(node) for node in graph.node]
+    if not any(half_nodes):
+        return None
+    half = {o for node, h in zip(graph.node, half_nodes) if h for o in node.output}
+    readers = {}
+    for node, h in zip(graph.node, half_nodes):
+        for n in node.input:
+            readers.setdefault(n, []).append(h)
+    for init in graph.initializer:
+        # Weights read only by float16 nodes are stored as float16
+        if init.data_type == TensorProto.FLOAT and init.name not in pinned and all(readers.get(init.name, [False])):
+            init.CopyFrom(numpy_helper.from_array(numpy_helper.to_array(init).astype(np.float16), init.name))
+            half.add(init.name)
+
+    casts, nodes = {}, []
+    for node, h in zip(graph.node, half_nodes):
+        for i, n in enumerate(node.input):
+            if types.get(n) != FLOAT or h == (n in half):
+                continue
+            to = TensorProto.FLOAT16 if h else TensorProto.FLOAT
+            if (n, to) not in casts:
+                out = f"{n}_as_{'fp16' if h else 'fp32'}"
+                casts[(n, to)] = out
+                nodes.append(helper.make_node('Cast', [n], [out], name=out, to=to))
+            node.input[i] = casts[(n, to)]
+        nodes.append(node)
+    del graph.node[:]
+    graph.node.extend(nodes)
+    del graph.value_info[:]  # float32 annotations of tensors that are now float16
+    return model
+
+
+def _compact_trees(onx):
+    """Copy of `onx` with tree-ensemble attributes the runtime ignores or that hold their
+    defaults removed, or None if the graph has no tree ensemble"""
+    import onnx
+
+    compact = onnx.ModelProto()
+    compact.CopyFrom(onx)
+    found = False
+    for node in compact.graph.node:
+        if node.op_type not in ('TreeEnsembleRegressor', 'TreeEnsembleClassifier'):
+            continue
+        found = True
+        keep = []
+        for attr in node.attribute:
+            if attr.name == 'nodes_hitrates':
+                continue
+            if attr.name == 'nodes_missing_value_tracks_true' and not any(attr.ints):
+                continue
+            if attr.name == 'base_values' and not any(attr.floats):
+                continue
+            keep.append(attr)
+        del node.attribute[:]
+        node.attribute.extend(keep)
+    return compact if found else None
+
+
+def _measure(onx, sample, reference=None, repeats=200):
+    """(load seconds, median seconds per single-row inference, max |diff| vs reference)"""
+    payload = onx.SerializeToString()
+    loads = []
+    for _ in range(5):
+        start = time.perf_counter()
+        model = OnnxModel(payload)
+        loads.append(time.perf_counter() - start)
+    rows = np.resize(sample, (repeats, sample.shape[1])).astype(np.float32)
+    times = np.empty(repeats)
+    for i, row in enumerate(rows):
+        start = time.perf_counter()
+        model.predict_row(row)
+        times[i] = time.perf_counter() - start
+    preds = model.predict(sample)
+    diff = None if reference is None else float(np.max(np.abs(preds - reference)))
+    return float(np.median(loads)), float(np.median(times)), diff, preds
+
+
+def write_variants(onx, onnx_path, sample):
+    """Write the optimized variants of `onx` next to `onnx_path` (see module docstring),
+    time each on `sample` (raw feature rows) and record the results in VARIANTS_FILE.
+    Returns the list of variant records; a variant that fails is reported and skipped."""
+    import onnxruntime as ort
+
+    out_dir = os.path.dirname(onnx_path) or '.'
+    stem = os.path.splitext(os.path.basename(onnx_path))[0]
+    sample = np.asarray(sample, dtype=np.float32)
+    basic = ort.GraphOptimizationLevel.ORT_ENABLE_BASIC
+    built = {}
+    builders = [
+        ('', lambda: onx),
+        ('_opt', lambda: built.setdefault('opt', _ort_optimized(onx, basic))),
+        ('_fused', lambda: _ort_optimized(onx, ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED)),
+        ('_fp16', lambda: _fp16(built.get('opt') or _ort_optimized(onx, basic))),
+        ('_compact', lambda: _compact_trees(onx)),
+    ]
+    records, reference = [], None
+    for suffix, build in builders:
+        name = f"{stem}{suffix}.onnx"
+        path = os.path.join(out_dir, name)
+        try:
+            variant = build()
+            if variant is None:
+                continue
+            load, latency, diff, preds = _measure(variant, sample, reference)
+            if reference is None:
+                reference = preds
+            elif not np.isfinite(diff) or diff > VARIANT_RTOL * max(np.max(np.abs(reference)), 1.0):
+                print(f"Discarding ONNX variant {name}: outputs differ by {diff:.4g}")
+                if os.path.exists(path):
+                    os.remove(path)
+                continue
+            if suffix:
+                with open(path, 'wb') as fh:
+                    fh.write(variant.SerializeToString())
+            records.append({'file': name, 'bytes': os.path.getsize(path), 'load_ms': load * 1e3,
+                            'latency_us': latency * 1e6, 'max_abs_diff': diff or 0.0})
+        except Exception as e:
+            print(f"Skipping ONNX variant {name} (non-critical): {e}")
+    with open(os.path.join(out_dir, VARIANTS_FILE), 'w', encoding='utf-8') as fh:
+        json.dump(records, fh, indent=2)
+    return records
+
+
+def format_variants(records):
+    lines = [f"{'variant':<32} {'KiB':>9} {'load ms':>8} {'us/row':>8} {'max |diff|':>11}"]
+    for r in records:
+        lines.append(f"{r['file']:<32} {r['bytes'] / 1024:>9.1f} {r['load_ms']:>8.2f} "
+                     f"{r['latency_us']:>8.1f} {r['max_abs_diff']:>11.5f}")
+    return '\n'.join(lines)
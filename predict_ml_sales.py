@@ -3,14 +3,18 @@ import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
 import sqlite3
+import json
+import os
+import time
 from datetime import datetime
 import warnings
 warnings.filterwarnings('ignore')
 
 # Machine Learning Libraries
+from sklearn.base import clone
 from sklearn.model_selection import train_test_split, cross_val_score, GridSearchCV, TimeSeriesSplit
 from sklearn.preprocessing import StandardScaler, LabelEncoder, RobustScaler, MinMaxScaler
-from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor, ExtraTreesRegressor, VotingRegressor
+from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor, ExtraTreesRegressor
 from sklearn.linear_model import LinearRegression, Ridge, Lasso, ElasticNet, HuberRegressor
 from sklearn.metrics import mean_squared_error, mean_absolute_error, r2_score
 from sklearn.tree import DecisionTreeRegressor
@@ -21,6 +25,22 @@ from sklearn.gaussian_process import GaussianProcessRegressor
 from sklearn.gaussian_process.kernels import RBF, WhiteKernel
 from sklearn.pipeline import Pipeline
 
+from date_dimension import DateDimension
+from direct_forecast import DirectForecaster
+from ensembles import ENSEMBLE_NAMES, BlendedEnsemble, fit_meta_learner, nnls_weights
+from feature_cache import cached_feature_frame
+from feature_engine import (ANALYZER_FEATURES, EMA_SPANS, FEATURE_HALO, FEATURE_VERSION, BatchFeatureState,
+                            build_feature_frame, ewm_continue, ewm_state)
+from model_cache import LazyModels, ModelCache, data_fingerprint
+from model_registry import ModelRegistry, db_watermark, recursive_forecast
+from model_zoo import format_decisions, size_policy
+from onnx_backend import OnnxModel, check_parity, format_variants, fused_onnx, write_variants
+from model_search import DEFAULT_FIT_BUDGET, expected_fits, tune_family
+from training_budget import FINISH_RESERVE, TIMINGS_FILE, TimingHistory, format_plan, plan_training
+from training_scheduler import TrainingScheduler, core_budget
+from warm_start import (DEFAULT_EXTRA_ROUNDS, DEFAULT_EXTRA_TREES, DEFAULT_RECENT_DAYS, WARM_MODES, warm_kind,
+                        warm_update)
+
 try:
     import importlib
     skl2onnx = importlib.import_module('skl2onnx')
@@ -49,16 +69,13 @@ except ImportError:
     LIGHTGBM_AVAILABLE = False
     print("LightGBM not available. Install with: pip install lightgbm")
 
-try:
-    from sklearn.ensemble import StackingRegressor
-    STACKING_AVAILABLE = True
-except ImportError:
-    STACKING_AVAILABLE = False
-
 # Data source configuration (SQLite)
 DB_PATH = r"C:\\Users\\admin\\Downloads\\Mama_Abbys\\MamaAbbysMNVGMNT\\.dart_tool\\sqflite_common_ffi\\databases\\app.db"
 TABLE_NAME = "store_sales"
 
+# Persisted feature state (pre-dropna frame + high-water mark) for incremental loads
+CACHE_DIR = ".ml_cache"
+
 # Set style for better plots
 try:
     plt.style.use('seaborn-v0_8')
@@ -74,17 +91,30 @@ except:
     pass  # Use default palette if seaborn palette fails
 
 class SalesMLAnalyzer:
-    def __init__(self, csv_file):
+    def __init__(self, csv_file, db_path=None, cache_dir=None):
         """Initialize the Sales ML Analyzer"""
         self.csv_file = csv_file
+        self.db_path = db_path or DB_PATH
+        self.cache_dir = cache_dir or CACHE_DIR
         self.df = None
         self.X_train = None
         self.X_test = None
         self.y_train = None
         self.y_test = None
         self.scaler = StandardScaler()
-        self.models = {}
+        self.models = LazyModels()  # cached models are unpickled on first access
         self.results = {}
+        self.model_cache = ModelCache(os.path.join(self.cache_dir, 'models'))
+        self.model_keys = {}
+        self.search_settings = {}  # name -> {'mode', 'fit_budget'} its model cache key was built with
+        self.oof_predictions = {}  # name -> out-of-fold CV predictions on the training rows
+        self.data_fingerprint = None
+        self.training_stats = None  # core budget/utilization of the last train_models run
+        self.training_plan = None  # per-family plan of the last time-budgeted train_models run
+        self.budget_report = None
+        self.zoo_decisions = []  # exact/approximate/skip choice per kernel family (see model_zoo.py)
+        self.direct_forecasters = {}  # (family, days_ahead) -> fitted DirectForecaster
+        self.onnx_models = {}  # family -> OnnxModel session for backend='onnx'
         self.plot_enabled = True  # Flag to enable/disable plotting
     
     def safe_plot(self, fig, filename=None):
@@ -98,123 +128,183 @@ class SalesMLAnalyzer:
         finally:
             plt.close(fig)
         
-    def load_and_preprocess_data(self):
-        """Load and preprocess the sales data with advanced feature engineering"""
-        print("Loading and preprocessing data with advanced feature engineering...")
-        
-        # Load from SQLite store_sales instead of CSV
-        with sqlite3.connect(DB_PATH) as conn:
-            query = f"""
-                SELECT
-                    id,
-                    sale_date,
-                    day_of_week,
-                    month,
-                    holiday_flag,
-                    sales
-                FROM {TABLE_NAME}
-                ORDER BY sale_date
-            """
-            self.df = pd.read_sql_query(query, conn)
-        
+    def _read_store_sales(self, conn, watermark=None):
+        """Read store_sales rows, optionally only those past a (sale_date, id) watermark"""
+        query = f"""
+            SELECT
+                id,
+                sale_date,
+                day_of_week,
+                month,
+                holiday_flag,
+                sales
+            FROM {TABLE_NAME}
+        """
+        params = ()
+        if watermark is not None:
+            query += " WHERE sale_date > ? OR (sale_date = ? AND id > ?)"
+            params = (watermark['sale_date'], watermark['sale_date'], watermark['id'])
+        query += " ORDER BY sale_date, id"
+        return pd.read_sql_query(query, conn, params=params)
+
+    @staticmethod
+    def _normalize_raw(df):
+        """Normalize the raw store_sales schema types coming from the DB"""
         # Convert sale_date to datetime (auto-parse)
-        self.df['sale_date'] = pd.to_datetime(self.df['sale_date'])
+        df['sale_date'] = pd.to_datetime(df['sale_date'])
         
         # Normalize schema types from DB
         # Ensure month and holiday_flag are integers
-        self.df['month'] = pd.to_numeric(self.df['month'], errors='coerce').fillna(self.df['sale_date'].dt.month).astype(int)
-        self.df['holiday_flag'] = pd.to_numeric(self.df['holiday_flag'], errors='coerce').fillna(0).astype(int)
+        df['month'] = pd.to_numeric(df['month'], errors='coerce').fillna(df['sale_date'].dt.month).astype(int)
+        df['holiday_flag'] = pd.to_numeric(df['holiday_flag'], errors='coerce').fillna(0).astype(int)
         
         # Ensure day_of_week is mapped to standard names if needed
         # If already names like 'Monday'.. it will map directly below
         # If numeric strings present, convert to names via weekday number
-        dow_series = self.df['day_of_week'].astype(str).str.strip()
+        dow_series = df['day_of_week'].astype(str).str.strip()
         name_candidates = set(['monday','tuesday','wednesday','thursday','friday','saturday','sunday',
                                'Mon','Tue','Wed','Thu','Fri','Sat','Sun','MON','TUE','WED','THU','FRI','SAT','SUN'])
         if not dow_series.str.lower().isin({n.lower() for n in name_candidates}).all():
             # Try convert numerics 0-6 to names
             as_num = pd.to_numeric(dow_series, errors='coerce')
             mapper = {0:'Monday',1:'Tuesday',2:'Wednesday',3:'Thursday',4:'Friday',5:'Saturday',6:'Sunday'}
-            self.df['day_of_week'] = as_num.map(mapper).fillna(self.df['day_of_week'])
-        
-        # Extract comprehensive date features
-        self.df['year'] = self.df['sale_date'].dt.year
-        self.df['day'] = self.df['sale_date'].dt.day
-        self.df['quarter'] = self.df['sale_date'].dt.quarter
-        self.df['weekday'] = self.df['sale_date'].dt.weekday
-        self.df['week_of_year'] = self.df['sale_date'].dt.isocalendar().week
-        self.df['day_of_year'] = self.df['sale_date'].dt.dayofyear
-        self.df['is_weekend'] = (self.df['weekday'] >= 5).astype(int)
-        self.df['is_month_start'] = self.df['sale_date'].dt.is_month_start.astype(int)
-        self.df['is_month_end'] = self.df['sale_date'].dt.is_month_end.astype(int)
-        self.df['is_quarter_start'] = self.df['sale_date'].dt.is_quarter_start.astype(int)
-        self.df['is_quarter_end'] = self.df['sale_date'].dt.is_quarter_end.astype(int)
-        
-        # Encode day_of_week as numerical values
-        day_mapping = {
-            'Monday': 0, 'Tuesday': 1, 'Wednesday': 2, 'Thursday': 3,
-            'Friday': 4, 'Saturday': 5, 'Sunday': 6
+            df['day_of_week'] = as_num.map(mapper).fillna(df['day_of_week'])
+        return df
+
+    @staticmethod
+    def _engineer_features(df):
+        """Add the full engineered feature set (feature_engine.ANALYZER_FEATURES) to a
+        normalized store_sales frame. Every feature only looks backwards at most FEATURE_HALO
+        rows, except the EMAs which are recursive (see feature_engine.ewm_continue for resuming them).
+        """
+        return build_feature_frame(df, ANALYZER_FEATURES)
+
+    def _feature_state_paths(self):
+        return (os.path.join(self.cache_dir, 'store_sales_features.pkl'),
+                os.path.join(self.cache_dir, 'store_sales_watermark.json'))
+
+    def _load_feature_state(self):
+        """Load the persisted pre-dropna feature frame and its high-water mark, if valid"""
+        frame_path, wm_path = self._feature_state_paths()
+        if not (os.path.exists(frame_path) and os.path.exists(wm_path)):
+            return None, None
+        try:
+            with open(wm_path, 'r', encoding='utf-8') as fh:
+                watermark = json.load(fh)
+            if (watermark.get('db_path') != os.path.abspath(self.db_path)
+                    or watermark.get('feature_version') != FEATURE_VERSION):
+                return None, None
+            frame = pd.read_pickle(frame_path)
+            if len(frame) != watermark.get('row_count'):
+                return None, None
+            return frame, watermark
+        except Exception as e:
+            print(f"Ignoring unreadable feature state ({e})")
+            return None, None
+
+    def _save_feature_state(self, frame, ema_state, last_sale_date):
+        """Persist the pre-dropna feature frame and the (sale_date, id) high-water mark"""
+        frame_path, wm_path = self._feature_state_paths()
+        watermark = {
+            'db_path': os.path.abspath(self.db_path),
+            'feature_version': FEATURE_VERSION,
+            # Raw DB string so the next WHERE clause compares like for like
+            'sale_date': last_sale_date,
+            'id': int(frame['id'].iloc[-1]),
+            'row_count': int(len(frame)),
+            'ema': {str(span): list(state) for span, state in ema_state.items()},
         }
-        self.df['day_of_week_encoded'] = self.df['day_of_week'].map(day_mapping)
-        
-        # Create advanced cyclical features
-        self.df['month_sin'] = np.sin(2 * np.pi * self.df['month'] / 12)
-        self.df['month_cos'] = np.cos(2 * np.pi * self.df['month'] / 12)
-        self.df['day_sin'] = np.sin(2 * np.pi * self.df['day'] / 31)
-        self.df['day_cos'] = np.cos(2 * np.pi * self.df['day'] / 31)
-        self.df['weekday_sin'] = np.sin(2 * np.pi * self.df['weekday'] / 7)
-        self.df['weekday_cos'] = np.cos(2 * np.pi * self.df['weekday'] / 7)
-        self.df['quarter_sin'] = np.sin(2 * np.pi * self.df['quarter'] / 4)
-        self.df['quarter_cos'] = np.cos(2 * np.pi * self.df['quarter'] / 4)
-        self.df['week_sin'] = np.sin(2 * np.pi * self.df['week_of_year'] / 52)
-        self.df['week_cos'] = np.cos(2 * np.pi * self.df['week_of_year'] / 52)
-        
-        # Create comprehensive lag features
-        for lag in [1, 2, 3, 7, 14, 21, 30]:
-            self.df[f'sales_lag{lag}'] = self.df['sales'].shift(lag)
-        
-        # Create rolling statistics with multiple windows
-        for window in [3, 7, 14, 21, 30]:
-            self.df[f'sales_ma{window}'] = self.df['sales'].rolling(window=window).mean()
-            self.df[f'sales_std{window}'] = self.df['sales'].rolling(window=window).std()
-            self.df[f'sales_min{window}'] = self.df['sales'].rolling(window=window).min()
-            self.df[f'sales_max{window}'] = self.df['sales'].rolling(window=window).max()
-            self.df[f'sales_median{window}'] = self.df['sales'].rolling(window=window).median()
-        
-        # Create exponential moving averages
-        for span in [7, 14, 30]:
-            self.df[f'sales_ema{span}'] = self.df['sales'].ewm(span=span).mean()
-        
-        # Create trend features
-        self.df['sales_diff1'] = self.df['sales'].diff(1)
-        self.df['sales_diff7'] = self.df['sales'].diff(7)
-        self.df['sales_pct_change1'] = self.df['sales'].pct_change(1)
-        self.df['sales_pct_change7'] = self.df['sales'].pct_change(7)
-        
-        # Create interaction features
-        self.df['month_holiday'] = self.df['month'] * self.df['holiday_flag']
-        self.df['weekday_holiday'] = self.df['weekday'] * self.df['holiday_flag']
-        self.df['is_weekend_holiday'] = self.df['is_weekend'] * self.df['holiday_flag']
-        
-        # Create polynomial features for key variables
-        self.df['month_squared'] = self.df['month'] ** 2
-        self.df['weekday_squared'] = self.df['weekday'] ** 2
-        self.df['day_squared'] = self.df['day'] ** 2
-        
-        # Create ratio features
-        self.df['sales_to_ma7_ratio'] = self.df['sales'] / (self.df['sales_ma7'] + 1e-8)
-        self.df['sales_to_ma30_ratio'] = self.df['sales'] / (self.df['sales_ma30'] + 1e-8)
-        self.df['ma7_to_ma30_ratio'] = self.df['sales_ma7'] / (self.df['sales_ma30'] + 1e-8)
-        
-        # Create volatility features
-        self.df['sales_volatility_7'] = self.df['sales'].rolling(window=7).std() / (self.df['sales'].rolling(window=7).mean() + 1e-8)
-        self.df['sales_volatility_30'] = self.df['sales'].rolling(window=30).std() / (self.df['sales'].rolling(window=30).mean() + 1e-8)
-        
-        # Create seasonal decomposition features (simplified)
-        self.df['sales_detrended'] = self.df['sales'] - self.df['sales_ma30']
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            frame.to_pickle(frame_path)
+            with open(wm_path, 'w', encoding='utf-8') as fh:
+                json.dump(watermark, fh, indent=2)
+        except Exception as e:
+            print(f"Failed to persist feature state (non-critical): {e}")
+
+    def _build_full_feature_frame(self, conn):
+        raw = self._read_store_sales(conn)
+        last_sale_date = str(raw['sale_date'].iloc[-1]) if len(raw) else None
+        frame = self._engineer_features(self._normalize_raw(raw))
+        ema_state = {span: ewm_state(frame['sales'].values, span) for span in EMA_SPANS}
+        return frame, ema_state, last_sale_date
+
+    def _update_feature_frame(self, conn, frame, watermark):
+        """Append rows newer than the watermark, recomputing only them plus a FEATURE_HALO-row halo.
+        Returns None when the table changed behind the watermark (backfill/delete) so the caller rebuilds.
+        """
+        behind = conn.execute(
+            f"SELECT COUNT(*) FROM {TABLE_NAME} WHERE sale_date < ? OR (sale_date = ? AND id <= ?)",
+            (watermark['sale_date'], watermark['sale_date'], watermark['id'])
+        ).fetchone()[0]
+        if behind != watermark['row_count']:
+            print("store_sales changed behind the watermark; falling back to a full rebuild")
+            return None
+
+        new_raw = self._read_store_sales(conn, watermark)
+        ema_state = {int(span): tuple(state) for span, state in watermark['ema'].items()}
+        if new_raw.empty:
+            print("No new store_sales rows since the last run")
+            return frame, ema_state, watermark['sale_date']
+        last_sale_date = str(new_raw['sale_date'].iloc[-1])
+        new_raw = self._normalize_raw(new_raw)
+
+        # Recompute the new rows together with the trailing halo they look back into
+        raw_cols = list(new_raw.columns)
+        halo = frame[raw_cols].iloc[-FEATURE_HALO:]
+        block = pd.concat([halo, new_raw], ignore_index=True)
+        block = self._engineer_features(block).iloc[len(halo):]
+        block.index = pd.RangeIndex(len(frame), len(frame) + len(block))
+
+        # EMAs are recursive over the whole history, so resume them from the saved state
+        for span in EMA_SPANS:
+            mean, weight = ema_state[span]
+            values, mean, weight = ewm_continue(block['sales'].values, span, mean, weight)
+            block[f'sales_ema{span}'] = values
+            ema_state[span] = (mean, weight)
+
+        print(f"Incremental update: {len(block)} new rows (halo {len(halo)})")
+        frame = pd.concat([frame, block[frame.columns]])
+        return frame, ema_state, last_sale_date
+
+    def _build_feature_frame(self, conn, incremental):
+        updated = None
+        if incremental:
+            frame, watermark = self._load_feature_state()
+            if frame is not None:
+                updated = self._update_feature_frame(conn, frame, watermark)
+            else:
+                print("No usable feature state found; running a full rebuild")
+        if updated is None:
+            updated = self._build_full_feature_frame(conn)
+        frame, ema_state, last_sale_date = updated
+        if len(frame):
+            self._save_feature_state(frame, ema_state, last_sale_date)
         
         # Drop rows with NaN values from lag features
-        self.df = self.df.dropna()
+        return frame.dropna()
+
+    def load_and_preprocess_data(self, incremental=False, use_cache=True):
+        """Load and preprocess the sales data with advanced feature engineering.
+        With incremental=True only rows past the persisted (sale_date, id) watermark are
+        fetched and engineered; the result matches a full rebuild
+        (checked by tools/check_incremental_parity.py).
+        With use_cache=True the finished frame is shared through feature_cache, keyed by
+        the store_sales fingerprint, so later runs on an unchanged DB skip engineering.
+        """
+        print("Loading and preprocessing data with advanced feature engineering...")
+        
+        # Load from SQLite store_sales instead of CSV
+        with sqlite3.connect(self.db_path) as conn:
+            if use_cache:
+                self.df = cached_feature_frame(
+                    conn, 'analyzer', FEATURE_VERSION,
+                    lambda: self._build_feature_frame(conn, incremental),
+                    cache_dir=os.path.join(self.cache_dir, 'features'),
+                    table=TABLE_NAME
+                )
+            else:
+                self.df = self._build_feature_frame(conn, incremental)
         
         print(f"Data shape after advanced preprocessing: {self.df.shape}")
         print(f"Date range: {self.df['sale_date'].min()} to {self.df['sale_date'].max()}")
@@ -347,6 +437,9 @@ class SalesMLAnalyzer:
         self.X_train_scaled = self.X_train_standard
         self.X_test_scaled = self.X_test_standard
         
+        # Identifies the split (values, feature list, order) in model cache keys
+        self.data_fingerprint = data_fingerprint(self.X_train, self.X_test, self.y_train, self.y_test)
+        
         print(f"Training set shape: {self.X_train.shape}")
         print(f"Test set shape: {self.X_test.shape}")
         print(f"Number of features: {len(feature_cols)}")
@@ -354,28 +447,30 @@ class SalesMLAnalyzer:
         
         return self.X_train, self.X_test, self.y_train, self.y_test
     
-    def train_models(self):
-        """Train advanced machine learning models with hyperparameter tuning"""
-        print("\n" + "="*50)
-        print("TRAINING ADVANCED MACHINE LEARNING MODELS")
-        print("="*50)
-        
+    def get_models_config(self):
+        """Model families with their hyperparameter grids, input scaler and search mode.
+
+        This is the full zoo; train_models() applies the size policy (model_zoo.py) once per
+        run, and the scaler each trained family used is kept in self.results."""
         # Define base models with hyperparameter grids
         models_config = {
             'Ridge Regression': {
                 'model': Ridge(),
                 'params': {'alpha': [0.01, 0.1, 1.0, 10.0, 100.0]},
-                'scaler': 'standard'
+                'scaler': 'standard',
+                'search': 'grid'
             },
             'Lasso Regression': {
                 'model': Lasso(),
                 'params': {'alpha': [0.001, 0.01, 0.1, 1.0, 10.0]},
-                'scaler': 'standard'
+                'scaler': 'standard',
+                'search': 'grid'
             },
             'ElasticNet': {
                 'model': ElasticNet(),
                 'params': {'alpha': [0.001, 0.01, 0.1, 1.0], 'l1_ratio': [0.1, 0.5, 0.7, 0.9]},
-                'scaler': 'standard'
+                'scaler': 'standard',
+                'search': 'grid'
             },
             'Random Forest': {
                 'model': RandomForestRegressor(random_state=42),
@@ -385,7 +480,8 @@ class SalesMLAnalyzer:
                     'min_samples_split': [2, 5, 10],
                     'min_samples_leaf': [1, 2, 4]
                 },
-                'scaler': 'none'
+                'scaler': 'none',
+                'search': 'halving'
             },
             'Extra Trees': {
                 'model': ExtraTreesRegressor(random_state=42),
@@ -394,7 +490,8 @@ class SalesMLAnalyzer:
                     'max_depth': [10, 20, None],
                     'min_samples_split': [2, 5, 10]
                 },
-                'scaler': 'none'
+                'scaler': 'none',
+                'search': 'halving'
             },
             'Gradient Boosting': {
                 'model': GradientBoostingRegressor(random_state=42),
@@ -404,7 +501,8 @@ class SalesMLAnalyzer:
                     'max_depth': [3, 5, 7],
                     'subsample': [0.8, 0.9, 1.0]
                 },
-                'scaler': 'none'
+                'scaler': 'none',
+                'search': 'bayes'
             },
             'SVR': {
                 'model': SVR(),
@@ -413,7 +511,8 @@ class SalesMLAnalyzer:
                     'gamma': ['scale', 'auto', 0.001, 0.01, 0.1],
                     'epsilon': [0.01, 0.1, 0.2]
                 },
-                'scaler': 'standard'
+                'scaler': 'standard',
+                'search': 'bayes'
             },
             'MLP Regressor': {
                 'model': MLPRegressor(random_state=42, max_iter=1000),
@@ -423,7 +522,8 @@ class SalesMLAnalyzer:
                     'alpha': [0.0001, 0.001, 0.01],
                     'learning_rate': ['constant', 'adaptive']
                 },
-                'scaler': 'minmax'
+                'scaler': 'minmax',
+                'search': 'bayes'
             },
             'Kernel Ridge': {
                 'model': KernelRidge(),
@@ -432,7 +532,8 @@ class SalesMLAnalyzer:
                     'kernel': ['rbf', 'polynomial'],
                     'gamma': [0.001, 0.01, 0.1]
                 },
-                'scaler': 'standard'
+                'scaler': 'standard',
+                'search': 'grid'
             }
         }
         
@@ -447,7 +548,8 @@ class SalesMLAnalyzer:
                     'subsample': [0.8, 0.9, 1.0],
                     'colsample_bytree': [0.8, 0.9, 1.0]
                 },
-                'scaler': 'none'
+                'scaler': 'none',
+                'search': 'bayes'
             }
         
         # Add LightGBM if available
@@ -461,81 +563,307 @@ class SalesMLAnalyzer:
                     'subsample': [0.8, 0.9, 1.0],
                     'colsample_bytree': [0.8, 0.9, 1.0]
                 },
-                'scaler': 'none'
+                'scaler': 'none',
+                'search': 'bayes'
             }
+        return models_config
+    
+    def scaled_inputs(self, scaler):
+        """(X_train, X_test) for a models_config scaler name"""
+        if scaler == 'standard':
+            return self.X_train_standard, self.X_test_standard
+        if scaler == 'robust':
+            return self.X_train_robust, self.X_test_robust
+        if scaler == 'minmax':
+            return self.X_train_minmax, self.X_test_minmax
+        return self.X_train, self.X_test  # none
+    
+    def fitted_scaler(self, scaler):
+        """Fitted scaler object for a models_config scaler name (None for raw features)"""
+        return {'standard': self.scaler_standard, 'robust': self.scaler_robust,
+                'minmax': self.scaler_minmax}.get(scaler)
+    
+    def scaler_for_model(self, name):
+        """Fitted scaler the model family `name` was trained with (None for raw features and ensembles)"""
+        return self.fitted_scaler(self.results.get(name, {}).get('scaler'))
+    
+    def train_models(self, search=None, fit_budget=DEFAULT_FIT_BUDGET, n_cores=None, use_cache=True, time_budget=None):
+        """Train advanced machine learning models with hyperparameter tuning.
+
+        Each family declares its search mode in models_config ('grid', 'halving' or 'bayes',
+        see model_search.py); `search` overrides it for every family (search='grid' runs the
+        original exhaustive GridSearchCV). `fit_budget` caps the CV fits of bayes searches.
+        Families run concurrently within `n_cores` (default: $SALES_ML_CORES or all CPUs).
+        With `use_cache`, families already fitted on the same data/grid/search settings are
+        loaded from the model cache instead of being retrained.
+        With `time_budget` (seconds), families are run, shrunk or skipped by expected value
+        per second so tuning finishes within the budget (see training_budget.py).
+        """
+        print("\n" + "="*50)
+        print("TRAINING ADVANCED MACHINE LEARNING MODELS")
+        print("="*50)
         
-        # Train and tune models
+        history = TimingHistory(os.path.join(self.cache_dir, TIMINGS_FILE))
+        rows, n_features = self.X_train.shape
+        # Kernel families run exactly, approximated or not at all depending on the data size.
+        # Decided once here: the timings recorded below must not change this run's zoo.
+        models_config, self.zoo_decisions = size_policy(self.get_models_config(), rows, n_features, history)
+        print(f"Model zoo for {rows} training rows:")
+        print(format_decisions(self.zoo_decisions))
+        
+        self.model_cache.enabled = use_cache
+        self.direct_forecasters = {}
+        self.onnx_models = {}
+        pending = {}
         for name, config in models_config.items():
-            print(f"\nTraining and tuning {name}...")
-            
-            # Select appropriate scaler
-            if config['scaler'] == 'standard':
-                X_train_use = self.X_train_standard
-                X_test_use = self.X_test_standard
-            elif config['scaler'] == 'robust':
-                X_train_use = self.X_train_robust
-                X_test_use = self.X_test_robust
-            elif config['scaler'] == 'minmax':
-                X_train_use = self.X_train_minmax
-                X_test_use = self.X_test_minmax
-            else:  # none
-                X_train_use = self.X_train
-                X_test_use = self.X_test
-            
-            # Use TimeSeriesSplit for cross-validation
-            tscv = TimeSeriesSplit(n_splits=5)
-            
-            # Grid search with time series cross-validation
-            grid_search = GridSearchCV(
-                config['model'], 
-                config['params'], 
-                cv=tscv, 
-                scoring='neg_mean_squared_error',
-                n_jobs=-1,
-                verbose=0
-            )
-            
-            # Fit the model
-            grid_search.fit(X_train_use, self.y_train)
+            mode = search or config.get('search', 'grid')
+            if not self._load_cached_family(name, config, mode, fit_budget):
+                pending[name] = (config['params'], mode)
+        
+        # Deadline mode: decide per family whether to run it fully, shrunk or not at all
+        plan, deadline = {}, None
+        self.training_plan = None
+        if time_budget is not None and pending:
+            deadline = time.time() + time_budget
+            self.training_plan = plan_training(pending, history, rows, n_features, time_budget,
+                                               core_budget(n_cores), fit_budget=fit_budget,
+                                               must_run=not self.results)
+            plan = {entry['name']: entry for entry in self.training_plan}
+            print(f"Time budget {time_budget:.0f}s, plan by expected value per second:")
+            print(format_plan(self.training_plan))
+        
+        # Tune the families concurrently on the core budget (see training_scheduler.py)
+        jobs = []
+        for name, (params, mode) in pending.items():
+            config, budget, priority = models_config[name], fit_budget, None
+            entry = plan.get(name)
+            if entry is not None:
+                if entry['action'] == 'skipped':
+                    continue
+                mode, budget = entry['mode'], entry['fit_budget']
+                priority = entry['value'] / max(entry['est_seconds'], 1e-6)
+                if entry['action'] == 'shrunk' and self._load_cached_family(name, config, mode, budget):
+                    continue
+            X_train_use, _ = self.scaled_inputs(config['scaler'])
+            jobs.append((name, tune_family, {
+                'model': config['model'],
+                'params': params,
+                'X': X_train_use,
+                'y': self.y_train,
+                'mode': mode,
+                'fit_budget': budget,
+                'deadline': deadline
+            }, priority if priority is not None else expected_fits(params, mode, budget)))
+        
+        if jobs:
+            with TrainingScheduler(n_cores) as scheduler:
+                print(f"Tuning {len(jobs)} model families on {scheduler.n_cores} core(s)...")
+                for name, grid_search in scheduler.run(jobs):
+                    self._record_tuned_model(name, models_config[name], grid_search)
+                    wall = scheduler.stats['jobs'][name]['wall_seconds']
+                    history.record(name, rows, n_features, grid_search.n_fits, wall,
+                                   np.sqrt(max(-grid_search.best_score_, 0.0)))
+                    if name in plan:
+                        plan[name].update(actual_seconds=wall, truncated=grid_search.truncated)
+            print(f"\n{scheduler.report()}")
+            self.training_stats = scheduler.stats
+            history.save()
+            if self.zoo_decisions:
+                actual = {d['name']: scheduler.stats['jobs'][d['name']]['wall_seconds'] / max(self.results[d['name']]['search']['n_fits'], 1)
+                          for d in self.zoo_decisions if d['name'] in scheduler.stats['jobs']}
+                print("\nModel zoo, estimated vs actual seconds per CV fit:")
+                print(format_decisions(self.zoo_decisions, actual))
+        if self.training_plan:
+            print("\nTime budget outcome:")
+            print(format_plan(self.training_plan))
+        
+        # Create ensemble model if we have multiple good models
+        self.create_ensemble_model()
+    
+    def _load_cached_family(self, name, config, mode, fit_budget):
+        """Record family `name` from the model cache if it holds this search; True on a hit"""
+        self.search_settings[name] = {'mode': mode, 'fit_budget': fit_budget}
+        self.model_keys[name] = self._family_key(name, config, mode, fit_budget)
+        cached = self.model_cache.load(self.model_keys[name])
+        # Entries without OOF predictions cannot feed the ensembles, so they are retrained,
+        # except warm updates (update_models), which never have any
+        if cached is None or (cached.oof_predictions is None
+                              and cached.meta['search'].get('mode') not in WARM_MODES):
+            return False
+        self._record_cached_model(name, cached)
+        return True
+    
+    def _family_key(self, name, config, mode, fit_budget=DEFAULT_FIT_BUDGET):
+        """Model cache key of a tuned family on the current data split"""
+        return self.model_cache.key(
+            name,
+            data=self.data_fingerprint,
+            model=repr(config['model']),
+            params=config['params'],
+            scaler=config['scaler'],
+            mode=mode,
+            fit_budget=fit_budget if mode == 'bayes' else None
+        )
+    
+    def _record_tuned_model(self, name, config, grid_search):
+        """Score a tuned family on the test split, store it and add it to the model cache"""
+        print(f"\nTrained and tuned {name}...")
+        _, X_test_use = self.scaled_inputs(config['scaler'])
+        
+        # Get best model and predictions
+        best_model = grid_search.best_estimator_
+        y_pred = best_model.predict(X_test_use)
+        self._store_results(name, best_model, y_pred, config['scaler'], grid_search.best_params_,
+                            -grid_search.best_score_, grid_search.summary())
+        print(f"  Search: {grid_search.mode}, {grid_search.n_fits} CV fits in {grid_search.elapsed:.1f}s"
+              + (" (stopped at the deadline)" if grid_search.truncated else ""))
+        self.oof_predictions[name] = grid_search.oof_predictions
+        if grid_search.truncated:
+            return  # not the search the cache key describes
+        self.model_cache.save(self.model_keys[name], best_model, {
+            'family': name,
+            'features': list(self.X_train.columns),
+            'scaler': config['scaler'],
+            'best_params': grid_search.best_params_,
+            'cv_score': -grid_search.best_score_,
+            'search': grid_search.summary(),
+            'search_settings': self.search_settings[name]
+        }, y_pred, grid_search.oof_predictions)
+    
+    def _record_cached_model(self, name, cached):
+        """Store a model-cache hit; the estimator itself is loaded only when first used"""
+        print(f"\nLoaded {name} from model cache ({cached.key})")
+        meta = cached.meta
+        self.oof_predictions[name] = cached.oof_predictions
+        self._store_results(name, cached, np.asarray(cached.predictions), meta['scaler'], meta['best_params'],
+                            meta['cv_score'], dict(meta['search'], cached=True))
+        if cached.oof_predictions is None:
+            print(f"  {meta['search']['mode'].replace('_', ' ')} update without out-of-fold predictions; "
+                  "excluded from the ensembles")
+    
+    def _store_results(self, name, model, y_pred, scaler, best_params, cv_score, search):
+        # Calculate metrics
+        mse = mean_squared_error(self.y_test, y_pred)
+        mae = mean_absolute_error(self.y_test, y_pred)
+        r2 = r2_score(self.y_test, y_pred)
+        rmse = np.sqrt(mse)
+        
+        # Store results
+        self.models[name] = model
+        self.onnx_models.pop(name, None)
+        self.results[name] = {
+            'MSE': mse,
+            'MAE': mae,
+            'R2': r2,
+            'RMSE': rmse,
+            'predictions': y_pred,
+            'scaler': scaler,  # models_config scaler name the model was trained with
+            'best_params': best_params,
+            'cv_score': cv_score,
+            'search': search
+        }
+        
+        print(f"  Best RMSE: {rmse:.4f}")
+        print(f"  Best MAE: {mae:.4f}")
+        print(f"  Best R²: {r2:.6f}")
+        print(f"  Best params: {best_params}")
+    
+    def update_models(self, families=None, extra_trees=DEFAULT_EXTRA_TREES, extra_rounds=DEFAULT_EXTRA_ROUNDS,
+                      recent_days=DEFAULT_RECENT_DAYS, tolerance=0.02, audit=False):
+        """Nightly warm-start refit of the tree families (see warm_start.py).
+
+        Starts from each family's fitted model (this session, else the latest model cache
+        entry with the same feature list), adds trees/boosting rounds on the updated training
+        split, and keeps the update only if its holdout RMSE is within `tolerance` of the
+        model it started from; otherwise the family is refit from scratch with its tuned
+        parameters. With `audit=True` the full refit is always run so the report shows the
+        accuracy and time cost of the warm update.
+        """
+        print("\n" + "="*50)
+        print("WARM-START MODEL UPDATE")
+        print("="*50)
+        
+        models_config = self.get_models_config()
+        if families is None:
+            families = [name for name, config in models_config.items() if warm_kind(config['model'])]
+        features = list(self.X_train.columns)
+        report = []
+        
+        for name in families:
+            config = models_config[name]
+            X_train_use, X_test_use = self.scaled_inputs(config['scaler'])
+            if name in self.models:
+                base, meta = self.models[name], self.results.get(name, {})
+            else:
+                cached = self.model_cache.latest(name, features=features, scaler=config['scaler'])
+                if cached is None:
+                    print(f"{name}: no previous fit with the current features; run train_models first")
+                    continue
+                base, meta = cached.model, cached.meta
             
-            # Get best model and predictions
-            best_model = grid_search.best_estimator_
-            y_pred = best_model.predict(X_test_use)
+            rmse_before = np.sqrt(mean_squared_error(self.y_test, base.predict(X_test_use)))
+            start = time.perf_counter()
+            updated = warm_update(base, X_train_use, self.y_train, extra_trees=extra_trees,
+                                  extra_rounds=extra_rounds, recent_days=recent_days)
+            update_seconds = time.perf_counter() - start
+            update_pred = updated.predict(X_test_use)
+            rmse_update = np.sqrt(mean_squared_error(self.y_test, update_pred))
+            accepted = rmse_update <= rmse_before * (1 + tolerance)
             
-            # Calculate metrics
-            mse = mean_squared_error(self.y_test, y_pred)
-            mae = mean_absolute_error(self.y_test, y_pred)
-            r2 = r2_score(self.y_test, y_pred)
-            rmse = np.sqrt(mse)
+            rmse_full = full_seconds = np.nan
+            if audit or not accepted:
+                start = time.perf_counter()
+                full = clone(base).fit(X_train_use, self.y_train)
+                full_seconds = time.perf_counter() - start
+                full_pred = full.predict(X_test_use)
+                rmse_full = np.sqrt(mean_squared_error(self.y_test, full_pred))
             
-            # Store results
-            self.models[name] = best_model
-            self.results[name] = {
-                'MSE': mse,
-                'MAE': mae,
-                'R2': r2,
-                'RMSE': rmse,
-                'predictions': y_pred,
-                'best_params': grid_search.best_params_,
-                'cv_score': -grid_search.best_score_
-            }
+            model, y_pred = (updated, update_pred) if accepted else (full, full_pred)
+            action = 'warm_start' if accepted else 'full_refit'
+            search = {'mode': action, 'seconds': update_seconds if accepted else update_seconds + full_seconds,
+                      'rmse_before': rmse_before, 'rmse_update': rmse_update, 'rmse_full': rmse_full}
+            print(f"\n{name}: {action.replace('_', ' ')}")
+            self._store_results(name, model, y_pred, config['scaler'], meta.get('best_params'), meta.get('cv_score'),
+                                search)
             
-            print(f"  Best RMSE: {rmse:.4f}")
-            print(f"  Best MAE: {mae:.4f}")
-            print(f"  Best R²: {r2:.6f}")
-            print(f"  Best params: {grid_search.best_params_}")
-        
-        # Create ensemble model if we have multiple good models
-        self.create_ensemble_model()
+            # The OOF predictions were made by the model before the update, so the family
+            # leaves the ensembles until it is retuned
+            self.oof_predictions[name] = None
+            # Stored under the key train_models built for this family (search override and
+            # time-budget plan included), so the next run picks the update up
+            settings = (self.search_settings.get(name) or meta.get('search_settings')
+                        or {'mode': config.get('search', 'grid'), 'fit_budget': DEFAULT_FIT_BUDGET})
+            self.search_settings[name] = settings
+            self.model_keys[name] = self._family_key(name, config, settings['mode'], settings['fit_budget'])
+            self.model_cache.save(self.model_keys[name], model, {
+                'family': name,
+                'features': features,
+                'scaler': config['scaler'],
+                'best_params': meta.get('best_params'),
+                'cv_score': meta.get('cv_score'),
+                'search': search,
+                'search_settings': settings
+            }, y_pred)
+            report.append({'Model': name, 'Action': action, 'RMSE before': rmse_before,
+                           'RMSE update': rmse_update, 'RMSE full refit': rmse_full,
+                           'Update s': update_seconds, 'Full refit s': full_seconds})
+        
+        report_df = pd.DataFrame(report)
+        if not report_df.empty:
+            print("\nWarm-start update summary:")
+            print(report_df.to_string(index=False, float_format='%.4f'))
+        return report_df
     
     def create_ensemble_model(self):
-        """Create ensemble models for better performance"""
+        """Create ensemble models from the out-of-fold/test prediction matrix (see ensembles.py)"""
         print("\n" + "="*50)
         print("CREATING ENSEMBLE MODELS")
         print("="*50)
         
-        # Get top 5 models by RMSE
-        sorted_models = sorted(self.results.items(), key=lambda x: x[1]['RMSE'])[:5]
+        # Get top 5 models by RMSE among those with out-of-fold predictions
+        sorted_models = sorted(((name, r) for name, r in self.results.items()
+                                if name not in ENSEMBLE_NAMES and self.oof_predictions.get(name) is not None),
+                               key=lambda x: x[1]['RMSE'])[:5]
         
         if len(sorted_models) < 2:
             print("Not enough models for ensemble. Skipping...")
@@ -543,135 +871,50 @@ class SalesMLAnalyzer:
         
         print(f"Creating ensemble from top {len(sorted_models)} models...")
         
-        # Create voting regressor
-        estimators = []
-        for name, _ in sorted_models:
-            estimators.append((name, self.models[name]))
-        
-        # Voting Regressor
-        voting_regressor = VotingRegressor(estimators=estimators)
-        voting_regressor.fit(self.X_train, self.y_train)
-        voting_pred = voting_regressor.predict(self.X_test)
-        
-        # Calculate metrics for voting regressor
-        voting_mse = mean_squared_error(self.y_test, voting_pred)
-        voting_mae = mean_absolute_error(self.y_test, voting_pred)
-        voting_r2 = r2_score(self.y_test, voting_pred)
-        voting_rmse = np.sqrt(voting_mse)
-        
-        # Store voting regressor results
-        self.models['Voting Ensemble'] = voting_regressor
-        self.results['Voting Ensemble'] = {
-            'MSE': voting_mse,
-            'MAE': voting_mae,
-            'R2': voting_r2,
-            'RMSE': voting_rmse,
-            'predictions': voting_pred,
-            'best_params': 'Voting of top models',
-            'cv_score': None
-        }
+        # Prediction matrix (n_models x n_samples): no member is refit or re-predicted
+        member_names = [name for name, _ in sorted_models]
+        oof = np.vstack([self.oof_predictions[name] for name in member_names])
+        test = np.vstack([self.results[name]['predictions'] for name in member_names])
+        print(f"Out-of-fold matrix: {oof.shape[0]} models x {int(np.isfinite(oof).all(axis=0).sum())} training rows")
+        scalers = {name: self.scaler_for_model(name) for name in member_names}
         
-        print(f"Voting Ensemble RMSE: {voting_rmse:.4f}")
-        print(f"Voting Ensemble R²: {voting_r2:.6f}")
+        # Voting: plain mean of the members
+        voting = BlendedEnsemble(member_names, self.models, scalers, weights=np.full(len(member_names), 1.0 / len(member_names)))
+        self._store_ensemble('Voting Ensemble', voting, voting.combine(test), 'Voting of top models')
         
-        # Create stacking regressor if available
-        if STACKING_AVAILABLE and len(sorted_models) >= 3:
+        # Stacking: light RidgeCV meta-learner on the top 3 members' OOF predictions
+        if len(sorted_models) >= 3:
             print("\nCreating Stacking Regressor...")
-            
-            # Use top 3 models as base estimators
-            base_estimators = [(name, self.models[name]) for name, _ in sorted_models[:3]]
-            
-            # Use the best single model as final estimator
-            best_single_model = sorted_models[0][0]
-            final_estimator = self.models[best_single_model]
-            
-            stacking_regressor = StackingRegressor(
-                estimators=base_estimators,
-                final_estimator=final_estimator,
-                cv=5
-            )
-            
-            stacking_regressor.fit(self.X_train, self.y_train)
-            stacking_pred = stacking_regressor.predict(self.X_test)
-            
-            # Calculate metrics for stacking regressor
-            stacking_mse = mean_squared_error(self.y_test, stacking_pred)
-            stacking_mae = mean_absolute_error(self.y_test, stacking_pred)
-            stacking_r2 = r2_score(self.y_test, stacking_pred)
-            stacking_rmse = np.sqrt(stacking_mse)
-            
-            # Store stacking regressor results
-            self.models['Stacking Ensemble'] = stacking_regressor
-            self.results['Stacking Ensemble'] = {
-                'MSE': stacking_mse,
-                'MAE': stacking_mae,
-                'R2': stacking_r2,
-                'RMSE': stacking_rmse,
-                'predictions': stacking_pred,
-                'best_params': 'Stacking of top models',
-                'cv_score': None
-            }
-            
-            print(f"Stacking Ensemble RMSE: {stacking_rmse:.4f}")
-            print(f"Stacking Ensemble R²: {stacking_r2:.6f}")
+            stacking = BlendedEnsemble(member_names[:3], self.models, scalers,
+                                       meta=fit_meta_learner(oof[:3], self.y_train))
+            self._store_ensemble('Stacking Ensemble', stacking, stacking.combine(test[:3]),
+                                 f'Stacking of top models: {stacking.describe()}')
         
         # Create weighted ensemble based on performance
-        self.create_weighted_ensemble(sorted_models)
+        self.create_weighted_ensemble(member_names, oof, test, scalers)
     
-    def create_weighted_ensemble(self, sorted_models):
-        """Create a weighted ensemble based on model performance"""
+    def create_weighted_ensemble(self, member_names, oof, test, scalers):
+        """Weighted ensemble with non-negative least-squares weights fit on the OOF predictions"""
         print("\nCreating Weighted Ensemble...")
         
-        # Calculate weights based on inverse RMSE
-        weights = []
-        models_list = []
-        
-        for name, results in sorted_models:
-            weight = 1.0 / (results['RMSE'] + 1e-8)  # Add small epsilon to avoid division by zero
-            weights.append(weight)
-            models_list.append(self.models[name])
-        
-        # Normalize weights
-        total_weight = sum(weights)
-        weights = [w / total_weight for w in weights]
-        
-        print(f"Weights: {[f'{w:.3f}' for w in weights]}")
-        
-        # Create weighted predictions
-        weighted_pred = np.zeros(len(self.y_test))
-        
-        for i, (name, model) in enumerate([(name, self.models[name]) for name, _ in sorted_models]):
-            # Use appropriate scaler for each model
-            if name in ['Ridge Regression', 'Lasso Regression', 'ElasticNet', 'SVR', 'MLP Regressor', 'Kernel Ridge']:
-                if name == 'MLP Regressor':
-                    pred = model.predict(self.X_test_minmax)
-                else:
-                    pred = model.predict(self.X_test_standard)
-            else:
-                pred = model.predict(self.X_test)
-            
-            weighted_pred += weights[i] * pred
-        
-        # Calculate metrics for weighted ensemble
-        weighted_mse = mean_squared_error(self.y_test, weighted_pred)
-        weighted_mae = mean_absolute_error(self.y_test, weighted_pred)
-        weighted_r2 = r2_score(self.y_test, weighted_pred)
-        weighted_rmse = np.sqrt(weighted_mse)
-        
-        # Store weighted ensemble results
-        self.models['Weighted Ensemble'] = None  # No single model object
-        self.results['Weighted Ensemble'] = {
-            'MSE': weighted_mse,
-            'MAE': weighted_mae,
-            'R2': weighted_r2,
-            'RMSE': weighted_rmse,
-            'predictions': weighted_pred,
-            'best_params': f'Weighted: {weights}',
+        weighted = BlendedEnsemble(member_names, self.models, scalers, weights=nnls_weights(oof, self.y_train))
+        print(f"Weights: {[f'{w:.3f}' for w in weighted.weights]}")
+        self._store_ensemble('Weighted Ensemble', weighted, weighted.combine(test), f'Weighted: {weighted.describe()}')
+    
+    def _store_ensemble(self, name, model, y_pred, best_params):
+        mse = mean_squared_error(self.y_test, y_pred)
+        self.models[name] = model
+        self.results[name] = {
+            'MSE': mse,
+            'MAE': mean_absolute_error(self.y_test, y_pred),
+            'R2': r2_score(self.y_test, y_pred),
+            'RMSE': np.sqrt(mse),
+            'predictions': y_pred,
+            'best_params': best_params,
             'cv_score': None
         }
-        
-        print(f"Weighted Ensemble RMSE: {weighted_rmse:.4f}")
-        print(f"Weighted Ensemble R²: {weighted_r2:.6f}")
+        print(f"{name} RMSE: {self.results[name]['RMSE']:.4f}")
+        print(f"{name} R²: {self.results[name]['R2']:.6f}")
     
     def evaluate_models(self):
         """Evaluate and compare model performance"""
@@ -721,8 +964,8 @@ class SalesMLAnalyzer:
 
     def export_best_model_to_onnx(self, onnx_path='assets/models/sales_forecast.onnx', features_path='assets/models/sales_forecast_features.json'):
         """Export the best-performing scaler+model to ONNX, along with feature order.
-        This exports a minimal pipeline (scaler where applicable + regressor) that consumes
-        the engineered features in the same column order used during training.
+        The fitted scaler is fused into the graph (see onnx_backend.py), so it consumes the raw
+        engineered features in the same column order used during training.
         """
         try:
             import json, os
@@ -730,32 +973,23 @@ class SalesMLAnalyzer:
                 print('ONNX export not available. Install: pip install skl2onnx onnx')
                 return False
 
-            # Identify best model by RMSE
-            best_name = min(self.results.keys(), key=lambda x: self.results[x]['RMSE'])
-            best_model = self.models[best_name]
-
-            # Choose scaler consistent with training
-            if best_name in ['Ridge Regression', 'Lasso Regression', 'ElasticNet', 'SVR', 'Kernel Ridge']:
-                scaler = self.scaler_standard
-                X_train = self.X_train_standard
-            elif best_name == 'MLP Regressor':
-                scaler = self.scaler_minmax
-                X_train = self.X_train_minmax
-            else:
-                scaler = None
-                X_train = self.X_train.values
-
-            # Build a pipeline if scaler exists
-            if scaler is not None:
-                # We cannot directly export StandardScaler fitted in numpy; we wrap with sklearn Pipeline-like behavior by re-fitting a new scaler to match params
-                # However, for consistency, we will export a model that expects already-scaled inputs. To keep things predictable on-device,
-                # we instead export WITHOUT scaler and expect Dart to compute raw features and pass them in unscaled.
-                # So fall back to raw model export and ensure Dart uses raw feature order.
-                initial_type = [('input', FloatTensorType([None, X_train.shape[1]]))]
-                onx = convert_sklearn(best_model, initial_types=initial_type, target_opset=15)
-            else:
-                initial_type = [('input', FloatTensorType([None, self.X_train.shape[1]]))]
-                onx = convert_sklearn(best_model, initial_types=initial_type, target_opset=15)
+            # Best single model by RMSE (ensembles mix differently scaled members); if its
+            # family has no ONNX converter, or its graph does not reproduce its predictions,
+            # fall back to the next best one
+            candidates = sorted((name for name in self.results if name not in ENSEMBLE_NAMES),
+                                key=lambda x: self.results[x]['RMSE'])
+            onx = None
+            for best_name in candidates:
+                # One graph: scaler consistent with training (if any) followed by the regressor
+                scaler = self.scaler_for_model(best_name)
+                try:
+                    onx = self._checked_onnx(best_name)
+                    break
+                except Exception as e:
+                    print(f'{best_name} cannot be exported to ONNX ({e}); trying the next best model')
+            if onx is None:
+                print('No trained model could be converted to ONNX')
+                return False
 
             # Ensure directories
             os.makedirs(os.path.dirname(onnx_path), exist_ok=True)
@@ -767,63 +1001,33 @@ class SalesMLAnalyzer:
             with open(features_path, 'w') as f:
                 json.dump(feature_cols, f)
 
-            # Save scaler parameters if a scaler was used (so mobile can apply same preprocessing)
+            # Scaling now happens inside the graph, so tell the app not to apply any.
+            # Schema: { available: bool, type: 'standard'|'minmax'|'robust'|'none', params: {...} }
             try:
                 scaler_params_path = os.path.join(os.path.dirname(onnx_path), 'scaler_params.json')
-
-                # Always produce a predictable schema so downstream apps can parse safely
-                # Schema: { available: bool, type: 'standard'|'minmax'|'robust'|'none', params: {...} }
                 scaler_info = {
                     'available': False,
                     'type': 'none',
-                    'params': None
+                    'params': None,
+                    'fused': scaler is not None,
+                    'fused_scaler': None if scaler is None else type(scaler).__name__,
                 }
-
-                if scaler is not None:
-                    scaler_info['available'] = True
-
-                    # StandardScaler-like
-                    if hasattr(scaler, 'mean_') and hasattr(scaler, 'scale_'):
-                        scaler_info['type'] = 'standard'
-                        scaler_info['params'] = {
-                            'mean': np.array(scaler.mean_).tolist(),
-                            'scale': np.array(scaler.scale_).tolist()
-                        }
-                    # MinMaxScaler-like
-                    elif hasattr(scaler, 'data_min_') and hasattr(scaler, 'data_max_'):
-                        scaler_info['type'] = 'minmax'
-                        scaler_info['params'] = {
-                            'min': np.array(scaler.data_min_).tolist(),
-                            'max': np.array(scaler.data_max_).tolist()
-                        }
-                    # RobustScaler-like
-                    elif hasattr(scaler, 'center_') and hasattr(scaler, 'scale_'):
-                        # Some RobustScaler implementations expose center_ and scale_
-                        scaler_info['type'] = 'robust'
-                        scaler_info['params'] = {
-                            'center': np.array(getattr(scaler, 'center_', [])).tolist(),
-                            'scale': np.array(getattr(scaler, 'scale_', [])).tolist()
-                        }
-                    else:
-                        # Unknown scaler type - provide a best-effort repr
-                        scaler_info['type'] = 'unknown'
-                        try:
-                            scaler_info['params'] = {k: getattr(scaler, k).tolist() for k in ['mean_', 'scale_', 'data_min_', 'data_max_'] if hasattr(scaler, k)}
-                        except Exception:
-                            scaler_info['params'] = None
-
-                # Write scaler info (always write predictable JSON)
-                try:
-                    with open(scaler_params_path, 'w') as sf:
-                        json.dump(scaler_info, sf)
-                    print(f'Exported scaler parameters to {scaler_params_path}')
-                except Exception as e:
-                    print(f'Failed writing scaler_params.json: {e}')
+                with open(scaler_params_path, 'w') as sf:
+                    json.dump(scaler_info, sf)
+                print(f'Exported scaler parameters to {scaler_params_path}')
             except Exception as e:
-                print(f'Failed to export scaler params: {e}')
+                print(f'Failed writing scaler_params.json: {e}')
 
-            print(f'Exported ONNX model to {onnx_path}')
+            print(f'Exported ONNX model ({best_name}{" with fused " + type(scaler).__name__ if scaler is not None else ""}) to {onnx_path}')
             print(f'Exported feature list to {features_path}')
+
+            # Offline-optimized variants next to the default graph, with size/load/latency
+            try:
+                records = write_variants(onx, onnx_path, self.X_test.to_numpy(dtype=np.float32))
+                print('ONNX variants:')
+                print(format_variants(records))
+            except Exception as e:
+                print(f'Skipping ONNX variants (non-critical): {e}')
             return True
         except Exception as e:
             print(f'Failed to export ONNX: {e}')
@@ -1002,148 +1206,146 @@ class SalesMLAnalyzer:
         fig = plt.gcf()
         self.safe_plot(fig, 'residual_analysis.png')
     
-    def predict_future_sales(self, days_ahead=30):
-        """Make predictions for future sales using full feature set and proper scaling"""
+    def _date_dimension(self, start, end):
+        """Calendar for [start, end] with the app's holidays joined in (none if unavailable)"""
+        if not os.path.exists(self.db_path):
+            return DateDimension(start, end)
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                return DateDimension.from_db(conn, start, end)
+        except Exception as e:
+            print(f"Could not load holidays (non-critical): {e}")
+            return DateDimension(start, end)
+    
+    def _row_dtype(self, model_name):
+        """Feature-row dtype for the recursive forecast: float32 for unscaled single models"""
+        return np.float32 if self.scaler_for_model(model_name) is None and model_name not in ENSEMBLE_NAMES else np.float64
+    
+    def _ema_means(self, frame=None):
+        frame = self.df if frame is None else frame
+        return {span: float(frame[f'sales_ema{span}'].iloc[-1])
+                for span in EMA_SPANS if f'sales_ema{span}' in frame.columns}
+    
+    def _checked_onnx(self, name):
+        """Fused ONNX graph of family `name`, checked against its sklearn predictions on the
+        test split (ValueError if they drift beyond onnx_backend.PARITY_RTOL)"""
+        onx = fused_onnx(self.models[name], self.scaler_for_model(name), self.X_train.shape[1])
+        try:
+            check_parity(onx, self.models[name], self.scaler_for_model(name), self.X_test)
+        except ImportError:
+            print('onnxruntime not installed; ONNX graph not checked against the model')
+        return onx
+    
+    def onnx_model(self, name):
+        """ONNX Runtime session (OnnxModel) for family `name` with its scaler fused in; built once.
+        Raises ValueError for families whose graph does not reproduce the model."""
+        if name not in self.onnx_models:
+            try:
+                onx = self._checked_onnx(name)
+            except ValueError as e:
+                raise ValueError(f"{name} has no faithful ONNX graph ({e}); use backend='sklearn'") from e
+            self.onnx_models[name] = OnnxModel(onx)
+        return self.onnx_models[name]
+    
+    def _recursive_forecast(self, future_dates, model_name=None, origin=None, backend='sklearn'):
+        """Roll a model (default: the best) forward one day at a time over `future_dates`,
+        starting after the first `origin` rows of self.df (default: all of them).
+        backend='onnx' runs each step through the fused ONNX graph instead of sklearn."""
+        best_model_name = model_name or min(self.results.keys(), key=lambda x: self.results[x]['RMSE'])
+        if backend == 'onnx' and best_model_name in ENSEMBLE_NAMES:
+            best_model_name = self._best_single_model()
+        print(f"Using best model: {best_model_name}" + (" (ONNX Runtime)" if backend == 'onnx' else ""))
+        if backend == 'onnx':
+            model, scaler, dtype = self.onnx_model(best_model_name), None, np.float32
+        else:
+            model, scaler, dtype = (self.models[best_model_name], self.scaler_for_model(best_model_name),
+                                    self._row_dtype(best_model_name))
+        
+        # Streaming state over the known sales: each step costs O(max window) instead of
+        # rebuilding pandas rows, and calendar columns for the horizon are computed once
+        known = self.df.iloc[:origin]
+        return recursive_forecast(model, scaler, known['sales'].to_numpy(dtype=float), list(self.X_train.columns),
+                                  future_dates, ema_means=self._ema_means(known),
+                                  calendar=self._date_dimension(future_dates[0], future_dates[-1]), dtype=dtype)
+    
+    def publish_best_model(self, registry=None):
+        """Publish the best model with its scaler, feature order, metrics and data watermark
+        to the model registry (see model_registry.py); returns the version or None"""
+        name = min(self.results.keys(), key=lambda x: self.results[x]['RMSE'])
+        model = self.models[name]
+        if isinstance(model, BlendedEnsemble):
+            # Only pickle the members, not every model the analyzer holds
+            model = BlendedEnsemble(model.names, {n: self.models[n] for n in model.names}, model.scalers,
+                                    weights=model.weights, meta=model.meta)
+        last_date, rows = str(self.df['sale_date'].max())[:10], len(self.df)
+        if os.path.exists(self.db_path):
+            try:
+                last_date, rows = db_watermark(self.db_path)
+            except Exception as e:
+                print(f"Could not read the DB watermark (non-critical): {e}")
+        metrics = {k: float(self.results[name][k]) for k in ('RMSE', 'MAE', 'R2')}
+        registry = registry or ModelRegistry(os.path.join(self.cache_dir, 'registry'))
+        version = registry.publish(model, self.scaler_for_model(name), self.df['sales'].to_numpy(dtype=float), {
+            'model_name': name,
+            'db_path': os.path.abspath(self.db_path),
+            'feature_cols': list(self.X_train.columns),
+            'metrics': metrics,
+            'ema_means': self._ema_means(),
+            'row_dtype': np.dtype(self._row_dtype(name)).name,
+            'watermark': {'last_sale_date': last_date, 'rows': rows},
+        })
+        if version:
+            print(f"Published {name} (RMSE {metrics['RMSE']:.4f}) as registry version {version}")
+        return version
+    
+    def _best_single_model(self):
+        singles = [name for name in self.results if name not in ENSEMBLE_NAMES]
+        return min(singles, key=lambda x: self.results[x]['RMSE'])
+    
+    def fit_direct_forecaster(self, days_ahead=30, model_name=None, strategy='auto'):
+        """Fit a DirectForecaster (see direct_forecast.py) for the next `days_ahead` days.
+
+        It reuses the tuned hyperparameters of `model_name` (default: the best single model;
+        ensembles are not refit) and is trained on every prepared row, train and test.
+        """
+        model_name = model_name or self._best_single_model()
+        X = pd.concat([self.X_train, self.X_test])
+        y = pd.concat([self.y_train, self.y_test])
+        start = time.perf_counter()
+        forecaster = DirectForecaster(self.models[model_name], horizon=days_ahead, strategy=strategy,
+                                      scaler=self.scaler_for_model(model_name)).fit(X, y)
+        print(f"Direct {days_ahead}-day forecaster for {model_name} ({forecaster.strategy_}) "
+              f"fit in {time.perf_counter() - start:.1f}s")
+        self.direct_forecasters[(model_name, days_ahead)] = forecaster
+        return model_name, forecaster
+    
+    def predict_future_sales(self, days_ahead=30, method='recursive', backend='sklearn'):
+        """Make predictions for future sales using full feature set and proper scaling.
+
+        method='recursive' feeds each day's prediction back into the next day's features
+        (one predict per day); method='direct' predicts all days at once from the last known
+        feature row with a multi-horizon model (fit_direct_forecaster). backend='onnx' runs
+        the recursive steps through ONNX Runtime (the exported scaler+model graph).
+        """
+        if method not in ('recursive', 'direct'):
+            raise ValueError(f"Unknown forecast method {method!r}; use 'recursive' or 'direct'")
         print(f"\n" + "="*50)
-        print(f"PREDICTING FUTURE SALES ({days_ahead} days ahead)")
+        print(f"PREDICTING FUTURE SALES ({days_ahead} days ahead, {method})")
         print("="*50)
         
-        # Choose best model
-        best_model_name = min(self.results.keys(), key=lambda x: self.results[x]['RMSE'])
-        best_model = self.models[best_model_name]
-        print(f"Using best model: {best_model_name}")
-        
-        # Determine scaler used for this model
-        def select_scaler_for_model(name: str):
-            if name in ['Ridge Regression', 'Lasso Regression', 'ElasticNet', 'SVR', 'Kernel Ridge']:
-                return self.scaler_standard
-            if name == 'MLP Regressor':
-                return self.scaler_minmax
-            return None
-        scaler = select_scaler_for_model(best_model_name)
-        
         # Prepare future dates
         last_date = self.df['sale_date'].max()
         future_dates = pd.date_range(start=last_date + pd.Timedelta(days=1), periods=days_ahead)
         
-        # Start from the last available feature row
-        feature_cols = list(self.X_train.columns)
-        last_row_features = self.df.iloc[-1][feature_cols].copy()
-        last_known_sales = float(self.df.iloc[-1]['sales'])
-        
-        predictions = []
-        rolling_window_7 = list(self.df['sales'].iloc[-7:])
-        rolling_window_30 = list(self.df['sales'].iloc[-30:]) if len(self.df) >= 30 else list(self.df['sales'].tolist())
-        
-        for i, future_date in enumerate(future_dates):
-            future_feat = last_row_features.copy()
-            
-            # Update calendar features
-            future_feat['month'] = future_date.month
-            future_feat['day'] = future_date.day
-            future_feat['quarter'] = future_date.quarter
-            future_feat['weekday'] = future_date.weekday()
-            future_feat['week_of_year'] = future_date.isocalendar().week
-            future_feat['day_of_year'] = future_date.timetuple().tm_yday
-            future_feat['is_weekend'] = 1 if future_date.weekday() >= 5 else 0
-            future_feat['is_month_start'] = 1 if future_date.day == 1 else 0
-            # month end approx (safe for our purpose)
-            next_day = future_date + pd.Timedelta(days=1)
-            future_feat['is_month_end'] = 1 if next_day.month != future_date.month else 0
-            future_feat['is_quarter_start'] = 1 if future_date.month in [1, 4, 7, 10] and future_date.day == 1 else 0
-            future_feat['is_quarter_end'] = 1 if future_date.month in [3, 6, 9, 12] and future_date.day in [30, 31] else 0
-            
-            # Update encoded/cyclical features
-            future_feat['day_of_week_encoded'] = future_date.weekday()
-            future_feat['month_sin'] = np.sin(2 * np.pi * future_date.month / 12)
-            future_feat['month_cos'] = np.cos(2 * np.pi * future_date.month / 12)
-            future_feat['day_sin'] = np.sin(2 * np.pi * future_date.day / 31)
-            future_feat['day_cos'] = np.cos(2 * np.pi * future_date.day / 31)
-            future_feat['weekday_sin'] = np.sin(2 * np.pi * future_date.weekday() / 7)
-            future_feat['weekday_cos'] = np.cos(2 * np.pi * future_date.weekday() / 7)
-            future_feat['quarter_sin'] = np.sin(2 * np.pi * future_feat['quarter'] / 4)
-            future_feat['quarter_cos'] = np.cos(2 * np.pi * future_feat['quarter'] / 4)
-            future_feat['week_sin'] = np.sin(2 * np.pi * float(future_feat['week_of_year']) / 52)
-            future_feat['week_cos'] = np.cos(2 * np.pi * float(future_feat['week_of_year']) / 52)
-            
-            # Update lag features using last known/predicted sales
-            future_feat['sales_lag1'] = last_known_sales
-            if 'sales_lag2' in future_feat:
-                # Approximate shift for additional lags
-                future_feat['sales_lag2'] = rolling_window_7[-2] if len(rolling_window_7) >= 2 else last_known_sales
-            if 'sales_lag3' in future_feat:
-                future_feat['sales_lag3'] = rolling_window_7[-3] if len(rolling_window_7) >= 3 else last_known_sales
-            if 'sales_lag7' in future_feat:
-                future_feat['sales_lag7'] = rolling_window_7[0] if len(rolling_window_7) == 7 else last_known_sales
-            if 'sales_lag14' in future_feat:
-                future_feat['sales_lag14'] = rolling_window_30[-14] if len(rolling_window_30) >= 14 else last_known_sales
-            if 'sales_lag21' in future_feat:
-                future_feat['sales_lag21'] = rolling_window_30[-21] if len(rolling_window_30) >= 21 else last_known_sales
-            if 'sales_lag30' in future_feat:
-                future_feat['sales_lag30'] = rolling_window_30[0] if len(rolling_window_30) >= 30 else last_known_sales
-            
-            # Rolling stats based on available rolling windows
-            if 'sales_ma7' in feature_cols:
-                future_feat['sales_ma7'] = float(np.mean(rolling_window_7))
-            if 'sales_ma14' in feature_cols:
-                window14 = rolling_window_30[-14:] if len(rolling_window_30) >= 14 else rolling_window_30
-                future_feat['sales_ma14'] = float(np.mean(window14))
-            if 'sales_ma21' in feature_cols:
-                window21 = rolling_window_30[-21:] if len(rolling_window_30) >= 21 else rolling_window_30
-                future_feat['sales_ma21'] = float(np.mean(window21))
-            if 'sales_ma30' in feature_cols:
-                future_feat['sales_ma30'] = float(np.mean(rolling_window_30))
-            if 'sales_std7' in feature_cols:
-                future_feat['sales_std7'] = float(np.std(rolling_window_7, ddof=1)) if len(rolling_window_7) > 1 else 0.0
-            if 'sales_std30' in feature_cols:
-                future_feat['sales_std30'] = float(np.std(rolling_window_30, ddof=1)) if len(rolling_window_30) > 1 else 0.0
-            
-            # Polynomial helpers
-            if 'month_squared' in feature_cols:
-                future_feat['month_squared'] = future_feat['month'] ** 2
-            if 'weekday_squared' in feature_cols:
-                future_feat['weekday_squared'] = future_feat['weekday'] ** 2
-            if 'day_squared' in feature_cols:
-                future_feat['day_squared'] = future_feat['day'] ** 2
-            
-            # Ratios/volatility use last known averages
-            if 'sales_to_ma7_ratio' in feature_cols and 'sales_ma7' in feature_cols:
-                future_feat['sales_to_ma7_ratio'] = last_known_sales / (future_feat['sales_ma7'] + 1e-8)
-            if 'sales_to_ma30_ratio' in feature_cols and 'sales_ma30' in feature_cols:
-                future_feat['sales_to_ma30_ratio'] = last_known_sales / (future_feat['sales_ma30'] + 1e-8)
-            if 'ma7_to_ma30_ratio' in feature_cols and 'sales_ma7' in feature_cols and 'sales_ma30' in feature_cols:
-                future_feat['ma7_to_ma30_ratio'] = future_feat['sales_ma7'] / (future_feat['sales_ma30'] + 1e-8)
-            if 'sales_volatility_7' in feature_cols and 'sales_ma7' in feature_cols:
-                future_feat['sales_volatility_7'] = (float(np.std(rolling_window_7, ddof=1)) / (future_feat['sales_ma7'] + 1e-8)) if len(rolling_window_7) > 1 else 0.0
-            if 'sales_volatility_30' in feature_cols and 'sales_ma30' in feature_cols:
-                future_feat['sales_volatility_30'] = (float(np.std(rolling_window_30, ddof=1)) / (future_feat['sales_ma30'] + 1e-8)) if len(rolling_window_30) > 1 else 0.0
-            if 'sales_detrended' in feature_cols and 'sales_ma30' in feature_cols:
-                future_feat['sales_detrended'] = last_known_sales - future_feat['sales_ma30']
-            
-            # Ensure order matches training columns
-            future_row_df = pd.DataFrame([future_feat.values], columns=feature_cols)
-            
-            # Scale if needed
-            if scaler is not None:
-                X_future = scaler.transform(future_row_df)
-            else:
-                X_future = future_row_df.values
-            
-            # Predict
-            pred = float(best_model.predict(X_future)[0])
-            predictions.append(pred)
-            
-            # Update rolling windows for next step
-            last_known_sales = pred
-            rolling_window_7.append(pred)
-            if len(rolling_window_7) > 7:
-                rolling_window_7.pop(0)
-            rolling_window_30.append(pred)
-            if len(rolling_window_30) > 30:
-                rolling_window_30.pop(0)
-            
-            # Carry forward for next iteration
-            last_row_features = future_feat
+        if method == 'direct':
+            best_model_name = self._best_single_model()
+            forecaster = self.direct_forecasters.get((best_model_name, days_ahead))
+            if forecaster is None:
+                _, forecaster = self.fit_direct_forecaster(days_ahead, best_model_name)
+            print(f"Using best model: {best_model_name} (direct)")
+            predictions = forecaster.predict(self.X_test.iloc[-1:].to_numpy())[0]
+        else:
+            predictions = self._recursive_forecast(future_dates, backend=backend)
         
         future_df = pd.DataFrame({'date': future_dates, 'predicted_sales': predictions})
         
@@ -1163,43 +1365,193 @@ class SalesMLAnalyzer:
         print(future_df.to_string(index=False, float_format='%.2f'))
         return future_df
     
-    def run_complete_analysis(self):
-        """Run the complete machine learning analysis"""
+    def _batch_forecast(self, model_name, future_dates, levels, holiday_flag, calendar, adjust):
+        """(K, days) recursive forecasts for K copies of the history scaled by `levels`.
+        adjust(step, predictions) returns the (K,) values recorded and fed back for a day.
+        """
+        model = self.models[model_name]
+        scaler = self.scaler_for_model(model_name)
+        state = BatchFeatureState(self.df['sales'].to_numpy(dtype=float), list(self.X_train.columns),
+                                  levels=levels, ema_means=self._ema_means())
+        state.start(future_dates.to_numpy(), holiday_flag=holiday_flag, calendar=calendar)
+        
+        start = time.perf_counter()
+        predictions = np.empty((len(levels), len(future_dates)))
+        for i in range(len(future_dates)):
+            X_step = state.rows(i)
+            if scaler is not None:
+                X_step = scaler.transform(X_step)
+            predictions[:, i] = adjust(i, np.asarray(model.predict(X_step), dtype=float))
+            state.push(predictions[:, i])
+        print(f"Forecast {len(levels)} paths x {len(future_dates)} days with {model_name} "
+              f"in {time.perf_counter() - start:.2f}s")
+        return predictions
+    
+    def forecast_scenarios(self, scenarios, days_ahead=30, model_name=None):
+        """Recursive forecasts for many what-if scenarios at once.
+
+        Each scenario is a dict with optional keys:
+         - 'name':         label in the output (default: its index);
+         - 'level':        factor applied to the known sales history (starting level);
+         - 'holidays':     extra holiday dates within the horizon;
+         - 'holiday_flag': full 0/1 holiday flag per horizon day (overrides the calendar);
+         - 'shocks':       {date: factor} applied to that day's prediction before it is fed
+                           back, e.g. a promo spike.
+        All scenarios advance in lockstep (BatchFeatureState) with one predict per horizon
+        day on a (K x F) matrix. Returns a tidy DataFrame (scenario, date, predicted_sales).
+        """
+        model_name = model_name or min(self.results.keys(), key=lambda x: self.results[x]['RMSE'])
+        names = [sc.get('name', i) for i, sc in enumerate(scenarios)]
+        
+        last_date = self.df['sale_date'].max()
+        future_dates = pd.date_range(start=last_date + pd.Timedelta(days=1), periods=days_ahead)
+        day = {d: i for i, d in enumerate(future_dates.normalize())}
+        calendar = self._date_dimension(future_dates[0], future_dates[-1])
+        base_flags = calendar.fields(future_dates.to_numpy())['holiday_flag']
+        
+        levels = np.array([float(sc.get('level', 1.0)) for sc in scenarios])
+        flags = np.tile(np.asarray(base_flags, dtype=float), (len(scenarios), 1))
+        factors = np.ones((len(scenarios), days_ahead))
+        for k, sc in enumerate(scenarios):
+            if sc.get('holiday_flag') is not None:
+                flags[k] = np.asarray(sc['holiday_flag'], dtype=float)
+            for d in sc.get('holidays', ()):
+                if pd.Timestamp(d).normalize() in day:
+                    flags[k, day[pd.Timestamp(d).normalize()]] = 1.0
+            for d, factor in (sc.get('shocks') or {}).items():
+                if pd.Timestamp(d).normalize() in day:
+                    factors[k, day[pd.Timestamp(d).normalize()]] = factor
+        
+        predictions = self._batch_forecast(model_name, future_dates, levels, flags, calendar,
+                                           lambda i, pred: pred * factors[:, i])
+        
+        return pd.DataFrame({
+            'scenario': np.repeat(np.asarray(names, dtype=object), days_ahead),
+            'date': np.tile(future_dates.to_numpy(), len(scenarios)),
+            'predicted_sales': predictions.reshape(-1),
+        })
+    
+    def simulate_future_sales(self, days_ahead=30, n_paths=10000, quantiles=(0.1, 0.5, 0.9),
+                              residuals='holdout', model_name=None, seed=42):
+        """Monte Carlo prediction bands for the recursive forecast.
+
+        Every path adds a residual drawn from the model's errors to each day's prediction
+        and feeds the perturbed value back into the next day's features, so the bands widen
+        with the horizon as errors compound. Residuals come from the test split ('holdout',
+        conformal-style) or from the CV out-of-fold predictions on the training rows ('oof').
+        All paths advance in lockstep, one predict per day on an (n_paths x F) matrix.
+        Returns a DataFrame with the date, one column per quantile (p10, p50, ...) and the mean.
+        """
+        model_name = model_name or min(self.results.keys(), key=lambda x: self.results[x]['RMSE'])
+        if residuals == 'holdout':
+            pool = self.y_test.to_numpy(dtype=float) - np.asarray(self.results[model_name]['predictions'], dtype=float)
+        elif residuals == 'oof':
+            # Ensembles and warm-updated families (update_models) have none
+            if self.oof_predictions.get(model_name) is None:
+                raise ValueError(f"No out-of-fold predictions recorded for {model_name}; use residuals='holdout'")
+            pool = self.y_train.to_numpy(dtype=float) - self.oof_predictions[model_name]
+            pool = pool[np.isfinite(pool)]
+        else:
+            raise ValueError(f"Unknown residual source {residuals!r}; use 'holdout' or 'oof'")
+        
+        last_date = self.df['sale_date'].max()
+        future_dates = pd.date_range(start=last_date + pd.Timedelta(days=1), periods=days_ahead)
+        calendar = self._date_dimension(future_dates[0], future_dates[-1])
+        draws = np.random.default_rng(seed).choice(pool, size=(n_paths, days_ahead))
+        paths = self._batch_forecast(model_name, future_dates, np.ones(n_paths), None, calendar,
+                                     lambda i, pred: pred + draws[:, i])
+        
+        bands = pd.DataFrame({'date': future_dates})
+        for q, values in zip(quantiles, np.quantile(paths, quantiles, axis=0)):
+            bands[f'p{round(q * 100):g}'] = values
+        bands['mean'] = paths.mean(axis=0)
+        print(f"\nSimulated {n_paths} paths from {len(pool)} {residuals} residuals of {model_name}:")
+        print(bands.to_string(index=False, float_format='%.2f'))
+        return bands
+    
+    def run_complete_analysis(self, time_budget=None):
+        """Run the complete machine learning analysis.
+
+        With `time_budget` (seconds) training is planned to fit in what is left after data
+        preparation minus a reserve for forecasting and export, and the optional plotting
+        stages are skipped once the reserve is reached. A best model and its export are
+        always produced; self.budget_report says what was skipped or truncated.
+        """
         print("SALES MACHINE LEARNING ANALYSIS")
         print("="*50)
+        start = time.perf_counter()
+        skipped = []
+        
+        def left():
+            return None if time_budget is None else time_budget - (time.perf_counter() - start)
+        
+        def optional(stage):
+            if time_budget is not None and left() < FINISH_RESERVE * time_budget:
+                skipped.append(stage.__name__)
+                return None
+            return stage()
         
         # Load and preprocess data
         self.load_and_preprocess_data()
         
         # Explore data
-        self.explore_data()
+        optional(self.explore_data)
         
         # Prepare features
         self.prepare_features()
         
         # Train models
-        self.train_models()
+        if time_budget is None:
+            self.train_models()
+        else:
+            self.train_models(time_budget=max(0.0, left() - FINISH_RESERVE * time_budget))
         
         # Evaluate models
         results_df = self.evaluate_models()
         
         # Plot actual vs predicted comparisons
-        self.plot_actual_vs_predicted()
+        optional(self.plot_actual_vs_predicted)
         
         # Feature importance analysis
-        self.feature_importance_analysis()
+        optional(self.feature_importance_analysis)
         
         # Make future predictions
         future_predictions = self.predict_future_sales()
 
+        # Publish the best model for the fast predict path (tools/run_python_predict.py)
+        self.publish_best_model()
+
         # Export best model for on-device inference
         self.export_best_model_to_onnx()
         
+        if time_budget is not None:
+            self.budget_report = {
+                'time_budget': time_budget,
+                'elapsed': time.perf_counter() - start,
+                'skipped_stages': skipped,
+                'families': self.training_plan or []
+            }
+            self.print_budget_report()
+        
         print("\n" + "="*50)
         print("ANALYSIS COMPLETE!")
         print("="*50)
         
         return results_df, future_predictions
+    
+    def print_budget_report(self):
+        report = self.budget_report
+        print("\n" + "="*50)
+        print("TIME BUDGET REPORT")
+        print("="*50)
+        print(f"Elapsed {report['elapsed']:.1f}s of {report['time_budget']:.0f}s budget")
+        families = report['families']
+        for action in ('skipped', 'shrunk'):
+            names = [e['name'] for e in families if e['action'] == action]
+            print(f"Families {action}: {', '.join(names) if names else 'none'}")
+        truncated = [e['name'] for e in families if e.get('truncated')]
+        print(f"Searches stopped at the deadline: {', '.join(truncated) if truncated else 'none'}")
+        print(f"Stages skipped: {', '.join(report['skipped_stages']) if report['skipped_stages'] else 'none'}")
 
 def main():
     """Main function to run the analysis"""
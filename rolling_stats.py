@@ -0,0 +1,121 @@
+"""
+Batched trailing-window statistics (mean, std, min, max, median) for one sales series.
+
+All requested windows end at the same day, so each is a suffix of the longest one. The
+kernel walks back over the longest window once, adding one lagged copy of the series per
+step, and records every statistic as the walk passes a requested window length:
+ - mean/std: running counts, sums and sums of squares (shifted by each row's newest
+   value for numerical stability);
+ - min/max: running fmin/fmax;
+ - median: each window's values are sorted along the row (small sorts are cheap) and the
+   middle element(s) picked according to the number of non-NaN values.
+Each result depends only on the values inside its window, so recomputing a slice of the
+series (e.g. the incremental loader's halo) reproduces the full-series values exactly.
+Rows are processed in blocks so memory stays bounded for very long series.
+
+NaNs are skipped; a window with fewer than `min_periods` values yields NaN. With the
+default (min_periods = window) this matches pandas `rolling(w).<stat>()`.
+"""
+import numpy as np
+
+STATS = ('mean', 'std', 'min', 'max', 'median')
+# Rows per block; the median sort of a block holds BLOCK_ROWS * window floats
+BLOCK_ROWS = 1 << 18
+
+
+def rolling_stats(values, windows, stats=STATS, min_periods=None, ddof=1, block_rows=BLOCK_ROWS):
+    """Return {(stat, window): array} for every requested stat and window.
+
+    `min_periods` may be None (full windows, pandas default), an int applied to every
+    window, or a callable window -> int.
+    """
+    x = np.asarray(values, dtype=float)
+    n = len(x)
+    windows = sorted(set(int(w) for w in windows))
+    unknown = set(stats) - set(STATS)
+    if unknown:
+        raise ValueError(f"Unknown rolling stats: {sorted(unknown)}")
+    stats = [s for s in STATS if s in set(stats)]
+    if min_periods is None:
+        min_count = {w: w for w in windows}
+    elif callable(min_periods):
+        min_count = {w: max(1, int(min_periods(w))) for w in windows}
+    else:
+        min_count = {w: max(1, int(min_periods)) for w in windows}
+
+    out = {(s, w): np.full(n, np.nan) for s in stats for w in windows}
+    if n == 0 or not windows or not stats:
+        return out
+    width = windows[-1]
+    padded = np.concatenate([np.full(width - 1, np.nan), x])
+
+    for lo in range(0, n, block_rows):
+        hi = min(n, lo + block_rows)
+        seg = padded[lo:hi + width - 1]
+        _block(seg, hi - lo, width, windows, stats, min_count, ddof, out, lo, hi)
+    return out
+
+
+def _block(seg, rows, width, windows, stats, min_count, ddof, out, lo, hi):
+    """Statistics for `rows` consecutive rows; seg holds width - 1 warm-up values first"""
+    def lagged(k):
+        # value k days before each row (contiguous slice, no copy)
+        return seg[width - 1 - k:width - 1 - k + rows]
+
+    ref = np.nan_to_num(lagged(0))
+    # Blocks without NaNs (the common case) skip the per-step masking
+    dense = not np.isnan(seg).any()
+    count = np.zeros(rows)
+    s1 = np.zeros(rows)
+    s2 = np.zeros(rows)
+    d = np.empty(rows)
+    lo_run = np.full(rows, np.nan)
+    hi_run = np.full(rows, np.nan)
+    targets = set(windows)
+    moments = 'mean' in stats or 'std' in stats
+    for k in range(width):
+        v = lagged(k)
+        if dense:
+            count += 1
+            if moments:
+                np.subtract(v, ref, out=d)
+        else:
+            valid = ~np.isnan(v)
+            count += valid
+            if moments:
+                np.copyto(d, np.where(valid, v - ref, 0.0))
+        if moments:
+            s1 += d
+            d *= d
+            s2 += d
+        if 'min' in stats:
+            np.fmin(lo_run, v, out=lo_run)
+        if 'max' in stats:
+            np.fmax(hi_run, v, out=hi_run)
+        w = k + 1
+        if w not in targets:
+            continue
+        enough = count >= min_count[w]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = s1 / count
+            if 'mean' in stats:
+                out[('mean', w)][lo:hi] = np.where(enough, ref + mean, np.nan)
+            if 'std' in stats:
+                var = (s2 - s1 * mean) / (count - ddof)
+                out[('std', w)][lo:hi] = np.where(enough & (count > ddof), np.sqrt(np.maximum(var, 0.0)), np.nan)
+        if 'min' in stats:
+            out[('min', w)][lo:hi] = np.where(enough, lo_run, np.nan)
+        if 'max' in stats:
+            out[('max', w)][lo:hi] = np.where(enough, hi_run, np.nan)
+        if 'median' in stats:
+            window = np.lib.stride_tricks.sliding_window_view(seg[width - w:], w)[:rows]
+            out[('median', w)][lo:hi] = np.where(enough, _median(window, count), np.nan)
+
+
+def _median(window, count):
+    """Median of each row's non-NaN values (NaNs sort last)"""
+    srt = np.sort(window, axis=1)
+    c = np.maximum(count.astype(np.int64), 1)[:, None]
+    lower = np.take_along_axis(srt, (c - 1) // 2, axis=1)[:, 0]
+    upper = np.take_along_axis(srt, c // 2, axis=1)[:, 0]
+    return (lower + upper) / 2
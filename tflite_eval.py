@@ -0,0 +1,161 @@
+"""
+Batched evaluation of exported TFLite artifacts against the Keras checkpoint.
+
+TFLiteRunner keeps one allocated interpreter per artifact (and thread count). Its input
+is resized once to (batch_size, window, F) so a whole batch of windows goes through one
+invoke(). The last partial batch is zero-padded instead of reallocating. int8/uint8
+inputs and outputs are (de)quantized with the tensor's scale and zero point.
+
+evaluate_artifacts() streams every holdout window through each artifact at each
+num_threads setting and returns one record per run: RMSE, its drift from the Keras
+model, the largest prediction difference, p50/p99 latency per batch, throughput and
+file size. format_report() prints them as one table.
+"""
+import os
+import time
+
+import numpy as np
+
+ARTIFACTS = ('model.tflite', 'model_quant.tflite', 'model_quant_dynamic.tflite', 'model_float16.tflite')
+DEFAULT_BATCH = 64
+DEFAULT_THREADS = (1, 2, 4)
+
+
+def interpreter_class():
+    """LiteRT's or tflite_runtime's Interpreter if installed, else tf.lite.Interpreter (or None)"""
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+        return Interpreter
+    except ImportError:
+        pass
+    try:
+        import tflite_runtime.interpreter as tflite_rt
+        return tflite_rt.Interpreter
+    except ImportError:
+        pass
+    try:
+        import tensorflow as tf
+        return tf.lite.Interpreter
+    except ImportError:
+        return None
+
+
+def _quantize(x, detail):
+    scale, zero_point = detail['quantization']
+    if detail['dtype'] not in (np.int8, np.uint8):
+        return x.astype(detail['dtype'], copy=False)
+    if not scale:
+        raise ValueError('quantized input has a zero scale')
+    info = np.iinfo(detail['dtype'])
+    return np.clip(np.round(x / scale + zero_point), info.min, info.max).astype(detail['dtype'])
+
+
+def _dequantize(y, detail):
+    scale, zero_point = detail['quantization']
+    if detail['dtype'] in (np.int8, np.uint8) and scale:
+        return (y.astype(np.float32) - zero_point) * scale
+    return y.astype(np.float32, copy=False)
+
+
+class TFLiteRunner:
+    """One allocated interpreter with its input resized to `batch_size` windows of
+    `sample_shape` (default: the exported per-sample shape)"""
+
+    def __init__(self, model, batch_size=DEFAULT_BATCH, num_threads=1, sample_shape=None, interpreter_cls=None):
+        interpreter_cls = interpreter_cls or interpreter_class()
+        if interpreter_cls is None:
+            raise RuntimeError('No TFLite interpreter available (pip install tflite-runtime or tensorflow)')
+        source = {'model_content': model} if isinstance(model, (bytes, bytearray)) else {'model_path': model}
+        self.interpreter = interpreter_cls(num_threads=num_threads, **source)
+        self.num_threads = num_threads
+        self.input = self.interpreter.get_input_details()[0]
+        shape = list(self.input['shape'])
+        # Exports with a dynamic window dimension report 1 there; `sample_shape` fills it in
+        sample_shape = list(sample_shape) if sample_shape is not None else shape[1:]
+        try:
+            self.interpreter.resize_tensor_input(self.input['index'], [batch_size] + sample_shape, strict=False)
+            self.batch_size = batch_size
+        except Exception:
+            # Static batch dimension: fall back to the exported one
+            self.batch_size = int(shape[0])
+        self.interpreter.allocate_tensors()
+        self.input = self.interpreter.get_input_details()[0]
+        self.output = self.interpreter.get_output_details()[0]
+        self._batch = np.zeros(self.input['shape'], dtype=np.float32)
+        self.latencies = []
+
+    def invoke(self, windows):
+        """Predictions for up to batch_size windows (n, window, F); times the invoke"""
+        n = len(windows)
+        self._batch[:n] = windows
+        self._batch[n:] = 0.0
+        start = time.perf_counter()
+        self.interpreter.set_tensor(self.input['index'], _quantize(self._batch, self.input))
+        self.interpreter.invoke()
+        out = self.interpreter.get_tensor(self.output['index'])
+        self.latencies.append(time.perf_counter() - start)
+        return _dequantize(out, self.output).reshape(len(self._batch), -1)[:n, 0]
+
+    def predict(self, windows):
+        """Stream all windows through the interpreter batch by batch"""
+        windows = np.asarray(windows, dtype=np.float32)
+        return np.concatenate([self.invoke(windows[i:i + self.batch_size])
+                               for i in range(0, len(windows), self.batch_size)] or [np.empty(0)])
+
+
+def _rmse(pred, y):
+    return float(np.sqrt(np.mean((pred - y) ** 2)))
+
+
+def evaluate_artifacts(artifacts, windows, targets, reference=None, batch_size=DEFAULT_BATCH,
+                       threads=DEFAULT_THREADS, warmup=1):
+    """One record per (artifact, num_threads). `artifacts` maps name -> path or model bytes;
+    `reference` are the Keras predictions for the same windows (drift columns are None
+    without it)."""
+    windows = np.ascontiguousarray(windows, dtype=np.float32)
+    targets = np.asarray(targets, dtype=np.float64)
+    ref_rmse = None if reference is None else _rmse(reference, targets)
+    records = []
+    for name, model in artifacts.items():
+        size = len(model) if isinstance(model, (bytes, bytearray)) else os.path.getsize(model)
+        for n_threads in threads:
+            try:
+                runner = TFLiteRunner(model, batch_size, n_threads, sample_shape=windows.shape[1:])
+                for _ in range(warmup):
+                    runner.invoke(windows[:runner.batch_size])
+                runner.latencies.clear()
+                start = time.perf_counter()
+                pred = runner.predict(windows)
+                total = time.perf_counter() - start
+            except Exception as e:
+                print(f"Skipping {name} with {n_threads} thread(s): {e}")
+                continue
+            rmse = _rmse(pred, targets)
+            lat = np.array(runner.latencies) * 1e3
+            records.append({
+                'artifact': name, 'threads': n_threads, 'batch': runner.batch_size, 'bytes': size,
+                'rmse': rmse,
+                'rmse_drift': None if ref_rmse is None else rmse - ref_rmse,
+                'max_abs_diff': None if reference is None else float(np.max(np.abs(pred - reference))),
+                'p50_ms': float(np.percentile(lat, 50)), 'p99_ms': float(np.percentile(lat, 99)),
+                'windows_per_s': len(windows) / total if total > 0 else float('inf'),
+                'dtype': np.dtype(runner.input['dtype']).name,
+            })
+    return records
+
+
+def format_report(records, ref_rmse=None):
+    def cell(value, fmt):
+        return '-' if value is None else format(value, fmt)
+
+    lines = []
+    if ref_rmse is not None:
+        lines.append(f"Keras best_model.h5 holdout RMSE: {ref_rmse:.4f}")
+    lines.append(f"{'artifact':<28} {'in':>7} {'thr':>3} {'batch':>5} {'KiB':>8} {'RMSE':>10} {'drift':>9} "
+                 f"{'max|diff|':>9} {'p50 ms':>7} {'p99 ms':>7} {'win/s':>9}")
+    for r in records:
+        lines.append(f"{r['artifact']:<28} {r['dtype']:>7} {r['threads']:>3} {r['batch']:>5} "
+                     f"{r['bytes'] / 1024:>8.1f} {r['rmse']:>10.4f} {cell(r['rmse_drift'], '+.4f'):>9} "
+                     f"{cell(r['max_abs_diff'], '.4f'):>9} {r['p50_ms']:>7.3f} {r['p99_ms']:>7.3f} "
+                     f"{r['windows_per_s']:>9.0f}")
+    return '\n'.join(lines)
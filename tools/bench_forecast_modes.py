@@ -0,0 +1,99 @@
+"""
+Compare the recursive and direct multi-horizon forecasts on latency and backtest accuracy.
+
+Trains (or loads from the model cache) the analyzer's models. The recursive forecast uses
+the chosen family as trained on the training split. The direct forecaster is fit with the
+same hyperparameters on the training split only. Then every --step days of the test
+period is used as a forecast origin:
+ - recursive: predict_future_sales' day-by-day loop from that origin (one predict per day);
+ - direct:    DirectForecaster.predict on the origin's feature row (one batched predict).
+
+It reports RMSE/MAE per horizon bucket over all origins whose horizon is fully observed,
+and the median wall time of one forecast.
+
+Usage: python tools/bench_forecast_modes.py --db path/to/app.db [--family "Extra Trees"] [--days 30] [--step 7]
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from direct_forecast import DirectForecaster
+from predict_ml_sales import SalesMLAnalyzer
+
+warnings.filterwarnings('ignore')
+
+BUCKETS = ((1, 7), (8, 14), (15, 30), (31, 90))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--db', required=True)
+    parser.add_argument('--family', help='model family to compare (default: the best single model)')
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--step', type=int, default=7, help='days between backtest origins')
+    parser.add_argument('--strategy', choices=['auto', 'multi_output', 'per_horizon'], default='auto')
+    args = parser.parse_args()
+
+    analyzer = SalesMLAnalyzer(None, db_path=args.db)
+    analyzer.plot_enabled = False
+    analyzer.load_and_preprocess_data()
+    analyzer.prepare_features()
+    analyzer.train_models()
+    family = args.family or analyzer._best_single_model()
+    horizon = args.days
+
+    start = time.perf_counter()
+    direct = DirectForecaster(analyzer.models[family], horizon=horizon, strategy=args.strategy,
+                              scaler=analyzer.scaler_for_model(family)).fit(analyzer.X_train, analyzer.y_train)
+    fit_seconds = time.perf_counter() - start
+
+    n_train = len(analyzer.X_train)
+    X_all = pd.concat([analyzer.X_train, analyzer.X_test]).to_numpy()
+    sales = analyzer.df['sales'].to_numpy(dtype=float)
+    dates = pd.to_datetime(analyzer.df['sale_date'])
+    # Origin i = the last known row; its horizon is rows i+1 .. i+horizon
+    origins = list(range(n_train - 1, len(sales) - horizon - 1, args.step))
+    if not origins:
+        print(f"Test period too short for a {horizon}-day backtest")
+        return
+
+    errors = {'recursive': [], 'direct': []}
+    latency = {'recursive': [], 'direct': []}
+    for i in origins:
+        actual = sales[i + 1:i + 1 + horizon]
+        future_dates = pd.date_range(start=dates.iloc[i] + pd.Timedelta(days=1), periods=horizon)
+        t0 = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            recursive = analyzer._recursive_forecast(future_dates, model_name=family, origin=i + 1)
+        latency['recursive'].append(time.perf_counter() - t0)
+        t0 = time.perf_counter()
+        batched = direct.predict(X_all[i:i + 1])[0]
+        latency['direct'].append(time.perf_counter() - t0)
+        errors['recursive'].append(recursive - actual)
+        errors['direct'].append(batched - actual)
+
+    print(f"\n{family}: {len(origins)} origins, {horizon}-day horizon, direct strategy "
+          f"{direct.strategy_} ({len(direct.models_)} model(s), fit {fit_seconds:.1f}s)")
+    print(f"{'method':<10} {'ms/forecast':>12} " + ' '.join(f"{f'RMSE d{a}-{min(b, horizon)}':>14}"
+                                                         for a, b in BUCKETS if a <= horizon)
+          + f" {'RMSE all':>10} {'MAE all':>9}")
+    for method in ('recursive', 'direct'):
+        err = np.array(errors[method])
+        cells = [np.sqrt(np.mean(err[:, a - 1:b] ** 2)) for a, b in BUCKETS if a <= horizon]
+        print(f"{method:<10} {np.median(latency[method]) * 1000:>12.2f} "
+              + ' '.join(f"{c:>14.3f}" for c in cells)
+              + f" {np.sqrt(np.mean(err ** 2)):>10.3f} {np.mean(np.abs(err)):>9.3f}")
+    speedup = np.median(latency['recursive']) / max(np.median(latency['direct']), 1e-9)
+    print(f"Direct forecast is {speedup:.1f}x faster per forecast")
+
+
+if __name__ == '__main__':
+    main()
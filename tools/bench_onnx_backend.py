@@ -0,0 +1,76 @@
+"""
+Per-step latency of the recursive forecast: sklearn predict vs the fused ONNX graph.
+
+For every trained model family (loaded from the model cache or trained), converts the
+scaler + model to one ONNX graph (onnx_backend.fused_onnx) and times what one forecast
+step costs on raw test-set feature rows:
+ - sklearn: scale the row, then model.predict on a (1, F) array;
+ - onnx:    OnnxModel.predict_row (reused session, preallocated IO binding).
+It also reports the largest prediction difference between the two over the test split,
+and flags families whose drift exceeds PARITY_RTOL (the export and backend='onnx' refuse
+those).
+Families skl2onnx cannot convert are listed with the reason.
+
+Usage: python tools/bench_onnx_backend.py --db path/to/app.db [--rows 200]
+"""
+import argparse
+import os
+import sys
+import time
+import warnings
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ensembles import ENSEMBLE_NAMES
+from model_registry import scale_row
+from onnx_backend import PARITY_RTOL, OnnxModel, fused_onnx
+from predict_ml_sales import SalesMLAnalyzer
+
+warnings.filterwarnings('ignore')
+
+
+def per_row_seconds(predict, rows):
+    times = np.empty(len(rows))
+    for i, row in enumerate(rows):
+        t0 = time.perf_counter()
+        predict(row)
+        times[i] = time.perf_counter() - t0
+    return float(np.median(times))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--db', required=True)
+    parser.add_argument('--rows', type=int, default=200, help='test rows timed per family')
+    args = parser.parse_args()
+
+    analyzer = SalesMLAnalyzer(None, db_path=args.db)
+    analyzer.plot_enabled = False
+    analyzer.load_and_preprocess_data()
+    analyzer.prepare_features()
+    analyzer.train_models()
+
+    X_test = analyzer.X_test.to_numpy(dtype=np.float64)
+    rows = X_test[:args.rows]
+    print(f"\n{'family':<24} {'sklearn us':>11} {'onnx us':>9} {'speedup':>8} {'max |diff|':>11}  note")
+    for name in analyzer.models:
+        if name in ENSEMBLE_NAMES:
+            continue
+        model, scaler = analyzer.models[name], analyzer.scaler_for_model(name)
+        try:
+            onnx_model = OnnxModel(fused_onnx(model, scaler, X_test.shape[1]))
+        except Exception as e:
+            print(f"{name:<24} {'':>11} {'':>9} {'':>8} {'':>11}  not convertible: {str(e).splitlines()[0][:60]}")
+            continue
+        sk = per_row_seconds(lambda r: model.predict(scale_row(scaler, r).reshape(1, -1)), rows)
+        ox = per_row_seconds(onnx_model.predict_row, rows.astype(np.float32))
+        X_in = X_test if scaler is None else scaler.transform(X_test)
+        expected = np.asarray(model.predict(X_in), dtype=float)
+        diff = np.max(np.abs(expected - onnx_model.predict(X_test)))
+        note = 'refused: drifts from sklearn' if diff > PARITY_RTOL * max(np.max(np.abs(expected)), 1.0) else ''
+        print(f"{name:<24} {sk * 1e6:>11.1f} {ox * 1e6:>9.1f} {sk / ox:>7.1f}x {diff:>11.4f}  {note}")
+
+
+if __name__ == '__main__':
+    main()
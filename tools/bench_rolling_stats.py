@@ -0,0 +1,79 @@
+"""Micro-benchmark: batched rolling_stats kernel vs the pandas rolling passes it replaced.
+
+The pandas reference is the original load_and_preprocess_data code: five rolling()
+passes (mean, std, min, max, median) per window plus the std/mean recomputed for the
+volatility features. Both sides produce the same columns; the max relative difference is
+reported next to the timings. It grows with the series length because pandas keeps
+running add/remove sums that accumulate rounding, while the kernel sums each window afresh.
+
+Usage: python tools/bench_rolling_stats.py [--sizes 1000 100000 10000000] [--repeat 3]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from feature_engine import WINDOWS
+from rolling_stats import STATS, rolling_stats
+
+
+def pandas_reference(sales):
+    s = pd.Series(sales)
+    out = {}
+    for w in WINDOWS:
+        out[('mean', w)] = s.rolling(window=w).mean().to_numpy()
+        out[('std', w)] = s.rolling(window=w).std().to_numpy()
+        out[('min', w)] = s.rolling(window=w).min().to_numpy()
+        out[('max', w)] = s.rolling(window=w).max().to_numpy()
+        out[('median', w)] = s.rolling(window=w).median().to_numpy()
+    for w in (7, 30):
+        out[('volatility', w)] = (s.rolling(window=w).std() / (s.rolling(window=w).mean() + 1e-8)).to_numpy()
+    return out
+
+
+def kernel(sales):
+    out = rolling_stats(sales, WINDOWS, STATS)
+    for w in (7, 30):
+        out[('volatility', w)] = out[('std', w)] / (out[('mean', w)] + 1e-8)
+    return out
+
+
+def best_of(fn, sales, repeat):
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        result = None  # release the previous run's columns before timing the next
+        start = time.perf_counter()
+        result = fn(sales)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000, 100_000, 10_000_000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'days':>12} {'pandas (s)':>12} {'kernel (s)':>12} {'speedup':>8} {'max rel diff':>14}")
+    for n in args.sizes:
+        sales = 1000 + 200 * np.sin(np.arange(n) * 2 * np.pi / 7) + rng.normal(0, 50, n)
+        t_pandas, ref = best_of(pandas_reference, sales, args.repeat)
+        t_kernel, got = best_of(kernel, sales, args.repeat)
+        diff = 0.0
+        for key, expected in ref.items():
+            same_nan = np.array_equal(np.isnan(expected), np.isnan(got[key]))
+            if not same_nan:
+                raise AssertionError(f"NaN layout differs for {key}")
+            rel = np.abs(got[key] - expected) / np.maximum(1.0, np.abs(expected))
+            diff = max(diff, float(np.nanmax(rel)) if n > max(WINDOWS) else 0.0)
+        del ref, got
+        print(f"{n:>12} {t_pandas:>12.4f} {t_kernel:>12.4f} {t_pandas / t_kernel:>7.2f}x {diff:>14.2e}")
+
+
+if __name__ == '__main__':
+    main()
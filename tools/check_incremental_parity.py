@@ -0,0 +1,82 @@
+"""Parity check for SalesMLAnalyzer.load_and_preprocess_data(incremental=True).
+
+Builds a throwaway SQLite DB with a synthetic store_sales table, primes the persisted
+feature state with a full build, then simulates several nightly runs that each append
+new days and load incrementally. After every night the incremental frame must match a
+fresh full rebuild of the same table.
+
+Usage: python tools/check_incremental_parity.py
+"""
+import os
+import sys
+import sqlite3
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from predict_ml_sales import SalesMLAnalyzer, TABLE_NAME
+
+INITIAL_DAYS = 365
+NIGHTS = [1, 1, 3, 1, 45]  # days landing before each incremental run
+
+
+def make_rows(start, n, rng):
+    dates = pd.date_range(start, periods=n)
+    base = 1000 + 200 * np.sin(np.arange(n) * 2 * np.pi / 7)
+    sales = np.round(base + rng.normal(0, 50, n), 2)
+    return [(d.strftime('%Y-%m-%d'), d.day_name(), d.month, int(d.month == 12 and d.day == 25), float(s))
+            for d, s in zip(dates, sales)]
+
+
+def insert_rows(db_path, rows):
+    with sqlite3.connect(db_path) as conn:
+        conn.executemany(
+            f"INSERT INTO {TABLE_NAME}(sale_date, day_of_week, month, holiday_flag, sales) VALUES (?,?,?,?,?)",
+            rows
+        )
+
+
+def create_db(db_path):
+    with sqlite3.connect(db_path) as conn:
+        conn.execute(f"""
+            CREATE TABLE {TABLE_NAME}(
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                sale_date DATE NOT NULL UNIQUE,
+                day_of_week TEXT NOT NULL,
+                month INTEGER NOT NULL,
+                holiday_flag INTEGER NOT NULL DEFAULT 0,
+                sales REAL NOT NULL
+            )
+        """)
+
+
+def main():
+    rng = np.random.default_rng(7)
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'app.db')
+        create_db(db_path)
+        start = pd.Timestamp('2023-01-01')
+        insert_rows(db_path, make_rows(start, INITIAL_DAYS, rng))
+        next_day = start + pd.Timedelta(days=INITIAL_DAYS)
+
+        nightly = SalesMLAnalyzer(None, db_path=db_path, cache_dir=os.path.join(tmp, 'state'))
+        nightly.load_and_preprocess_data(use_cache=False)
+
+        for n_new in NIGHTS:
+            insert_rows(db_path, make_rows(next_day, n_new, rng))
+            next_day += pd.Timedelta(days=n_new)
+
+            incremental = nightly.load_and_preprocess_data(incremental=True, use_cache=False)
+            full = SalesMLAnalyzer(None, db_path=db_path, cache_dir=os.path.join(tmp, 'fresh')).load_and_preprocess_data(use_cache=False)
+            # Windows are recomputed from the same halo values and EMAs resume from the saved
+            # recursion state, so the incremental frame is bit-identical to a full rebuild
+            pd.testing.assert_frame_equal(incremental, full, check_exact=True)
+            print(f"Parity OK after {n_new} new day(s): {incremental.shape}")
+
+    print('Incremental loader matches full rebuild')
+
+
+if __name__ == '__main__':
+    main()
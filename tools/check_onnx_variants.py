@@ -0,0 +1,59 @@
+"""Check that the fp16 ONNX variant of a fused scaler + model graph is written and loads.
+
+Fits StandardScaler + MLP and StandardScaler + Gaussian process on synthetic, sales-sized
+features, exports each as one fused graph (onnx_backend.fused_onnx) and runs
+write_variants() into a temporary directory. sales_forecast_fp16.onnx must be written,
+load in a plain ONNX Runtime session and agree with the float32 graph within
+VARIANT_RTOL.
+
+Usage: python tools/check_onnx_variants.py
+"""
+import os
+import sys
+import tempfile
+import warnings
+
+import numpy as np
+from sklearn.gaussian_process import GaussianProcessRegressor
+from sklearn.neural_network import MLPRegressor
+from sklearn.preprocessing import StandardScaler
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from onnx_backend import VARIANT_RTOL, format_variants, fused_onnx, write_variants
+
+warnings.filterwarnings('ignore')
+
+N_FEATURES = 20
+
+
+def main():
+    import onnxruntime as ort
+
+    rng = np.random.default_rng(7)
+    X = rng.normal(1000, 300, (300, N_FEATURES)).astype(np.float32)
+    y = 2 * X[:, 0] + X[:, 1] + rng.normal(0, 10, len(X))
+    for model in (MLPRegressor(hidden_layer_sizes=(64, 32), max_iter=300, random_state=0),
+                  GaussianProcessRegressor()):
+        scaler = StandardScaler().fit(X)
+        model.fit(scaler.transform(X), y)
+        onx = fused_onnx(model, scaler, N_FEATURES)
+        with tempfile.TemporaryDirectory() as tmp:
+            onnx_path = os.path.join(tmp, 'sales_forecast.onnx')
+            with open(onnx_path, 'wb') as fh:
+                fh.write(onx.SerializeToString())
+            records = write_variants(onx, onnx_path, X[:50])
+            print(f"{type(model).__name__}:\n{format_variants(records)}")
+            fp16_path = os.path.join(tmp, 'sales_forecast_fp16.onnx')
+            assert os.path.exists(fp16_path), 'fp16 variant was not written'
+            outputs = []
+            for path in (onnx_path, fp16_path):
+                session = ort.InferenceSession(path, providers=['CPUExecutionProvider'])
+                outputs.append(session.run(None, {session.get_inputs()[0].name: X[:50]})[0].reshape(-1))
+            reference, fp16 = outputs
+            assert np.max(np.abs(fp16 - reference)) <= VARIANT_RTOL * np.max(np.abs(reference))
+
+    print('fp16 variants of the fused graphs load and match the float32 graphs')
+
+
+if __name__ == '__main__':
+    main()
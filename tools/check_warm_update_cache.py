@@ -0,0 +1,90 @@
+"""Check that a nightly warm-start update survives into the next train_models run.
+
+Builds a throwaway SQLite DB with a synthetic store_sales table, tunes a small set of
+families, and runs update_models() on the tree family. A fresh analyzer (a new process
+in production) on the same data then runs train_models(). The tree family must be loaded
+from the model cache as the warm update, not retuned, and stay out of the ensembles
+because it has no out-of-fold predictions. This is checked with the configured search
+settings and with a search/fit_budget override, whose cache keys differ.
+
+Usage: python tools/check_warm_update_cache.py
+"""
+import os
+import sys
+import tempfile
+import warnings
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from check_incremental_parity import create_db, insert_rows, make_rows
+from predict_ml_sales import SalesMLAnalyzer
+
+warnings.filterwarnings('ignore')
+
+FAMILIES = {
+    'Ridge Regression': None,
+    'Lasso Regression': None,
+    'ElasticNet': None,
+    'Extra Trees': {'n_estimators': [50], 'max_depth': [10]},
+}
+TREE_FAMILY = 'Extra Trees'
+# train_models settings per scenario; each must find its own warm-updated entry
+SCENARIOS = [{}, {'search': 'bayes', 'fit_budget': 10}]
+
+
+def analyzer(db_path, cache_dir):
+    """Analyzer limited to FAMILIES (small grids keep the check fast)"""
+    an = SalesMLAnalyzer(None, db_path=db_path, cache_dir=cache_dir)
+    an.plot_enabled = False
+    full_config = an.get_models_config
+
+    def small_config():
+        config = full_config()
+        config = {name: config[name] for name in FAMILIES}
+        for name, params in FAMILIES.items():
+            if params is not None:
+                config[name]['params'] = params
+        return config
+
+    an.get_models_config = small_config
+    an.load_and_preprocess_data(use_cache=False)
+    an.prepare_features()
+    return an
+
+
+def check(tmp, settings, rng):
+    db_path = os.path.join(tmp, 'app.db')
+    cache_dir = os.path.join(tmp, 'state')
+    create_db(db_path)
+    insert_rows(db_path, make_rows(pd.Timestamp('2023-01-01'), 400, rng))
+
+    nightly = analyzer(db_path, cache_dir)
+    nightly.train_models(n_cores=1, **settings)
+    # A generous tolerance keeps the warm update rather than falling back to a refit
+    report = nightly.update_models(families=[TREE_FAMILY], tolerance=1.0)
+    assert report['Action'].tolist() == ['warm_start'], report
+    updated = np.asarray(nightly.results[TREE_FAMILY]['predictions'])
+
+    fresh = analyzer(db_path, cache_dir)
+    fresh.train_models(n_cores=1, **settings)
+    search = fresh.results[TREE_FAMILY]['search']
+    assert search.get('cached') and search['mode'] == 'warm_start', (settings, search)
+    np.testing.assert_allclose(fresh.results[TREE_FAMILY]['predictions'], updated)
+    assert fresh.oof_predictions[TREE_FAMILY] is None
+    assert TREE_FAMILY not in fresh.models['Voting Ensemble'].names
+
+
+def main():
+    rng = np.random.default_rng(7)
+    for settings in SCENARIOS:
+        with tempfile.TemporaryDirectory() as tmp:
+            check(tmp, settings, rng)
+        print(f"Warm update reloaded from the model cache with train_models({settings})")
+
+    print('Warm update was loaded from the model cache by the next train_models run')
+
+
+if __name__ == '__main__':
+    main()
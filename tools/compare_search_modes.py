@@ -0,0 +1,77 @@
+"""Compare budgeted hyperparameter search against the exhaustive GridSearchCV optimum.
+
+For each model family, runs the exhaustive grid and the budgeted mode configured in
+SalesMLAnalyzer.get_models_config() (or --mode) on the same training split. It then reports:
+ - the CV MSE of the parameters each search picked, re-scored with full resources on the
+   same folds, and the gap of the budgeted pick to the grid optimum (0% = found the optimum);
+ - the number of CV fits and the wall time of each search, and the time saved.
+
+Usage: python tools/compare_search_modes.py --db path/to/app.db [--families "Random Forest" SVR] [--mode halving]
+"""
+import argparse
+import os
+import sys
+import warnings
+
+import numpy as np
+from sklearn.base import clone
+from sklearn.model_selection import TimeSeriesSplit, cross_val_score
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from model_search import DEFAULT_FIT_BUDGET, search
+from predict_ml_sales import SalesMLAnalyzer
+
+warnings.filterwarnings('ignore')
+
+
+def full_cv_mse(estimator, params, X, y, cv):
+    model = clone(estimator).set_params(**params)
+    return -cross_val_score(model, X, y, cv=cv, scoring='neg_mean_squared_error', n_jobs=-1).mean()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--db', required=True)
+    parser.add_argument('--families', nargs='*', help='model families to compare (default: all non-grid ones)')
+    parser.add_argument('--mode', choices=['halving', 'bayes'], help='override the configured search mode')
+    parser.add_argument('--fit-budget', type=int, default=DEFAULT_FIT_BUDGET)
+    args = parser.parse_args()
+
+    analyzer = SalesMLAnalyzer(None, db_path=args.db)
+    analyzer.plot_enabled = False
+    analyzer.load_and_preprocess_data()
+    analyzer.prepare_features()
+    config = analyzer.get_models_config()
+    families = args.families or [name for name, c in config.items() if c.get('search', 'grid') != 'grid']
+
+    rows = []
+    for name in families:
+        c = config[name]
+        mode = args.mode or c.get('search', 'grid')
+        if mode == 'grid':
+            print(f"Skipping {name}: configured for exhaustive grid search")
+            continue
+        X, _ = analyzer.scaled_inputs(c['scaler'])
+        y = analyzer.y_train
+        cv = TimeSeriesSplit(n_splits=5)
+        print(f"\n{name}: grid vs {mode}...")
+        grid = search(c['model'], c['params'], X, y, cv, mode='grid')
+        fast = search(c['model'], c['params'], X, y, cv, mode=mode, fit_budget=args.fit_budget)
+        grid_mse = -grid.best_score_
+        fast_mse = full_cv_mse(c['model'], fast.best_params_, X, y, cv)
+        rows.append((name, mode, grid_mse, fast_mse, grid, fast))
+        print(f"  grid:  {grid.n_fits:4d} fits {grid.elapsed:8.1f}s  CV MSE {grid_mse:.4f}  {grid.best_params_}")
+        print(f"  {mode}: {fast.n_fits:4d} fits {fast.elapsed:8.1f}s  CV MSE {fast_mse:.4f}  {fast.best_params_}")
+
+    if not rows:
+        return
+    print(f"\n{'family':<20} {'mode':<8} {'gap to optimum':>15} {'fits':>11} {'grid s':>9} {'fast s':>9} {'saved':>7}")
+    for name, mode, grid_mse, fast_mse, grid, fast in rows:
+        gap = (fast_mse - grid_mse) / grid_mse if grid_mse else np.nan
+        saved = 1 - fast.elapsed / grid.elapsed if grid.elapsed else np.nan
+        print(f"{name:<20} {mode:<8} {gap:>14.2%} {fast.n_fits:>5}/{grid.n_fits:<5} "
+              f"{grid.elapsed:>9.1f} {fast.elapsed:>9.1f} {saved:>6.0%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,65 @@
-from predict_ml_sales import SalesMLAnalyzer
-
-an = SalesMLAnalyzer(None)
-print('Loading and preprocessing data...')
-dan = an.load_and_preprocess_data()
-print('Preparing features...')
-an.prepare_features()
-# If models not trained, run training pipeline which also exports model; otherwise use existing models
-if not an.models:
-    print('No trained models in current session. Running complete analysis (this will train models and export).')
-    an.run_complete_analysis()
-else:
-    future = an.predict_future_sales()
-    print('\nPython 30-day predictions:')
+"""
+Print the 30-day Python forecast.
+
+Fast path: the latest model published to the registry (.ml_cache/registry, written by
+run_complete_analysis) is loaded, memory-mapped, and rolled forward; nothing is trained
+and the analysis code is not even imported. The slow path runs when there is no
+registered model, when store_sales changed since it was published (unless --allow-stale)
+or with --retrain: it loads cached fits, trains only what is missing and publishes the
+result for the next run.
+
+Usage: python tools/run_python_predict.py [--days 30] [--db-path app.db] [--allow-stale] [--retrain]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from model_registry import DEFAULT_REGISTRY_DIR, ModelRegistry
+
+
+def slow_path(db_path, days):
+    from predict_ml_sales import SalesMLAnalyzer
+
+    an = SalesMLAnalyzer(None, db_path=db_path)
+    print('Loading and preprocessing data...')
+    an.load_and_preprocess_data(incremental=True)
+    print('Preparing features...')
+    an.prepare_features()
+    # Fits already in the model cache (.ml_cache/models) are loaded instead of retrained, so
+    # this only trains what changed since the last run (no full analysis/export needed)
+    print('Loading cached models (training only missing ones)...')
+    an.train_models()
+    an.publish_best_model()
+    return an.predict_future_sales(days)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--db-path', help='app DB (default: the one the registered model was trained on)')
+    parser.add_argument('--allow-stale', action='store_true', help='use the registered model even if the DB changed')
+    parser.add_argument('--retrain', action='store_true', help='skip the registry and train missing models')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    registered = None if args.retrain else ModelRegistry(DEFAULT_REGISTRY_DIR).load()
+    db_path = args.db_path or (registered.meta.get('db_path') if registered else None)
+    if registered is not None and not args.allow_stale and db_path and registered.is_stale(db_path):
+        print(f"store_sales changed since registry version {registered.version}; retraining")
+        registered = None
+
+    if registered is None:
+        future = slow_path(db_path, args.days)
+    else:
+        future = registered.forecast(args.days, db_path=db_path)
+        meta = registered.meta
+        print(f"Registry version {registered.version}: {meta['model_name']} (RMSE {meta['metrics']['RMSE']:.4f}), "
+              f"data up to {meta['watermark']['last_sale_date']}, forecast in {time.perf_counter() - start:.2f}s")
+    print(f'\nPython {args.days}-day predictions:')
     print(future.to_string(index=False, float_format='%.2f'))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,17 +1,25 @@
 """
 Headless runner to train a compact TF model from the project's SQLite DB and export SavedModel + TFLite.
 Usage: python tools/run_train_export.py
-This script reads the SQLite DB at the path hard-coded below (from your project), builds features similar to predict_ml_sales.py,
+This script reads the SQLite DB at the path hard-coded below (from your project), builds the SEQUENCE_FEATURES set with feature_engine.py,
 trains a Conv1D model on sequences, and writes artifacts to export/.
 """
 
 import os
+import sys
 import sqlite3
 import numpy as np
 import pandas as pd
 import json
 from datetime import datetime
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from feature_cache import cached_feature_frame
+from feature_engine import FEATURE_VERSION, SEQUENCE_FEATURES, build_feature_frame
+from int8_calibration import convert_full_int8
+from tflite_eval import evaluate_artifacts, format_report
+from windowed_dataset import WindowedDataset
+
 os.environ['PYTHONHASHSEED'] = '42'
 import random
 random.seed(42)
@@ -28,86 +36,21 @@ EXPORT_DIR = 'export'
 
 os.makedirs(EXPORT_DIR, exist_ok=True)
 
-# 1) Load data from SQLite
-print('Opening DB:', DB_PATH)
-with sqlite3.connect(DB_PATH) as conn:
+
+def load_and_build(conn):
     query = f"SELECT id, sale_date, day_of_week, month, holiday_flag, sales FROM {TABLE_NAME} ORDER BY sale_date"
     df = pd.read_sql_query(query, conn, parse_dates=['sale_date'])
+    print('Loaded rows:', len(df))
+    if df.empty:
+        raise SystemExit('No data found in DB')
+    df = df.sort_values('sale_date').reset_index(drop=True)
+    return build_feature_frame(df, SEQUENCE_FEATURES).dropna().reset_index(drop=True)
 
-print('Loaded rows:', len(df))
-if df.empty:
-    raise SystemExit('No data found in DB')
-
-# 2) Basic preprocessing (adapted)
-df['sale_date'] = pd.to_datetime(df['sale_date'])
-if 'month' not in df.columns:
-    df['month'] = df['sale_date'].dt.month
-if 'holiday_flag' not in df.columns:
-    df['holiday_flag'] = 0
-if 'day_of_week' not in df.columns:
-    df['day_of_week'] = df['sale_date'].dt.day_name()
-
-# sort
-df = df.sort_values('sale_date').reset_index(drop=True)
-
-# feature engineering (same as notebook)
-df_proc = df.copy()
-df_proc['year'] = df_proc['sale_date'].dt.year
-df_proc['day'] = df_proc['sale_date'].dt.day
-df_proc['quarter'] = df_proc['sale_date'].dt.quarter
-df_proc['weekday'] = df_proc['sale_date'].dt.weekday
-df_proc['week_of_year'] = df_proc['sale_date'].dt.isocalendar().week
-df_proc['day_of_year'] = df_proc['sale_date'].dt.dayofyear
-
-df_proc['is_weekend'] = (df_proc['weekday'] >= 5).astype(int)
-df_proc['is_month_start'] = df_proc['sale_date'].dt.is_month_start.astype(int)
-df_proc['is_month_end'] = df_proc['sale_date'].dt.is_month_end.astype(int)
-df_proc['is_quarter_start'] = df_proc['sale_date'].dt.is_quarter_start.astype(int)
-df_proc['is_quarter_end'] = df_proc['sale_date'].dt.is_quarter_end.astype(int)
-
-# day_of_week encoded
-mapping = {'Monday':0,'Tuesday':1,'Wednesday':2,'Thursday':3,'Friday':4,'Saturday':5,'Sunday':6}
-if df_proc['day_of_week'].dtype == object:
-    df_proc['day_of_week_encoded'] = df_proc['day_of_week'].map(mapping).fillna(df_proc['weekday']).astype(int)
-else:
-    df_proc['day_of_week_encoded'] = pd.to_numeric(df_proc['day_of_week'], errors='coerce').fillna(df_proc['weekday']).astype(int)
-
-# cyclical
-import numpy as np
-for col, period in [('month',12), ('day',31), ('weekday',7), ('quarter',4), ('week_of_year',52)]:
-    if col in df_proc.columns:
-        df_proc[f'{col}_sin'] = np.sin(2*np.pi*df_proc[col]/period)
-        df_proc[f'{col}_cos'] = np.cos(2*np.pi*df_proc[col]/period)
-
-# lags
-for lag in [1,2,3,7,14,21,30]:
-    df_proc[f'sales_lag{lag}'] = df_proc['sales'].shift(lag)
-
-# rolling stats
-for w in [3,7,14,21,30]:
-    df_proc[f'sales_ma{w}'] = df_proc['sales'].rolling(window=w).mean()
-    df_proc[f'sales_std{w}'] = df_proc['sales'].rolling(window=w).std()
-
-# ema
-for span in [7,14,30]:
-    df_proc[f'sales_ema{span}'] = df_proc['sales'].ewm(span=span).mean()
-
-# diffs
-df_proc['sales_diff1'] = df_proc['sales'].diff(1)
-df_proc['sales_diff7'] = df_proc['sales'].diff(7)
-
-# ratios
-if 'sales_ma7' in df_proc.columns:
-    df_proc['sales_to_ma7_ratio'] = df_proc['sales'] / (df_proc['sales_ma7'] + 1e-8)
-if 'sales_ma30' in df_proc.columns:
-    df_proc['sales_to_ma30_ratio'] = df_proc['sales'] / (df_proc['sales_ma30'] + 1e-8)
-
-# detrended
-if 'sales_ma30' in df_proc.columns:
-    df_proc['sales_detrended'] = df_proc['sales'] - df_proc['sales_ma30']
-
-# drop nans
-df_proc = df_proc.dropna().reset_index(drop=True)
+
+# 1) Load data from SQLite and 2) engineer features (shared through the feature cache)
+print('Opening DB:', DB_PATH)
+with sqlite3.connect(DB_PATH) as conn:
+    df_proc = cached_feature_frame(conn, 'sequence', FEATURE_VERSION, lambda: load_and_build(conn), table=TABLE_NAME)
 print('After feature engineering, rows:', len(df_proc))
 
 # features list
@@ -127,23 +70,18 @@ X_scaled = scaler.transform(X)
 joblib.dump(scaler, os.path.join(EXPORT_DIR, 'scaler.joblib'))
 np.savez(os.path.join(EXPORT_DIR, 'scaler_params.npz'), mean=scaler.mean_, scale=scaler.scale_)
 
-def build_sequences(X, y, window):
-    Xs, ys = [], []
-    for i in range(window, len(X)):
-        Xs.append(X[i-window:i])
-        ys.append(y[i])
-    return np.array(Xs), np.array(ys)
-
-X_seq, y_seq = build_sequences(X_scaled, y, window_size)
-print('Sequence shapes:', X_seq.shape, y_seq.shape)
+# Windows are strided views over one float32 copy of X_scaled; batches are built on the fly
+sequences = WindowedDataset(X_scaled, y, window_size)
+n_features = sequences.n_features
+print('Sequence shapes:', sequences.shape, sequences.targets.shape)
 
-train_n = int(0.8 * len(X_seq))
-X_train, y_train = X_seq[:train_n], y_seq[:train_n]
-X_val, y_val = X_seq[train_n:], y_seq[train_n:]
+train_n = sequences.split(0.8)
+train_ds = sequences.tf_dataset(batch_size=32, stop=train_n, shuffle=True)
+val_ds = sequences.tf_dataset(batch_size=32, start=train_n)
 
 # Build model (Conv1D compact)
 from tensorflow.keras import layers, models
-input_shape = (window_size, X_seq.shape[2])
+input_shape = (window_size, n_features)
 inputs = layers.Input(shape=input_shape)
 x = layers.Conv1D(64, 3, activation='relu', padding='same')(inputs)
 x = layers.Conv1D(32, 3, activation='relu', padding='same')(x)
@@ -158,7 +96,7 @@ model.summary()
 # Train briefly
 ckpt = os.path.join(EXPORT_DIR, 'best_model.h5')
 cb = [tf.keras.callbacks.EarlyStopping(monitor='val_loss', patience=6, restore_best_weights=True), tf.keras.callbacks.ModelCheckpoint(ckpt, save_best_only=True)]
-model.fit(X_train, y_train, validation_data=(X_val,y_val), epochs=40, batch_size=32, callbacks=cb)
+model.fit(train_ds, validation_data=val_ds, epochs=40, callbacks=cb)
 
 # Save (use tf.saved_model.save for SavedModel format)
 saved_model_dir = os.path.join(EXPORT_DIR, 'saved_model')
@@ -176,7 +114,7 @@ class ModelWrapper(tf.Module):
         super().__init__()
         self.model = model
 
-    @tf.function(input_signature=[tf.TensorSpec([None, None, X_seq.shape[2]], tf.float32)])
+    @tf.function(input_signature=[tf.TensorSpec([None, None, n_features], tf.float32)])
     def serve(self, x):
         return {'outputs': self.model(x)}
 
@@ -195,7 +133,7 @@ print('SavedModel & h5 exported')
 with open(os.path.join(EXPORT_DIR, 'feature_order.json'), 'w') as f:
     json.dump(feature_cols, f)
 
-# Convert to TFLite float
+# Make sure a SavedModel exists (fallback source for the float TFLite)
 if not os.path.exists(saved_model_dir):
     # Try converting from HDF5 to SavedModel using Keras API
     h5path = os.path.join(EXPORT_DIR, 'model.h5')
@@ -208,83 +146,50 @@ if not os.path.exists(saved_model_dir):
         except Exception as e:
             print('Failed to convert HDF5 -> SavedModel:', e)
 
-if os.path.exists(saved_model_dir):
-    try:
-        converter = tf.lite.TFLiteConverter.from_saved_model(saved_model_dir)
-        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS]
-        with open(os.path.join(EXPORT_DIR, 'model.tflite'), 'wb') as f:
-            f.write(converter.convert())
-        print('Wrote float TFLite')
-    except Exception as e:
-        print('TFLite conversion from SavedModel failed:', e)
-        # Try converting directly from Keras model
+# Float TFLite from the in-memory Keras model first: converting the tf.Module SavedModel
+# leaves READ_VARIABLE ops on resource variables that the interpreter cannot run
+try:
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    with open(os.path.join(EXPORT_DIR, 'model.tflite'), 'wb') as f:
+        f.write(converter.convert())
+    print('Wrote float TFLite from Keras model')
+except Exception as e:
+    print('TFLite conversion from Keras model failed:', e)
+    if os.path.exists(saved_model_dir):
         try:
-            kmodel = tf.keras.models.load_model(os.path.join(EXPORT_DIR, 'model.h5'))
-            converter2 = tf.lite.TFLiteConverter.from_keras_model(kmodel)
+            converter = tf.lite.TFLiteConverter.from_saved_model(saved_model_dir)
+            converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS]
             with open(os.path.join(EXPORT_DIR, 'model.tflite'), 'wb') as f:
-                f.write(converter2.convert())
-            print('Wrote float TFLite from Keras model')
+                f.write(converter.convert())
+            print('Wrote float TFLite from SavedModel')
         except Exception as e2:
-            print('Fallback TFLite conversion failed:', e2)
-else:
-    print('SavedModel not found; skipping TFLite float conversion')
+            print('Fallback TFLite conversion from SavedModel failed:', e2)
+    else:
+        print('SavedModel not found; skipping TFLite float conversion')
 
-# Representative for quant
-def representative_gen():
-    for i in range(min(500, X_train.shape[0])):
-        yield [X_train[i:i+1].astype(np.float32)]
+# Full-int8 from the trained Keras model, calibrated on a stratified sample of training
+# windows; the activation ranges are cached in .ml_cache/calibration (int8_calibration.py)
+target_dates = df_proc['sale_date'].values[window_size:]
+target_holidays = df_proc['holiday_flag'].values[window_size:]
 
 
-def try_convert_int8_from_saved_model_or_h5():
-    """Try to produce an INT8 fully-quantized TFLite model from SavedModel or
-    from a Keras HDF5 model. Return True if successful (and file written).
-    """
-    # Try SavedModel first
+def try_convert_int8():
+    """Write model_quant.tflite (int8 input/output); return True if successful"""
     try:
-        if os.path.isdir(saved_model_dir) and os.path.exists(os.path.join(saved_model_dir, 'saved_model.pb')):
-            print('Full int quant: attempting from SavedModel...')
-            c = tf.lite.TFLiteConverter.from_saved_model(saved_model_dir)
-            c.optimizations = [tf.lite.Optimize.DEFAULT]
-            c.representative_dataset = representative_gen
-            c.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
-            c.inference_input_type = tf.int8
-            c.inference_output_type = tf.int8
-            tfl = c.convert()
-            with open(os.path.join(EXPORT_DIR, 'model_quant.tflite'), 'wb') as f:
-                f.write(tfl)
-            print('Wrote quantized TFLite (from SavedModel)')
-            return True
+        tfl, info = convert_full_int8(model, sequences.windows, target_dates, target_holidays, stop=train_n)
+        with open(os.path.join(EXPORT_DIR, 'model_quant.tflite'), 'wb') as f:
+            f.write(tfl)
+        print(f"Wrote quantized TFLite ({info['samples']} calibration windows, {info['strata']['holiday']} on "
+              f"holidays; calibration {'reused from cache' if info['cache_hit'] else 'computed'})")
+        return True
     except Exception as e:
-        print('Full int quant from SavedModel failed:', e)
-
-    # Fallback: try from Keras HDF5
-    h5_path = os.path.join(EXPORT_DIR, 'best_model.h5')
-    if os.path.exists(h5_path):
-        try:
-            print('Full int quant: attempting from Keras HDF5 model...')
-            keras_model = tf.keras.models.load_model(h5_path, compile=False)
-            c = tf.lite.TFLiteConverter.from_keras_model(keras_model)
-            c.optimizations = [tf.lite.Optimize.DEFAULT]
-            c.representative_dataset = representative_gen
-            c.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
-            c.inference_input_type = tf.int8
-            c.inference_output_type = tf.int8
-            tfl = c.convert()
-            with open(os.path.join(EXPORT_DIR, 'model_quant.tflite'), 'wb') as f:
-                f.write(tfl)
-            print('Wrote quantized TFLite (from HDF5)')
-            return True
-        except Exception as e:
-            print('Full int quant from HDF5 failed:', e)
-    else:
-        print('HDF5 model not found at', h5_path)
-
-    return False
+        print('Full int quant failed:', e)
+        return False
 
 
 # Attempt full-int quantization; if it fails, fall back to dynamic-range quant
 try:
-    ok = try_convert_int8_from_saved_model_or_h5()
+    ok = try_convert_int8()
     if not ok:
         print('Full int quant conversion not produced by any method; trying dynamic-range')
         # Try dynamic-range quantization from SavedModel or HDF5
@@ -348,9 +253,23 @@ try:
 except Exception as e:
     print('Top-level quantization process failed:', e)
 
+# Accuracy of the float and int8 artifacts against the Keras model on the validation windows
+try:
+    report = {name: os.path.join(EXPORT_DIR, name) for name in ('model.tflite', 'model_quant.tflite')
+              if os.path.exists(os.path.join(EXPORT_DIR, name))}
+    if report:
+        val_windows, val_targets = sequences.windows[train_n:], sequences.targets[train_n:]
+        keras_pred = model.predict(val_windows, verbose=0).reshape(-1)
+        records = evaluate_artifacts(report, val_windows, val_targets, keras_pred, threads=(1,))
+        print(format_report(records, float(np.sqrt(np.mean((keras_pred - val_targets) ** 2)))))
+        with open(os.path.join(EXPORT_DIR, 'quant_report.json'), 'w') as f:
+            json.dump(records, f, indent=2)
+except Exception as e:
+    print('Quantization accuracy report failed (non-critical):', e)
+
 # Package
 import zipfile
-meta = {'input_shape':[window_size, X_seq.shape[2]], 'feature_order':feature_cols}
+meta = {'input_shape':[window_size, n_features], 'feature_order':feature_cols}
 with open(os.path.join(EXPORT_DIR, 'metadata.json'),'w') as f:
     json.dump(meta,f)
 
@@ -4,13 +4,16 @@ Improved trainer and exporter that reuses preprocessing from `predict_ml_sales.p
 It will:
  - Load and preprocess data using SalesMLAnalyzer from predict_ml_sales.py
  - Prepare feature matrix and target (next-day sales prediction style used by the app)
- - Run a small hyperparameter sweep over Keras architectures and learning rates
+ - Run a parallel ASHA sweep over Keras architectures, learning rates, dropout and batch
+   sizes (keras_sweep.py): trials run in worker processes and weak ones are stopped at
+   rung checkpoints on holdout RMSE
  - Pick the best model by RMSE on a held-out time-series test split
  - Export the SavedModel and a TFLite model (optionally quantized)
  - Export `sales_forecast_features.json` which lists the feature order
 
 Usage:
   python train_export_improved.py --db-path ".dart_tool/sqflite_common_ffi/databases/app.db" --out-dir assets/models --epochs 100
+  python train_export_improved.py --trials 40 --workers 4 --space sweep_space.json
 
 Requirements:
   pip install tensorflow pandas numpy scikit-learn
@@ -28,31 +31,18 @@ try:
 except Exception:
     raise RuntimeError("TensorFlow is required. Install with: pip install tensorflow")
 
-from sklearn.metrics import mean_squared_error
-
 # Import the analyzer from existing file to reuse preprocessing
 from predict_ml_sales import SalesMLAnalyzer
+from keras_sweep import (DEFAULT_ETA, DEFAULT_MIN_EPOCHS, DEFAULT_TRIALS, ASHASweep,
+                         build_keras_model, load_space, sample_configs)
 
 
-def build_keras_model(input_dim, units=(128, 64), lr=0.001, dropout=0.0):
-    tf.keras.backend.clear_session()
-    inputs = tf.keras.layers.Input(shape=(input_dim,))
-    x = inputs
-    for u in units:
-        x = tf.keras.layers.Dense(u, activation='relu')(x)
-        if dropout and dropout > 0:
-            x = tf.keras.layers.Dropout(dropout)(x)
-    outputs = tf.keras.layers.Dense(1, activation=None)(x)
-    model = tf.keras.Model(inputs=inputs, outputs=outputs)
-    model.compile(optimizer=tf.keras.optimizers.Adam(learning_rate=lr), loss='mse')
-    return model
-
-
-def main(db_path, out_dir, epochs):
+def main(db_path, out_dir, epochs, n_trials=DEFAULT_TRIALS, workers=None, n_cores=None,
+         space_path=None, min_epochs=DEFAULT_MIN_EPOCHS, eta=DEFAULT_ETA):
     print("Loading and preprocessing data using predict_ml_sales.SalesMLAnalyzer...")
-    analyzer = SalesMLAnalyzer(csv_file=None)
-    # override DB path if necessary (SalesMLAnalyzer uses DB_PATH constant), but the class reads DB_PATH constant from predict_ml_sales.
-    # If your environment requires a different DB path, adjust predict_ml_sales.DB_PATH or ensure the DB is at that location.
+    analyzer = SalesMLAnalyzer(csv_file=None, db_path=db_path)
+    # The engineered frame comes from the shared feature cache when the DB is unchanged
+    # since the last predict/train run.
     df = analyzer.load_and_preprocess_data()
 
     # Prepare features similarly to analyzer.prepare_features
@@ -73,36 +63,16 @@ def main(db_path, out_dir, epochs):
     X_train_scaled = scaler.fit_transform(X_train)
     X_test_scaled = scaler.transform(X_test)
 
-    input_dim = X_train_scaled.shape[1]
     print(f"Train shape: {X_train_scaled.shape}, Test shape: {X_test_scaled.shape}")
 
-    # Hyperparameter candidates (small grid)
-    candidates = [
-        {'units': (128,64), 'lr': 1e-3, 'dropout': 0.0},
-        {'units': (256,128,64), 'lr': 1e-3, 'dropout': 0.1},
-        {'units': (64,32), 'lr': 1e-3, 'dropout': 0.0},
-        {'units': (128,64), 'lr': 5e-4, 'dropout': 0.1},
-    ]
-
-    best_rmse = float('inf')
-    best_model = None
-    best_cfg = None
-
-    for cfg in candidates:
-        print(f"Training candidate: units={cfg['units']} lr={cfg['lr']} dropout={cfg['dropout']}")
-        model = build_keras_model(input_dim, units=cfg['units'], lr=cfg['lr'], dropout=cfg['dropout'])
-        es = tf.keras.callbacks.EarlyStopping(monitor='loss', patience=8, restore_best_weights=True)
-        model.fit(X_train_scaled, y_train, epochs=epochs, batch_size=32, callbacks=[es], verbose=2)
-
-        preds = model.predict(X_test_scaled).reshape(-1)
-        # Some sklearn builds may not accept the `squared` keyword due to signature validation.
-        # Compute RMSE explicitly instead of passing `squared=False` for compatibility.
-        rmse = np.sqrt(mean_squared_error(y_test, preds))
-        print(f"Candidate RMSE on holdout: {rmse:.4f}")
-        if rmse < best_rmse:
-            best_rmse = rmse
-            best_model = model
-            best_cfg = cfg
+    # Candidate configurations, pruned by ASHA on holdout RMSE
+    configs = sample_configs(load_space(space_path), n_trials)
+    sweep = ASHASweep(configs, max_epochs=epochs, min_epochs=min_epochs, eta=eta,
+                      n_cores=n_cores, max_workers=workers)
+    best = sweep.run(X_train_scaled, y_train, X_test_scaled, y_test)
+    print(sweep.report())
+    best_model = sweep.load_best()
+    best_rmse, best_cfg = best['rmse'], best['config']
 
     print(f"Best RMSE: {best_rmse:.4f} with cfg: {best_cfg}")
 
@@ -157,6 +127,13 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('--db-path', type=str, default=os.path.join('.dart_tool','sqflite_common_ffi','databases','app.db'))
     parser.add_argument('--out-dir', type=str, default=os.path.join('assets','models'))
-    parser.add_argument('--epochs', type=int, default=100)
+    parser.add_argument('--epochs', type=int, default=100, help='Epochs for trials that reach the top rung')
+    parser.add_argument('--trials', type=int, default=DEFAULT_TRIALS, help='Configurations sampled from the space')
+    parser.add_argument('--workers', type=int, default=None, help='Trial processes (default: one per core)')
+    parser.add_argument('--cores', type=int, default=None, help='CPU cores shared by the workers')
+    parser.add_argument('--space', type=str, default=None, help='JSON file overriding the candidate space')
+    parser.add_argument('--min-epochs', type=int, default=DEFAULT_MIN_EPOCHS, help='Epochs of the first rung')
+    parser.add_argument('--eta', type=int, default=DEFAULT_ETA, help='Rung reduction factor')
     args = parser.parse_args()
-    main(args.db_path, args.out_dir, args.epochs)
+    main(args.db_path, args.out_dir, args.epochs, n_trials=args.trials, workers=args.workers,
+         n_cores=args.cores, space_path=args.space, min_epochs=args.min_epochs, eta=args.eta)
@@ -0,0 +1,155 @@
+"""
+Deadline planning for train_models(time_budget=...) and run_complete_analysis(time_budget=...).
+
+Every training run appends per-family timings (rows, features, CV fits, wall seconds, CV
+RMSE) to training_timings.json in the cache directory. With a time budget:
+
+ - each family's cost is estimated as expected CV fits x seconds per fit. Seconds per fit
+   come from its past timings, rescaled to the current row/feature counts with the
+   family's complexity exponent in n. Families never timed here fall back to PRIORS;
+ - each family's expected value is how close its last CV RMSE came to the best family's
+   (1.0 = the best; DEFAULT_VALUE if never scored);
+ - families are taken in order of value per second. A family whose full search fits in
+   the remaining budget runs unchanged. One that does not is shrunk to a bayes search with
+   the fits that are left, or skipped if not even MIN_TRIALS configurations fit;
+ - the budget is counted in CPU seconds (wall seconds x cores), since the scheduler runs
+   families concurrently. The searches also get a wall-clock deadline and stop proposing
+   configurations once it has passed (see model_search.py).
+
+At least one family always runs, so the pipeline ends with a valid best model.
+"""
+import json
+import os
+import time
+
+import numpy as np
+
+from model_search import DEFAULT_FIT_BUDGET, expected_fits
+
+TIMINGS_FILE = 'training_timings.json'
+# Timings kept per family
+MAX_RECORDS = 20
+REFERENCE_ROWS = 1000
+REFERENCE_FEATURES = 50
+# family: (seconds per CV fit at REFERENCE_ROWS x REFERENCE_FEATURES, exponent in rows)
+PRIORS = {
+    'Ridge Regression': (0.005, 1.0),
+    'Lasso Regression': (0.02, 1.0),
+    'ElasticNet': (0.02, 1.0),
+    'Random Forest': (0.6, 1.1),
+    'Extra Trees': (0.3, 1.1),
+    'Gradient Boosting': (1.5, 1.0),
+    'SVR': (0.05, 2.0),
+    'MLP Regressor': (1.0, 1.0),
+    'Kernel Ridge': (0.05, 2.5),
+    'XGBoost': (0.5, 1.0),
+    'LightGBM': (0.3, 1.0),
+    'Gaussian Process': (0.1, 3.0),
+    'SVR (Nystroem)': (0.05, 1.0),
+    'Kernel Ridge (Nystroem)': (0.03, 1.0),
+}
+DEFAULT_PRIOR = (0.5, 1.0)
+DEFAULT_VALUE = 0.5
+MIN_TRIALS = 2
+# Share of the pipeline budget kept back for evaluation, forecasting and export
+FINISH_RESERVE = 0.15
+
+
+class TimingHistory:
+    """Per-family training timings persisted as JSON"""
+
+    def __init__(self, path):
+        self.path = path
+        self.records = {}
+        try:
+            with open(path, 'r', encoding='utf-8') as fh:
+                self.records = json.load(fh)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Ignoring unreadable timing history {path} ({e})")
+
+    def record(self, family, rows, features, n_fits, seconds, cv_rmse=None):
+        entries = self.records.setdefault(family, [])
+        entries.append({'rows': int(rows), 'features': int(features), 'n_fits': int(n_fits),
+                        'seconds': float(seconds), 'cv_rmse': None if cv_rmse is None else float(cv_rmse),
+                        'at': time.time()})
+        del entries[:-MAX_RECORDS]
+
+    def save(self):
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            tmp = f"{self.path}.tmp"
+            with open(tmp, 'w', encoding='utf-8') as fh:
+                json.dump(self.records, fh, indent=2)
+            os.replace(tmp, self.path)
+        except Exception as e:
+            print(f"Failed to write timing history (non-critical): {e}")
+
+    def seconds_per_fit(self, family, rows, features):
+        _, exponent = PRIORS.get(family, DEFAULT_PRIOR)
+        timed = [r for r in self.records.get(family, []) if r['n_fits'] > 0 and r['rows'] > 0]
+        if timed:
+            return float(np.median([r['seconds'] / r['n_fits'] * (rows / r['rows']) ** exponent
+                                    * features / max(r['features'], 1) for r in timed]))
+        prior, _ = PRIORS.get(family, DEFAULT_PRIOR)
+        return prior * (rows / REFERENCE_ROWS) ** exponent * features / REFERENCE_FEATURES
+
+    def value(self, family):
+        latest = {f: next((r['cv_rmse'] for r in reversed(entries) if r.get('cv_rmse')), None)
+                  for f, entries in self.records.items()}
+        scored = [v for v in latest.values() if v]
+        if not latest.get(family) or not scored:
+            return DEFAULT_VALUE
+        return min(scored) / latest[family]
+
+
+def plan_training(families, history, rows, features, time_budget, n_cores=1, n_splits=5,
+                  fit_budget=DEFAULT_FIT_BUDGET, must_run=True):
+    """Decide per family whether to run it fully, shrunk or not at all within time_budget.
+
+    `families` maps name -> (params, mode). Returns a list of plan entries (dicts with
+    name, action 'full'|'shrunk'|'skipped', mode, fit_budget, est_seconds, value), in
+    order of value per second.
+    """
+    capacity = time_budget * n_cores
+    entries = []
+    for name, (params, mode) in families.items():
+        per_fit = history.seconds_per_fit(name, rows, features)
+        fits = expected_fits(params, mode, fit_budget, n_splits)
+        entries.append({'name': name, 'mode': mode, 'fit_budget': fit_budget, 'per_fit': per_fit,
+                        'est_seconds': fits * per_fit, 'value': history.value(name)})
+    entries.sort(key=lambda e: e['value'] / max(e['est_seconds'], 1e-6), reverse=True)
+
+    remaining = capacity
+    for entry in entries:
+        min_cost = MIN_TRIALS * n_splits * entry['per_fit']
+        if entry['est_seconds'] <= remaining:
+            entry['action'] = 'full'
+        elif min_cost <= remaining:
+            # Shrink to a bayes search over the same grid with the fits that still fit
+            fits = int(remaining / entry['per_fit']) // n_splits * n_splits
+            entry.update(action='shrunk', mode='bayes', fit_budget=fits, est_seconds=fits * entry['per_fit'])
+        else:
+            entry.update(action='skipped', est_seconds=0.0)
+            continue
+        remaining -= entry['est_seconds']
+
+    if must_run and entries and all(e['action'] == 'skipped' for e in entries):
+        # Always end up with a model: the cheapest family with the smallest search
+        cheapest = min(entries, key=lambda e: e['per_fit'])
+        cheapest.update(action='shrunk', mode='bayes', fit_budget=MIN_TRIALS * n_splits,
+                        est_seconds=MIN_TRIALS * n_splits * cheapest['per_fit'])
+    for entry in entries:
+        entry['est_seconds'] /= n_cores
+    return entries
+
+
+def format_plan(entries):
+    lines = [f"{'family':<20} {'action':<8} {'mode':<8} {'est s':>8} {'actual s':>9} {'value':>6}  note"]
+    for e in entries:
+        actual = e.get('actual_seconds')
+        note = 'stopped at deadline' if e.get('truncated') else ''
+        lines.append(f"{e['name']:<20} {e['action']:<8} {e['mode']:<8} {e['est_seconds']:>8.1f} "
+                     f"{'' if actual is None else f'{actual:.1f}':>9} {e['value']:>6.2f}  {note}")
+    return '\n'.join(lines)
@@ -0,0 +1,117 @@
+"""
+CPU scheduler for model training jobs.
+
+Running each family's search with n_jobs=-1 around estimators that are themselves
+multi-threaded (XGBoost/LightGBM n_jobs=-1, forests, BLAS inside SVR/KernelRidge)
+oversubscribes the machine: every search worker spawns a full set of inner threads. The
+scheduler instead splits an explicit core budget:
+
+ - one persistent joblib worker pool runs the jobs (model families) concurrently,
+   longest first, so the pool is reused across families instead of respawned per search;
+ - each job gets `threads_per_job` cores. Estimator thread parameters (n_jobs, nthread)
+   are pinned to it and BLAS/OpenMP pools are capped with threadpoolctl inside the worker;
+ - per-job wall and CPU time are recorded. Utilization is CPU seconds used divided by
+   wall seconds times the core budget.
+
+The budget defaults to os.cpu_count() and can be set with the SALES_ML_CORES env var.
+"""
+import os
+import time
+
+from joblib import Parallel, delayed
+from threadpoolctl import threadpool_limits
+
+CORES_ENV = 'SALES_ML_CORES'
+_THREAD_PARAMS = ('n_jobs', 'nthread', 'num_threads', 'thread_count')
+
+
+def core_budget(n_cores=None):
+    """Cores the scheduler may use: explicit value, then $SALES_ML_CORES, then all CPUs"""
+    if n_cores:
+        return max(1, int(n_cores))
+    env = os.environ.get(CORES_ENV)
+    if env:
+        return max(1, int(env))
+    return os.cpu_count() or 1
+
+
+def pin_threads(estimator, n_threads):
+    """Set the thread-count parameters of `estimator` (and nested estimators) to n_threads"""
+    params = estimator.get_params()
+    updates = {k: n_threads for k in params if k.rsplit('__', 1)[-1] in _THREAD_PARAMS}
+    if updates:
+        estimator.set_params(**updates)
+    return estimator
+
+
+def _run_job(fn, kwargs, n_threads):
+    with threadpool_limits(limits=n_threads):
+        cpu_start, wall_start = time.process_time(), time.perf_counter()
+        result = fn(n_threads=n_threads, **kwargs)
+        return result, time.process_time() - cpu_start, time.perf_counter() - wall_start
+
+
+class TrainingScheduler:
+    """Runs independent jobs on a fixed core budget with one reusable worker pool.
+
+        with TrainingScheduler(n_cores=16) as scheduler:
+            for name, result in scheduler.run(jobs):
+                ...
+
+    A job is (name, fn, kwargs, cost): fn is called as fn(n_threads=..., **kwargs) in a
+    worker and must be picklable (a module-level function). `cost` orders submission so
+    the longest jobs start first.
+    """
+
+    def __init__(self, n_cores=None, max_workers=None):
+        self.n_cores = core_budget(n_cores)
+        self.max_workers = max_workers
+        self.stats = None
+        self._pool = None
+        self._workers = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if self._pool is not None:
+            self._pool.__exit__(*exc)
+            self._pool = None
+        return False
+
+    def _get_pool(self, n_jobs):
+        workers = max(1, min(self.n_cores, n_jobs, self.max_workers or self.n_cores))
+        if self._pool is None or self._workers != workers:
+            if self._pool is not None:
+                self._pool.__exit__(None, None, None)
+            # return_as='generator' hands results back while later jobs still run
+            self._pool = Parallel(n_jobs=workers, backend='loky', return_as='generator')
+            self._pool.__enter__()
+            self._workers = workers
+        return self._pool
+
+    def run(self, jobs):
+        """Run `jobs` and yield (name, result) in order of decreasing cost"""
+        jobs = sorted(jobs, key=lambda job: job[3], reverse=True)
+        if not jobs:
+            return
+        pool = self._get_pool(len(jobs))
+        threads = max(1, self.n_cores // self._workers)
+        self.stats = {'cores': self.n_cores, 'workers': self._workers, 'threads_per_job': threads, 'jobs': {}}
+        start = time.perf_counter()
+        results = pool(delayed(_run_job)(fn, kwargs, threads) for _, fn, kwargs, _ in jobs)
+        for (name, _, _, _), (result, cpu, wall) in zip(jobs, results):
+            self.stats['jobs'][name] = {'cpu_seconds': cpu, 'wall_seconds': wall}
+            yield name, result
+        wall = time.perf_counter() - start
+        cpu = sum(j['cpu_seconds'] for j in self.stats['jobs'].values())
+        self.stats.update({'wall_seconds': wall, 'cpu_seconds': cpu,
+                           'utilization': cpu / (wall * self.n_cores) if wall > 0 else 0.0})
+
+    def report(self):
+        if not self.stats or 'utilization' not in self.stats:
+            return "No training jobs recorded"
+        s = self.stats
+        return (f"{len(s['jobs'])} jobs on {s['workers']} worker(s) x {s['threads_per_job']} thread(s) "
+                f"({s['cores']} cores): {s['wall_seconds']:.1f}s wall, {s['cpu_seconds']:.1f} CPU-s, "
+                f"utilization {s['utilization']:.0%}")
@@ -0,0 +1,67 @@
+"""
+Warm-start updates of already fitted tree models for nightly refits.
+
+Instead of re-searching and refitting a family from scratch when a few days land:
+ - Random Forest / Extra Trees (bagging) add `extra_trees` trees fitted on the most recent
+   `recent_days` training rows (warm_start=True keeps the existing trees);
+ - Gradient Boosting / XGBoost / LightGBM continue boosting from the fitted ensemble for
+   `extra_rounds` more rounds on the full, updated training set.
+The caller gates the result on holdout RMSE and falls back to a full refit when the update
+is worse than the model it started from (see SalesMLAnalyzer.update_models).
+"""
+import copy
+
+from sklearn.base import clone
+from sklearn.ensemble import (ExtraTreesRegressor, GradientBoostingRegressor, RandomForestRegressor)
+
+DEFAULT_EXTRA_TREES = 50
+DEFAULT_EXTRA_ROUNDS = 50
+DEFAULT_RECENT_DAYS = 90
+# Search modes recorded for an update_models result (kept warm update, or full refit)
+WARM_MODES = ('warm_start', 'full_refit')
+
+
+def warm_kind(model):
+    """'bagging', 'sklearn_boosting', 'xgboost', 'lightgbm' or None if not warm-startable"""
+    if isinstance(model, (RandomForestRegressor, ExtraTreesRegressor)):
+        return 'bagging'
+    if isinstance(model, GradientBoostingRegressor):
+        return 'sklearn_boosting'
+    module = type(model).__module__
+    if module.startswith('xgboost'):
+        return 'xgboost'
+    if module.startswith('lightgbm'):
+        return 'lightgbm'
+    return None
+
+
+def _tail(data, n):
+    return data.iloc[-n:] if hasattr(data, 'iloc') else data[-n:]
+
+
+def warm_update(model, X, y, extra_trees=DEFAULT_EXTRA_TREES, extra_rounds=DEFAULT_EXTRA_ROUNDS,
+                recent_days=DEFAULT_RECENT_DAYS):
+    """Return an updated copy of a fitted tree model (the original is left untouched)"""
+    kind = warm_kind(model)
+    if kind == 'bagging':
+        updated = copy.deepcopy(model)
+        updated.set_params(warm_start=True, n_estimators=len(updated.estimators_) + extra_trees)
+        updated.fit(_tail(X, recent_days), _tail(y, recent_days))
+        return updated.set_params(warm_start=False)
+    if kind == 'sklearn_boosting':
+        updated = copy.deepcopy(model)
+        updated.set_params(warm_start=True, n_estimators=updated.n_estimators_ + extra_rounds)
+        updated.fit(X, y)
+        return updated.set_params(warm_start=False)
+    if kind == 'xgboost':
+        booster = model.get_booster()
+        total = booster.num_boosted_rounds() + extra_rounds
+        updated = clone(model).set_params(n_estimators=extra_rounds)
+        updated.fit(X, y, xgb_model=booster)
+        return updated.set_params(n_estimators=total)
+    if kind == 'lightgbm':
+        total = model.booster_.current_iteration() + extra_rounds
+        updated = clone(model).set_params(n_estimators=extra_rounds)
+        updated.fit(X, y, init_model=model.booster_)
+        return updated.set_params(n_estimators=total)
+    raise ValueError(f"{type(model).__name__} does not support warm-start updates")
@@ -0,0 +1,89 @@
+"""
+Sliding-window sequences for the Conv1D models without materializing (N, window, F) copies.
+
+Sample i pairs the `window` feature rows before target row i with y[i], for every target
+from `window` up to N - 1 (the layout tools/run_train_export.py always used). Two ways to
+consume it:
+
+ - WindowedDataset: a strided, read-only NumPy view of all windows over one float32 copy
+   of the features (O(N*F) memory). Indexing returns views, and `batches()` copies one
+   batch at a time;
+ - WindowedDataset.tf_dataset(): a tf.data pipeline that keeps the float32 feature
+   matrix as one tensor and gathers each batch's windows on the fly, with prefetching.
+   Only the index stream is shuffled and cached, never the windows themselves.
+
+last_window() gives the single inference window used by the TFLite/Keras checks.
+"""
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+DEFAULT_WINDOW = 30
+
+
+def last_window(X, window=DEFAULT_WINDOW, dtype=np.float32):
+    """(1, window, F) batch with the most recent `window` rows of X"""
+    X = np.asarray(X)
+    if len(X) < window:
+        raise ValueError(f"Need at least {window} rows to build a window, got {len(X)}")
+    return np.ascontiguousarray(X[-window:], dtype=dtype)[np.newaxis]
+
+
+class WindowedDataset:
+    """All (window -> next target) samples of a feature matrix, as zero-copy views"""
+
+    def __init__(self, X, y, window=DEFAULT_WINDOW, dtype=np.float32):
+        self.X = np.ascontiguousarray(X, dtype=dtype)
+        self.y = np.asarray(y, dtype=dtype)
+        self.window = window
+        if len(self.X) != len(self.y):
+            raise ValueError("X and y must have the same number of rows")
+        # (N - window + 1, F, window) view -> (samples, window, F); the last one has no target
+        self.windows = np.moveaxis(sliding_window_view(self.X, window, axis=0), -1, 1)[:-1]
+        self.targets = self.y[window:]
+
+    @property
+    def n_features(self):
+        return self.X.shape[1]
+
+    @property
+    def shape(self):
+        return (len(self), self.window, self.n_features)
+
+    def __len__(self):
+        return max(len(self.X) - self.window, 0)
+
+    def __getitem__(self, idx):
+        return self.windows[idx], self.targets[idx]
+
+    def split(self, fraction):
+        """Sample index where the first `fraction` of the samples ends (train/validation split)"""
+        return int(fraction * len(self))
+
+    def batches(self, batch_size=32, start=0, stop=None, shuffle=False, seed=42):
+        """Yield (X_batch, y_batch) for samples [start, stop); only one batch is copied at a time"""
+        order = np.arange(start, len(self) if stop is None else stop)
+        if shuffle:
+            np.random.default_rng(seed).shuffle(order)
+        for i in range(0, len(order), batch_size):
+            idx = order[i:i + batch_size]
+            yield self.windows[idx], self.targets[idx]
+
+    def tf_dataset(self, batch_size=32, start=0, stop=None, shuffle=False, seed=42):
+        """tf.data pipeline over samples [start, stop) that builds float32 windows per batch"""
+        import tensorflow as tf
+
+        stop = len(self) if stop is None else stop
+        features = tf.constant(self.X)
+        targets = tf.constant(self.targets)
+        offsets = tf.range(self.window, dtype=tf.int64)
+
+        def gather(idx):
+            # Window of sample i is rows i .. i + window - 1, target is targets[i]
+            return tf.gather(features, idx[:, tf.newaxis] + offsets[tf.newaxis, :]), tf.gather(targets, idx)
+
+        ds = tf.data.Dataset.range(start, stop).cache()
+        if shuffle:
+            ds = ds.shuffle(stop - start, seed=seed, reshuffle_each_iteration=True)
+        return (ds.batch(batch_size)
+                .map(gather, num_parallel_calls=tf.data.AUTOTUNE)
+                .prefetch(tf.data.AUTOTUNE))